@@ -18,24 +18,16 @@ try:
 except ImportError as e:
     print(f"❌ SDK import failed: {e}")
     print("💡 Using mock data for demonstration")
-    # Mock implementations for demo
+    # Serve the SDK's sample records for demo (data_sources needs only the stdlib)
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zra_sdk'))
+    from api.data_sources import InMemoryDataSource
+    sample_data = InMemoryDataSource()
+
     def verify_taxpayer(tpin):
-        taxpayers = {
-            '123456789': {'name': 'John Banda', 'business_name': 'Banda Enterprises', 'status': 'Active', 'email': 'john.banda@business.co.zm', 'phone': '+260 97 123 4567', 'registration_date': '2022-05-15', 'tax_center': 'Lusaka Central'},
-            '444555666': {'name': 'Ebenezer Kaluba', 'business_name': 'Kaluba Holdings', 'status': 'Suspended', 'email': 'ekaluba@holdings.co.zm', 'phone': '+260 96 654 3210', 'registration_date': '2021-11-20', 'tax_center': 'Ndola'},
-            '111222333': {'name': 'Pollard Samba', 'business_name': 'Samba Traders', 'status': 'Active', 'email': 'pollard@sambatraders.co.zm', 'phone': '+260 95 789 1234', 'registration_date': '2023-02-10', 'tax_center': 'Kitwe'},
-            '777888999': {'name': 'Saviour Silwamba', 'business_name': 'Silwamba Industries', 'status': 'Active', 'email': 'saviour@silwamba.co.zm', 'phone': '+260 97 456 7890', 'registration_date': '2020-08-05', 'tax_center': 'Livingstone'}
-        }
-        return type('Taxpayer', (), taxpayers.get(tpin, taxpayers['123456789']))()
+        return type('Taxpayer', (), sample_data.get(tpin) or sample_data.get('123456789'))()
     
     def check_compliance(tpin):
-        compliance_data = {
-            '123456789': {'compliance_status': 'Compliant', 'compliance_score': 95, 'risk_level': 'Low', 'outstanding_returns': 0, 'outstanding_payments': 0, 'compliance_issues': []},
-            '444555666': {'compliance_status': 'Non-Compliant', 'compliance_score': 35, 'risk_level': 'High', 'outstanding_returns': 3, 'outstanding_payments': 15000, 'compliance_issues': ['Late VAT returns', 'Unpaid income tax', 'Missing payroll filings']},
-            '111222333': {'compliance_status': 'Mostly Compliant', 'compliance_score': 78, 'risk_level': 'Medium', 'outstanding_returns': 1, 'outstanding_payments': 2500, 'compliance_issues': ['Late Q3 VAT return']},
-            '777888999': {'compliance_status': 'Compliant', 'compliance_score': 92, 'risk_level': 'Low', 'outstanding_returns': 0, 'outstanding_payments': 0, 'compliance_issues': []}
-        }
-        return compliance_data.get(tpin, compliance_data['123456789'])
+        return sample_data.get_compliance(tpin) or sample_data.get_compliance('123456789')
     
     def calculate_tax(income, tax_type='income'):
         rates = {'income': 0.3, 'vat': 0.16, 'corporate': 0.35}
@@ -48,6 +40,17 @@ except ImportError as e:
             'tax_breakdown': {'base_tax': tax_amount}
         })()
 
+try:
+    from core.config import ZRAConfig
+    from core.taxpayer import ComplianceEngine
+    # Materialized compliance view, kept current from the local event log
+    compliance_engine = ComplianceEngine()
+    if ZRAConfig.COMPLIANCE_EVENTS_FILE:
+        compliance_engine.follow(ZRAConfig.COMPLIANCE_EVENTS_FILE)
+except ImportError as e:
+    print(f"💡 Compliance event view unavailable: {e}")
+    compliance_engine = None
+
 app = Flask(__name__)
 
 @app.route('/')
@@ -1081,7 +1084,9 @@ def check_compliance_route():
     tpin = data.get('tpin', '123456789')
     
     try:
-        compliance = check_compliance(tpin)
+        compliance = compliance_engine.get_summary(tpin) if compliance_engine else None
+        if compliance is None:
+            compliance = check_compliance(tpin)
         return jsonify({
             'success': True,
             'compliance_data': compliance
@@ -0,0 +1,245 @@
+"""
+Admission control for the web app.
+
+Every managed route has a concurrency limit, and all routes share one
+capacity. Requests that cannot run straight away wait in a bounded queue
+ordered by priority class, so tax return submissions are served before
+lookups. Requests that would wait too long are rejected at once with a
+retry hint instead of tying up a worker.
+
+Route limits adapt to measured latency: a route whose latency rises above
+its target has its limit cut, and a saturated route that meets its target
+gets one more slot. Around the VAT filing due dates (VATVerifier.FILING_RULES)
+the service runs in surge mode, where lower priority classes may only use
+part of the capacity so submissions always have headroom.
+
+Limits hold within one process. Under gunicorn they only take effect with
+threaded workers (--worker-class gthread --threads N), since a sync worker
+runs one request at a time and never has anything to limit or queue.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from core.tax_verification.vat_verifier import VATVerifier
+
+SURGE_DAYS_BEFORE_DUE = 2
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """Admission rules for one class of routes"""
+    priority: int               # lower is more important
+    max_concurrent: int         # per route
+    min_concurrent: int = 1
+    max_queue: int = 64         # waiting requests per route
+    target_latency: float = 1.0  # seconds
+    surge_share: float = 1.0    # capacity usable during surge mode
+
+
+DEFAULT_POLICIES = {
+    "submission": RoutePolicy(priority=0, max_concurrent=32, max_queue=256, target_latency=2.0),
+    "lookup": RoutePolicy(priority=1, max_concurrent=16, max_queue=64, target_latency=0.5, surge_share=0.6),
+    "bulk": RoutePolicy(priority=2, max_concurrent=2, max_queue=4, target_latency=30.0, surge_share=0.25),
+}
+
+
+def is_surge_day(day: date, due_days: Iterable[int] = None, days_before: int = SURGE_DAYS_BEFORE_DUE) -> bool:
+    """Whether a day falls on or shortly before a VAT filing due date."""
+    due_days = VATVerifier.FILING_RULES.values() if due_days is None else due_days
+    return any(0 <= due - day.day <= days_before for due in due_days)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed."""
+
+    def __init__(self, route: str, retry_after: int):
+        self.route = route
+        self.retry_after = retry_after
+        super().__init__(f"{route} is overloaded, retry after {retry_after} seconds")
+
+
+class _RouteState:
+    __slots__ = ("name", "policy", "limit", "active", "queued", "latency", "last_decrease")
+
+    def __init__(self, name: str, policy: RoutePolicy):
+        self.name = name
+        self.policy = policy
+        self.limit = policy.max_concurrent
+        self.active = 0
+        self.queued = 0
+        self.latency = 0.0  # moving average, seconds
+        self.last_decrease = 0.0
+
+
+class _Waiter:
+    __slots__ = ("route", "order", "granted", "event")
+
+    def __init__(self, route: _RouteState, order: int):
+        self.route = route
+        self.order = order
+        self.granted = False
+        self.event = threading.Event()
+
+
+class Ticket:
+    """An admitted request; pass it back to release()."""
+    __slots__ = ("route", "started")
+
+    def __init__(self, route: _RouteState):
+        self.route = route
+        self.started = time.monotonic()
+
+
+class AdmissionController:
+    """Priority admission with per-route, latency-driven concurrency limits."""
+
+    def __init__(
+        self,
+        routes: Dict[str, str],
+        capacity: int = 64,
+        policies: Optional[Dict[str, RoutePolicy]] = None,
+        queue_timeout: float = 2.0,
+        smoothing: float = 0.2
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            routes: Route name -> policy class name; a route is a Flask
+                endpoint, or "endpoint:METHOD" for one method of it. Other
+                routes are not managed
+            capacity: Requests allowed to run at once across all routes
+            policies: Policy class name -> RoutePolicy, defaults to
+                DEFAULT_POLICIES
+            queue_timeout: Longest a request may wait for a slot, in seconds
+            smoothing: Weight of the newest sample in the latency average
+        """
+        policies = policies or DEFAULT_POLICIES
+        self.capacity = capacity
+        self.queue_timeout = queue_timeout
+        self.smoothing = smoothing
+        self._routes = {name: _RouteState(name, policies[kind]) for name, kind in routes.items()}
+        self._active = 0
+        self._waiters: List[_Waiter] = []
+        self._order = 0
+        self._lock = threading.Lock()
+        self._surge_day: Optional[date] = None
+        self._surge = False
+
+    def manages(self, route: Optional[str]) -> bool:
+        return route in self._routes
+
+    def route_for(self, endpoint: Optional[str], method: str) -> Optional[str]:
+        """The managed route of a request: "endpoint:METHOD" if listed, else the endpoint (None if neither)."""
+        for route in (f"{endpoint}:{method}", endpoint):
+            if route in self._routes:
+                return route
+        return None
+
+    def surge_active(self) -> bool:
+        """Whether surge mode is on today."""
+        today = date.today()
+        if today != self._surge_day:
+            self._surge_day, self._surge = today, is_surge_day(today)
+        return self._surge
+
+    def acquire(self, route: str) -> Ticket:
+        """
+        Admit a request, waiting in the route's queue if needed.
+
+        Raises:
+            Overloaded: If the queue is full, the expected wait is too long,
+                or no slot freed up within the queue timeout
+        """
+        with self._lock:
+            state = self._routes[route]
+            if self._can_run(state):
+                state.active += 1
+                self._active += 1
+                return Ticket(state)
+
+            wait = self._expected_wait(state)
+            if state.queued >= state.policy.max_queue or wait > self.queue_timeout:
+                raise Overloaded(route, self._retry_after(wait))
+            self._order += 1
+            waiter = _Waiter(state, self._order)
+            self._waiters.append(waiter)
+            state.queued += 1
+
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                state.queued -= 1
+                raise Overloaded(route, self._retry_after(self._expected_wait(state)))
+        return Ticket(state)
+
+    def release(self, ticket: Ticket) -> None:
+        """Release a request's slot and record its latency."""
+        latency = time.monotonic() - ticket.started
+        with self._lock:
+            state = ticket.route
+            saturated = state.active >= state.limit
+            state.active -= 1
+            self._active -= 1
+            self._adapt(state, latency, saturated)
+            self._dispatch()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Current limits, load and latency per route."""
+        with self._lock:
+            return {
+                name: {
+                    "limit": state.limit,
+                    "active": state.active,
+                    "queued": state.queued,
+                    "latency_ms": round(state.latency * 1000, 1),
+                }
+                for name, state in self._routes.items()
+            }
+
+    def _can_run(self, state: _RouteState) -> bool:
+        capacity = self.capacity
+        if self.surge_active():
+            capacity = max(1, int(capacity * state.policy.surge_share))
+        return self._active < capacity and state.active < state.limit
+
+    def _dispatch(self) -> None:
+        """Hand freed slots to waiters, most important (then oldest) first."""
+        for waiter in sorted(self._waiters, key=lambda w: (w.route.policy.priority, w.order)):
+            if self._active >= self.capacity:
+                break
+            state = waiter.route
+            if self._can_run(state):
+                self._waiters.remove(waiter)
+                state.queued -= 1
+                state.active += 1
+                self._active += 1
+                waiter.granted = True
+                waiter.event.set()
+
+    def _adapt(self, state: _RouteState, latency: float, saturated: bool) -> None:
+        if state.latency == 0.0:
+            state.latency = latency
+        else:
+            state.latency += self.smoothing * (latency - state.latency)
+
+        policy = state.policy
+        now = time.monotonic()
+        if state.latency > policy.target_latency:
+            # Cut at most once per latency period so one slow spell is not punished repeatedly
+            if now - state.last_decrease > state.latency:
+                state.limit = max(policy.min_concurrent, int(state.limit * 0.8))
+                state.last_decrease = now
+        elif saturated and state.limit < policy.max_concurrent:
+            state.limit += 1
+
+    def _expected_wait(self, state: _RouteState) -> float:
+        return (state.queued + 1) * state.latency / max(state.limit, 1)
+
+    def _retry_after(self, wait: float) -> int:
+        return min(60, max(1, math.ceil(wait)))
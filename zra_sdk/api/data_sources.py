@@ -0,0 +1,483 @@
+"""
+Pluggable sources of taxpayer and compliance records.
+
+Every backend implements the same DataSource interface, built around a bulk
+get_many(tpins) lookup, so callers can batch their lookups whatever the
+backend:
+
+- InMemoryDataSource: dicts in memory, by default the sample records below
+- SQLiteDataSource: a local SQLite database
+- SnapshotDataSource: a read-only snapshot file, memory-mapped and binary
+  searched, for fast startup and sharing pages across worker processes
+- HTTPDataSource: the ZRA API through ZRAClient
+
+Records are plain dicts in the format of the sample data. Lookups return
+only the TPINs that were found.
+"""
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+Record = Dict[str, Any]
+
+# Sample taxpayers served by InMemoryDataSource
+SAMPLE_TAXPAYERS = {
+    "123456789": {
+        "tpin": "123456789",
+        "name": "John Banda",
+        "business_name": "Banda Enterprises Ltd",
+        "email": "john.banda@bandaenterprises.co.zm",
+        "phone": "+260977123456",
+        "status": "Active",
+        "registration_date": "2022-01-15",
+        "last_filing_date": "2024-01-10",
+        "tax_center": "Lusaka"
+    },
+    "111222333": {
+        "tpin": "111222333",
+        "name": "Pollard Samba",
+        "business_name": "Samba Tech Solutions",
+        "email": "pollard.samba@sambatech.co.zm",
+        "phone": "+260966789123",
+        "status": "Active",
+        "registration_date": "2021-03-20",
+        "last_filing_date": "2024-02-15",
+        "tax_center": "Ndola"
+    },
+    "444555666": {
+        "tpin": "444555666",
+        "name": "Ebenezer Kaluba",
+        "business_name": "Kaluba Holdings Limited",
+        "email": "e.kaluba@kalubaholdings.co.zm",
+        "phone": "+260955456789",
+        "status": "Active",
+        "registration_date": "2020-11-08",
+        "last_filing_date": "2024-03-01",
+        "tax_center": "Kitwe"
+    },
+    "777888999": {
+        "tpin": "777888999",
+        "name": "Saviour Silwamba",
+        "business_name": "Silwamba Legal Practitioners",
+        "email": "saviour@silwambalaw.co.zm",
+        "phone": "+260978321654",
+        "status": "Active",
+        "registration_date": "2019-07-12",
+        "last_filing_date": "2024-01-25",
+        "tax_center": "Lusaka"
+    },
+    "222333444": {
+        "tpin": "222333444",
+        "name": "Pethias Kasempa",
+        "business_name": "Kasempa Mining Supplies",
+        "email": "p.kasempa@kasempamining.co.zm",
+        "phone": "+260967852741",
+        "status": "Active",
+        "registration_date": "2023-05-30",
+        "last_filing_date": "2024-02-28",
+        "tax_center": "Chingola"
+    },
+    "555666777": {
+        "tpin": "555666777",
+        "name": "Lawrence Thor",
+        "business_name": "ThorLabs Innovations",
+        "email": "lawrence.thor@thorlabs.co.zm",
+        "phone": "+260965123789",
+        "status": "Active",
+        "registration_date": "2022-09-14",
+        "last_filing_date": "2024-03-10",
+        "tax_center": "Livingstone"
+    }
+}
+
+SAMPLE_COMPLIANCE = {
+    "123456789": {
+        "compliance_status": "Fully Compliant",
+        "compliance_score": 95,
+        "outstanding_returns": 0,
+        "outstanding_payments": 0.0,
+        "last_audit_date": "2023-11-15",
+        "next_audit_due": "2024-11-15",
+        "risk_level": "Low",
+        "compliance_issues": [],
+        "penalties": 0.0
+    },
+    "111222333": {
+        "compliance_status": "Mostly Compliant",
+        "compliance_score": 78,
+        "outstanding_returns": 1,
+        "outstanding_payments": 1500.0,
+        "last_audit_date": "2023-09-20",
+        "next_audit_due": "2024-09-20",
+        "risk_level": "Medium",
+        "compliance_issues": ["Q4 2023 VAT Return overdue"],
+        "penalties": 250.0
+    },
+    "444555666": {
+        "compliance_status": "Non-Compliant",
+        "compliance_score": 45,
+        "outstanding_returns": 3,
+        "outstanding_payments": 12500.0,
+        "last_audit_date": "2022-12-10",
+        "next_audit_due": "2024-06-10",
+        "risk_level": "High",
+        "compliance_issues": [
+            "Q3 2023 Income Tax overdue",
+            "Q4 2023 VAT Return overdue", 
+            "Q1 2024 PAYE Return overdue"
+        ],
+        "penalties": 1800.0
+    },
+    "777888999": {
+        "compliance_status": "Fully Compliant", 
+        "compliance_score": 98,
+        "outstanding_returns": 0,
+        "outstanding_payments": 0.0,
+        "last_audit_date": "2024-01-05",
+        "next_audit_due": "2025-01-05",
+        "risk_level": "Low",
+        "compliance_issues": [],
+        "penalties": 0.0
+    },
+    "222333444": {
+        "compliance_status": "Under Review",
+        "compliance_score": 65,
+        "outstanding_returns": 2,
+        "outstanding_payments": 7500.0,
+        "last_audit_date": "2023-08-15",
+        "next_audit_due": "2024-08-15", 
+        "risk_level": "Medium",
+        "compliance_issues": [
+            "Q4 2023 Income Tax overdue",
+            "Discrepancy in Q1 2024 filing"
+        ],
+        "penalties": 500.0
+    },
+    "555666777": {
+        "compliance_status": "Mostly Compliant",
+        "compliance_score": 82,
+        "outstanding_returns": 0,
+        "outstanding_payments": 3200.0,
+        "last_audit_date": "2023-10-22",
+        "next_audit_due": "2024-10-22",
+        "risk_level": "Low",
+        "compliance_issues": ["Outstanding VAT payment"],
+        "penalties": 150.0
+    }
+}
+
+
+class DataSource(ABC):
+    """Source of taxpayer and compliance records"""
+
+    _listeners: Tuple[Callable[[Mapping[str, Record]], None], ...] = ()
+
+    @abstractmethod
+    def get_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        """Taxpayer records of the given TPINs, keyed by TPIN (missing TPINs are left out)."""
+
+    @abstractmethod
+    def get_compliance_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        """Compliance records of the given TPINs, keyed by TPIN (missing TPINs are left out)."""
+
+    def get(self, tpin: str) -> Optional[Record]:
+        """Taxpayer record of one TPIN, None if not found."""
+        return self.get_many([tpin]).get(tpin)
+
+    def get_compliance(self, tpin: str) -> Optional[Record]:
+        """Compliance record of one TPIN, None if not found."""
+        return self.get_compliance_many([tpin]).get(tpin)
+
+    def iter_taxpayers(self) -> Iterator[Tuple[str, Record]]:
+        """
+        Every taxpayer record, as (TPIN, record).
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot list its records")
+
+    def subscribe(self, listener: Callable[[Mapping[str, Record]], None]) -> None:
+        """Call listener(taxpayers), records by TPIN, after taxpayer records are added to the source."""
+        self._listeners = self._listeners + (listener,)
+
+    def _notify(self, taxpayers: Mapping[str, Record]) -> None:
+        for listener in self._listeners:
+            listener(taxpayers)
+
+    def close(self) -> None:
+        """Release any resources held by the source."""
+
+
+def _copy(record: Record) -> Record:
+    return json.loads(json.dumps(record))
+
+
+class InMemoryDataSource(DataSource):
+    """Records held in dicts; defaults to the sample records."""
+
+    def __init__(
+        self,
+        taxpayers: Optional[Mapping[str, Record]] = None,
+        compliance: Optional[Mapping[str, Record]] = None
+    ):
+        self.taxpayers = dict(SAMPLE_TAXPAYERS if taxpayers is None else taxpayers)
+        self.compliance = dict(SAMPLE_COMPLIANCE if compliance is None else compliance)
+
+    def get_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return {tpin: _copy(self.taxpayers[tpin]) for tpin in tpins if tpin in self.taxpayers}
+
+    def get_compliance_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return {tpin: _copy(self.compliance[tpin]) for tpin in tpins if tpin in self.compliance}
+
+    def iter_taxpayers(self) -> Iterator[Tuple[str, Record]]:
+        return iter(list(self.taxpayers.items()))
+
+
+class SQLiteDataSource(DataSource):
+    """Records stored as JSON in a SQLite database."""
+
+    # Stay below SQLite's default limit on query parameters
+    BATCH_SIZE = 900
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        db = self._connection()
+        db.executescript(
+            "CREATE TABLE IF NOT EXISTS taxpayers (tpin TEXT PRIMARY KEY, record TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS compliance (tpin TEXT PRIMARY KEY, record TEXT NOT NULL);"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path)
+        return db
+
+    def load(
+        self,
+        taxpayers: Mapping[str, Record],
+        compliance: Optional[Mapping[str, Record]] = None
+    ) -> None:
+        """Insert or replace records, then pass the taxpayer records to subscribers."""
+        db = self._connection()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO taxpayers (tpin, record) VALUES (?, ?)",
+                ((tpin, json.dumps(record)) for tpin, record in taxpayers.items())
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO compliance (tpin, record) VALUES (?, ?)",
+                ((tpin, json.dumps(record)) for tpin, record in (compliance or {}).items())
+            )
+        if taxpayers:
+            self._notify(taxpayers)
+
+    def _select(self, table: str, tpins: Iterable[str]) -> Dict[str, Record]:
+        tpins = list(dict.fromkeys(tpins))
+        db = self._connection()
+        found: Dict[str, Record] = {}
+        for start in range(0, len(tpins), self.BATCH_SIZE):
+            batch = tpins[start:start + self.BATCH_SIZE]
+            rows = db.execute(
+                f"SELECT tpin, record FROM {table} WHERE tpin IN ({', '.join('?' * len(batch))})", batch
+            )
+            found.update((tpin, json.loads(record)) for tpin, record in rows)
+        return found
+
+    def get_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._select("taxpayers", tpins)
+
+    def get_compliance_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._select("compliance", tpins)
+
+    def iter_taxpayers(self) -> Iterator[Tuple[str, Record]]:
+        for tpin, record in self._connection().execute("SELECT tpin, record FROM taxpayers"):
+            yield tpin, json.loads(record)
+
+    def close(self) -> None:
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+# Snapshot layout: header, then one index entry per TPIN sorted by TPIN,
+# then the JSON records the entries point at
+_SNAPSHOT_MAGIC = b"ZRASNAP1"
+_SNAPSHOT_HEADER = struct.Struct("<8sI")
+_SNAPSHOT_ENTRY = struct.Struct("<16sQIQI")  # tpin, taxpayer offset/length, compliance offset/length
+
+
+def write_snapshot(
+    path: str,
+    taxpayers: Mapping[str, Record],
+    compliance: Optional[Mapping[str, Record]] = None
+) -> int:
+    """
+    Write records to a snapshot file for SnapshotDataSource.
+
+    Returns:
+        int: Number of TPINs written
+    """
+    compliance = compliance or {}
+    tpins = sorted(set(taxpayers) | set(compliance))
+    data_start = _SNAPSHOT_HEADER.size + _SNAPSHOT_ENTRY.size * len(tpins)
+    entries: List[bytes] = []
+    blobs: List[bytes] = []
+    offset = data_start
+    for tpin in tpins:
+        encoded_tpin = tpin.encode("ascii")
+        if len(encoded_tpin) > 16:
+            raise ValueError(f"TPIN too long for a snapshot: {tpin}")
+        located = []
+        for records in (taxpayers, compliance):
+            if tpin in records:
+                blob = json.dumps(records[tpin], separators=(",", ":")).encode("utf-8")
+                located.extend((offset, len(blob)))
+                blobs.append(blob)
+                offset += len(blob)
+            else:
+                located.extend((0, 0))
+        entries.append(_SNAPSHOT_ENTRY.pack(encoded_tpin, *located))
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as fh:
+        fh.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, len(tpins)))
+        fh.writelines(entries)
+        fh.writelines(blobs)
+    os.replace(temporary, path)
+    return len(tpins)
+
+
+class SnapshotDataSource(DataSource):
+    """Read-only records from a memory-mapped snapshot written by write_snapshot."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a ZRA snapshot file: {path}")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, tpin: str) -> Optional[tuple]:
+        key = tpin.encode("ascii", errors="replace").ljust(16, b"\0")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = _SNAPSHOT_ENTRY.unpack_from(self._map, _SNAPSHOT_HEADER.size + middle * _SNAPSHOT_ENTRY.size)
+            if entry[0] < key:
+                low = middle + 1
+            elif entry[0] > key:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def _lookup(self, tpins: Iterable[str], field: int) -> Dict[str, Record]:
+        found: Dict[str, Record] = {}
+        for tpin in tpins:
+            entry = self._entry(tpin)
+            if entry is not None and entry[field + 1]:
+                offset, length = entry[field], entry[field + 1]
+                found[tpin] = json.loads(self._map[offset:offset + length])
+        return found
+
+    def get_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._lookup(tpins, 1)
+
+    def get_compliance_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._lookup(tpins, 3)
+
+    def iter_taxpayers(self) -> Iterator[Tuple[str, Record]]:
+        for index in range(self._count):
+            tpin, offset, length, _, _ = _SNAPSHOT_ENTRY.unpack_from(
+                self._map, _SNAPSHOT_HEADER.size + index * _SNAPSHOT_ENTRY.size
+            )
+            if length:
+                yield tpin.rstrip(b"\0").decode("ascii"), json.loads(self._map[offset:offset + length])
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class HTTPDataSource(DataSource):
+    """Records from the ZRA API, fetched concurrently for bulk lookups."""
+
+    def __init__(self, client=None, max_workers: int = 8):
+        """
+        Args:
+            client: ZRAClient to use, a new one by default
+            max_workers: Concurrent requests per bulk lookup
+        """
+        try:
+            from core.client import ZRAClient
+            from core.config import ZRAConfig
+        except ImportError:
+            from zra_sdk.core.client import ZRAClient
+            from zra_sdk.core.config import ZRAConfig
+        self.client = client or ZRAClient()
+        self.verify_endpoint = ZRAConfig.VERIFY_TAXPAYER
+        self.compliance_endpoint = ZRAConfig.COMPLIANCE_STATUS
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _fetch(self, endpoint: str, tpin: str) -> Optional[Record]:
+        try:
+            return self.client.request("POST", endpoint, {"tpin": tpin})
+        except Exception as e:
+            # ZRAClient wraps the HTTP error; an unknown TPIN is not a failure
+            response = getattr(e.__context__, "response", None)
+            if getattr(response, "status_code", None) == 404:
+                return None
+            raise
+
+    def _fetch_many(self, endpoint: str, tpins: Iterable[str]) -> Dict[str, Record]:
+        tpins = list(dict.fromkeys(tpins))
+        records = self._pool.map(lambda tpin: self._fetch(endpoint, tpin), tpins)
+        return {tpin: record for tpin, record in zip(tpins, records) if record is not None}
+
+    def get_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._fetch_many(self.verify_endpoint, tpins)
+
+    def get_compliance_many(self, tpins: Iterable[str]) -> Dict[str, Record]:
+        return self._fetch_many(self.compliance_endpoint, tpins)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+DATA_SOURCES = ("memory", "sqlite", "snapshot", "http")
+
+
+def create_data_source(kind: str = "memory", path: str = "") -> DataSource:
+    """
+    Create a data source.
+
+    Args:
+        kind: One of DATA_SOURCES
+        path: Database or snapshot file, for sqlite and snapshot
+
+    Raises:
+        ValueError: If the kind is unknown or a path is required but missing
+    """
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return InMemoryDataSource()
+    if kind == "http":
+        return HTTPDataSource()
+    if kind in ("sqlite", "snapshot"):
+        if not path:
+            raise ValueError(f"The {kind} data source needs a file path")
+        return SQLiteDataSource(path) if kind == "sqlite" else SnapshotDataSource(path)
+    raise ValueError(f"Unknown data source: {kind}. Use one of: {', '.join(DATA_SOURCES)}")
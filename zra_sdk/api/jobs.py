@@ -0,0 +1,386 @@
+"""
+Background batch jobs.
+
+A submitted job is split into chunks that are stored in SQLite. Worker
+threads claim pending chunks, run them through the handler registered for
+the job type and store each chunk's results as a checkpoint, so progress
+and partial results can be read while the job runs. Chunks claimed by a
+process that stops heartbeating go back to pending, which lets a restarted
+process resume a job without redoing the chunks that already finished.
+Database errors (a locked or full disk) are logged and retried, so the
+worker and heartbeat threads outlive them.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Longest wait, in seconds, before retrying after a database error
+MAX_RETRY_DELAY = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    total_items INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    done_chunks INTEGER NOT NULL DEFAULT 0,
+    failed_chunks INTEGER NOT NULL DEFAULT 0,
+    processed_items INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    items TEXT NOT NULL,
+    results TEXT,
+    PRIMARY KEY (job_id, chunk_index)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_status ON chunks (status);
+CREATE TABLE IF NOT EXISTS workers (
+    owner TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+
+JOB_COLUMNS = (
+    "job_id", "job_type", "status", "chunk_size", "total_items", "total_chunks",
+    "done_chunks", "failed_chunks", "processed_items", "error", "created_at", "updated_at",
+)
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of chunked batch jobs with a local worker pool.
+
+    Job statuses are queued, running, done, and failed (finished, but at
+    least one chunk raised). Several processes may share one database file;
+    each claims chunks under its own owner ID.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        handlers: Dict[str, Callable[[List[Any]], List[Dict[str, Any]]]],
+        workers: int = 2,
+        chunk_size: int = 500,
+        poll_interval: float = 1.0,
+        heartbeat_timeout: float = 30.0
+    ):
+        """
+        Initialize the queue and create its tables.
+
+        Args:
+            path: SQLite database file
+            handlers: Job type -> function processing one chunk of items
+                and returning one result dict per item
+            workers: Worker threads started by start()
+            chunk_size: Default items per chunk (the checkpoint granularity)
+            poll_interval: Seconds between polls for chunks submitted by
+                other processes
+            heartbeat_timeout: Seconds without a heartbeat after which the
+                chunks of an owner are handed to other workers
+        """
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.owner = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def submit(self, job_type: str, items: Sequence[Any], chunk_size: Optional[int] = None) -> str:
+        """
+        Submit a job.
+
+        Args:
+            job_type: One of the registered handler names
+            items: JSON-serializable items to process
+            chunk_size: Items per chunk, defaults to the queue's chunk size
+
+        Returns:
+            str: The job ID
+
+        Raises:
+            ValueError: If the job type is unknown or there are no items
+        """
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}. Use one of: {', '.join(self.handlers)}")
+        if not items:
+            raise ValueError("No items to process")
+        chunk_size = max(1, int(chunk_size or self.chunk_size))
+
+        job_id = uuid.uuid4().hex
+        now = _now()
+        chunks = [
+            (job_id, index, "pending", json.dumps(list(items[start:start + chunk_size])))
+            for index, start in enumerate(range(0, len(items), chunk_size))
+        ]
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, job_type, status, chunk_size, total_items, total_chunks,"
+                " created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, job_type, chunk_size, len(items), len(chunks), now, now)
+            )
+            db.executemany(
+                "INSERT INTO chunks (job_id, chunk_index, status, items) VALUES (?, ?, ?, ?)", chunks
+            )
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the status and progress of a job.
+
+        Returns:
+            dict or None: The job row plus a progress percentage, None if unknown
+        """
+        with self._connect() as db:
+            row = db.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        finished = job["done_chunks"] + job["failed_chunks"]
+        job["progress"] = round(100.0 * finished / job["total_chunks"], 1)
+        return job
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 1000) -> Optional[Dict[str, Any]]:
+        """
+        Read the results of a job in input order, including partial results.
+
+        Results stop at the first chunk that has not finished yet, so a
+        page never has gaps; poll again from ``next_offset`` for more.
+
+        Args:
+            job_id: Job ID
+            offset: Index of the first item
+            limit: Maximum number of results
+
+        Returns:
+            dict or None: {"status", "offset", "results", "next_offset"},
+                next_offset is None once all results have been read
+        """
+        job = self.status(job_id)
+        if job is None:
+            return None
+        offset, limit = max(0, offset), max(0, limit)
+        chunk_size = job["chunk_size"]
+        end = min(offset + limit, job["total_items"])
+        first, last = offset // chunk_size, (max(end, offset + 1) - 1) // chunk_size
+
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT chunk_index, status, results FROM chunks"
+                " WHERE job_id = ? AND chunk_index BETWEEN ? AND ? ORDER BY chunk_index",
+                (job_id, first, last)
+            ).fetchall()
+
+        results: List[Dict[str, Any]] = []
+        position = offset
+        for chunk_index, status, encoded in rows:
+            if status not in ("done", "failed") or position >= end:
+                break
+            chunk_results = json.loads(encoded)
+            start = position - chunk_index * chunk_size
+            taken = chunk_results[start:start + end - position]
+            results.extend(taken)
+            position += len(taken)
+
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "offset": offset,
+            "results": results,
+            "next_offset": position if position < job["total_items"] else None,
+        }
+
+    def start(self) -> None:
+        """Start the worker threads and the heartbeat."""
+        if self._threads:
+            return
+        self._stop.clear()
+        self._heartbeat()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"zra-job-worker-{number}", daemon=True)
+            for number in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._monitor, name="zra-job-monitor", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers once their current chunks are checkpointed."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._connect() as db:
+            db.execute("DELETE FROM workers WHERE owner = ?", (self.owner,))
+
+    def _retry_delay(self, failures: int) -> float:
+        """Seconds to wait after a number of database errors in a row."""
+        return min(self.poll_interval * 2 ** (failures - 1), MAX_RETRY_DELAY)
+
+    def _monitor(self) -> None:
+        # Heartbeats keep their interval after an error, to stay within the timeout
+        while not self._stop.wait(min(self.poll_interval, self.heartbeat_timeout / 3)):
+            try:
+                self._heartbeat()
+            except Exception:
+                logger.exception("Job queue heartbeat failed")
+            self._wake.set()  # also picks up chunks submitted by other processes
+
+    def _heartbeat(self) -> None:
+        """Record that this owner is alive and release chunks of dead owners."""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO workers (owner, heartbeat) VALUES (?, ?)", (self.owner, now))
+            db.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.heartbeat_timeout,))
+            released = db.execute(
+                "UPDATE chunks SET status = 'pending', owner = NULL"
+                " WHERE status = 'running' AND owner NOT IN (SELECT owner FROM workers)"
+            ).rowcount
+        if released:
+            self._wake.set()
+
+    def _work(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                claimed = self._claim()
+            except Exception:
+                failures += 1
+                logger.exception("Could not claim a job chunk")
+                self._stop.wait(self._retry_delay(failures))
+                continue
+            failures = 0
+            if claimed is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            job_id, chunk_index, job_type, items = claimed
+            handler = self.handlers.get(job_type)
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler for job type: {job_type}")
+                results, error = handler(items), None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                results = [{"item": item, "error": error} for item in items]
+            self._store(job_id, chunk_index, results, error, len(items))
+
+    def _store(
+        self,
+        job_id: str,
+        chunk_index: int,
+        results: List[Dict[str, Any]],
+        error: Optional[str],
+        item_count: int
+    ) -> None:
+        """
+        Checkpoint a chunk, retrying on database errors. The chunk stays
+        claimed by this owner meanwhile; if the queue stops first, it goes
+        back to pending once this owner's heartbeat is gone.
+        """
+        failures = 0
+        while True:
+            try:
+                self._checkpoint(job_id, chunk_index, results, error, item_count)
+                return
+            except Exception:
+                failures += 1
+                logger.exception("Could not checkpoint chunk %s of job %s", chunk_index, job_id)
+                if self._stop.wait(self._retry_delay(failures)):
+                    return
+
+    def _claim(self):
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT chunks.rowid, chunks.job_id, chunk_index, job_type, items"
+                " FROM chunks JOIN jobs USING (job_id)"
+                " WHERE chunks.status = 'pending' ORDER BY chunks.rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            rowid, job_id, chunk_index, job_type, items = row
+            db.execute("UPDATE chunks SET status = 'running', owner = ? WHERE rowid = ?", (self.owner, rowid))
+            db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                (_now(), job_id)
+            )
+        return job_id, chunk_index, job_type, json.loads(items)
+
+    def _checkpoint(
+        self,
+        job_id: str,
+        chunk_index: int,
+        results: List[Dict[str, Any]],
+        error: Optional[str],
+        item_count: int
+    ) -> None:
+        with self._transaction() as db:
+            stored = db.execute(
+                "UPDATE chunks SET status = ?, owner = NULL, results = ?"
+                " WHERE job_id = ? AND chunk_index = ? AND status = 'running' AND owner = ?",
+                ("failed" if error else "done", json.dumps(results, default=str), job_id, chunk_index, self.owner)
+            ).rowcount
+            if not stored:
+                return  # released to another worker in the meantime
+            db.execute(
+                "UPDATE jobs SET done_chunks = done_chunks + ?, failed_chunks = failed_chunks + ?,"
+                " processed_items = processed_items + ?, error = COALESCE(error, ?), updated_at = ?"
+                " WHERE job_id = ?",
+                (0 if error else 1, 1 if error else 0, item_count, error, _now(), job_id)
+            )
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN failed_chunks > 0 THEN 'failed' ELSE 'done' END"
+                " WHERE job_id = ? AND done_chunks + failed_chunks = total_chunks",
+                (job_id,)
+            )
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
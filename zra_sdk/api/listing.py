@@ -0,0 +1,309 @@
+"""
+Filtered taxpayer listings with bitmap indexes and keyset pagination.
+
+Taxpayers are numbered in TPIN order. For every value of a categorical
+field (status, tax center, risk level) the index keeps the set of taxpayer
+numbers as a roaring-style bitmap. The numbers are split into chunks of
+65536, and each chunk is stored as a sorted array of 16-bit offsets when
+sparse, or as a 65536-bit bitset when dense. Filters on several fields
+intersect their bitmaps chunk by chunk. Compliance scores are kept as an
+array by taxpayer number and as a sorted array for range counts and
+selective ranges.
+
+Pages are keyset paginated on the TPIN: a page starts right after the last
+TPIN of the previous page, so deep pages cost no more than the first.
+"""
+import bisect
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Chunks with more members than this are stored as bitsets
+ARRAY_LIMIT = 4096
+
+# Fields that can be filtered on: field -> (record, key)
+CATEGORICAL_FIELDS = {
+    "status": ("taxpayer", "status"),
+    "tax_center": ("taxpayer", "tax_center"),
+    "risk_level": ("compliance", "risk_level"),
+}
+
+# Score ranges matching at most this share of taxpayers are read from the
+# sorted score array; wider ranges are checked chunk by chunk
+SELECTIVE_SHARE = 1 / 32
+
+
+def _value(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+
+def _dense(container: np.ndarray) -> np.ndarray:
+    """A container as 65536 booleans."""
+    if container.dtype == np.uint16:
+        dense = np.zeros(CHUNK_SIZE, dtype=bool)
+        dense[container] = True
+        return dense
+    return np.unpackbits(container, bitorder="little").view(bool)
+
+
+def _container(dense: np.ndarray) -> Optional[np.ndarray]:
+    """The compact form of 65536 booleans: sorted offsets or a bitset (None if empty)."""
+    count = int(np.count_nonzero(dense))
+    if not count:
+        return None
+    if count <= ARRAY_LIMIT:
+        return np.flatnonzero(dense).astype(np.uint16)
+    return np.packbits(dense, bitorder="little")
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint16:
+        return len(container)
+    return int(np.unpackbits(container).sum())
+
+
+class Bitmap:
+    """A compressed set of taxpayer numbers, stored in chunks of 65536."""
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, chunks: Optional[Dict[int, np.ndarray]] = None):
+        self._chunks = dict(sorted((chunks or {}).items()))
+
+    @classmethod
+    def from_ids(cls, ids) -> "Bitmap":
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if not len(ids):
+            return cls()
+        chunks = {}
+        for part in np.split(ids, np.flatnonzero(np.diff(ids >> CHUNK_BITS)) + 1):
+            offsets = (part & (CHUNK_SIZE - 1)).astype(np.uint16)
+            if len(offsets) > ARRAY_LIMIT:
+                dense = np.zeros(CHUNK_SIZE, dtype=bool)
+                dense[offsets] = True
+                offsets = np.packbits(dense, bitorder="little")
+            chunks[int(part[0] >> CHUNK_BITS)] = offsets
+        return cls(chunks)
+
+    def __len__(self) -> int:
+        return sum(_cardinality(container) for container in self._chunks.values())
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        chunks = {}
+        for high in self._chunks.keys() & other._chunks.keys():
+            a, b = self._chunks[high], other._chunks[high]
+            if a.dtype == np.uint16 and b.dtype == np.uint16:
+                both = np.intersect1d(a, b, assume_unique=True)
+                if len(both):
+                    chunks[high] = both
+            else:
+                both = _container(_dense(a) & _dense(b))
+                if both is not None:
+                    chunks[high] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        chunks = dict(self._chunks)
+        for high, b in other._chunks.items():
+            a = chunks.get(high)
+            if a is None:
+                chunks[high] = b
+            elif a.dtype == np.uint16 and b.dtype == np.uint16 and len(a) + len(b) <= ARRAY_LIMIT:
+                chunks[high] = np.union1d(a, b)
+            else:
+                chunks[high] = _container(_dense(a) | _dense(b))
+        return Bitmap(chunks)
+
+    def chunks(self, start: int = 0) -> Iterator[np.ndarray]:
+        """Members from start on, one sorted array per chunk."""
+        for high, container in self._chunks.items():
+            if high < start >> CHUNK_BITS:
+                continue
+            offsets = container if container.dtype == np.uint16 else np.flatnonzero(_dense(container))
+            ids = (high << CHUNK_BITS) + offsets.astype(np.int64)
+            if high == start >> CHUNK_BITS:
+                ids = ids[ids >= start]
+            yield ids
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(container.nbytes for container in self._chunks.values())
+
+
+class TaxpayerListing:
+    """Bitmap indexes over the registry for filtered, keyset-paginated listings."""
+
+    def __init__(self, records: Sequence[Tuple[str, Dict[str, Any], Dict[str, Any]]]):
+        """
+        Build the indexes.
+
+        Args:
+            records: (TPIN, taxpayer record, compliance record) of every
+                taxpayer; the compliance record may be empty
+        """
+        records = sorted(records, key=lambda record: record[0])
+        self._tpins = [tpin for tpin, _, _ in records]
+        self._labels: Dict[str, Dict[str, str]] = {field: {} for field in CATEGORICAL_FIELDS}
+        self._bitmaps: Dict[str, Dict[str, Bitmap]] = {}
+        self._codes: Dict[str, np.ndarray] = {}
+        for field, (source, key) in CATEGORICAL_FIELDS.items():
+            members: Dict[str, List[int]] = {}
+            for number, (_, taxpayer, compliance) in enumerate(records):
+                label = (taxpayer if source == "taxpayer" else compliance).get(key)
+                if label in (None, ""):
+                    continue
+                members.setdefault(_value(label), []).append(number)
+                self._labels[field].setdefault(_value(label), str(label))
+            self._bitmaps[field] = {value: Bitmap.from_ids(ids) for value, ids in members.items()}
+            codes = {value: code for code, value in enumerate(sorted(members))}
+            column = np.full(len(records), -1, dtype=np.int32)
+            for value, ids in members.items():
+                column[ids] = codes[value]
+            self._codes[field] = column
+            self._labels[field] = {value: self._labels[field][value] for value in sorted(members)}
+        self._label_lists = {field: list(labels.values()) for field, labels in self._labels.items()}
+
+        self._scores = np.array(
+            [_score(compliance.get("compliance_score")) for _, _, compliance in records], dtype=np.float64
+        )
+        self._score_order = np.argsort(self._scores, kind="stable")
+        self._sorted_scores = self._scores[self._score_order]
+
+    @classmethod
+    def from_data_source(cls, source, batch_size: int = 10000) -> "TaxpayerListing":
+        """
+        Index every taxpayer record of a data source, with its compliance record.
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        records, batch = [], []
+        for tpin, taxpayer in source.iter_taxpayers():
+            batch.append((tpin, taxpayer))
+            if len(batch) >= batch_size:
+                records.extend(cls._with_compliance(source, batch))
+                batch = []
+        records.extend(cls._with_compliance(source, batch))
+        return cls(records)
+
+    @staticmethod
+    def _with_compliance(source, batch):
+        compliance = source.get_compliance_many([tpin for tpin, _ in batch]) if batch else {}
+        return [(tpin, taxpayer, compliance.get(tpin) or {}) for tpin, taxpayer in batch]
+
+    def __len__(self) -> int:
+        return len(self._tpins)
+
+    def values(self) -> Dict[str, List[str]]:
+        """The values each field can be filtered on."""
+        return {field: list(labels) for field, labels in self._label_lists.items()}
+
+    def query(
+        self,
+        filters: Optional[Dict[str, Sequence[str]]] = None,
+        min_score: Optional[float] = None,
+        max_score: Optional[float] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """
+        List taxpayers matching every filter, in TPIN order.
+
+        Args:
+            filters: Field -> accepted values (any of them, case-insensitive),
+                for the fields in CATEGORICAL_FIELDS
+            min_score: Lowest compliance score, inclusive
+            max_score: Highest compliance score, inclusive
+            after: TPIN the page starts after (the previous page's next_after)
+            limit: Taxpayers per page
+
+        Returns:
+            dict: "total" matching taxpayers, the page's "taxpayers" (TPIN
+                and indexed fields), and "next_after", the cursor of the next
+                page (None on the last page)
+
+        Raises:
+            ValueError: If a field cannot be filtered on
+        """
+        bitmap: Optional[Bitmap] = None
+        for field, values in (filters or {}).items():
+            if field not in CATEGORICAL_FIELDS:
+                raise ValueError(f"Cannot filter on {field}. Use one of: {', '.join(CATEGORICAL_FIELDS)}")
+            matches = Bitmap()
+            for value in values:
+                matches = matches | self._bitmaps[field].get(_value(value), Bitmap())
+            bitmap = matches if bitmap is None else bitmap & matches
+
+        # Score range: selective ranges become a bitmap, wide ones a per-chunk test
+        in_range = None
+        total = len(self) if bitmap is None else len(bitmap)
+        if min_score is not None or max_score is not None:
+            bounds = (-np.inf if min_score is None else min_score, np.inf if max_score is None else max_score)
+            low = np.searchsorted(self._sorted_scores, bounds[0], "left")
+            high = max(low, np.searchsorted(self._sorted_scores, bounds[1], "right"))
+            if high - low <= len(self) * SELECTIVE_SHARE:
+                ranged = Bitmap.from_ids(self._score_order[low:high])
+                bitmap = ranged if bitmap is None else bitmap & ranged
+                total = len(bitmap)
+            elif bitmap is None:
+                in_range = bounds
+                total = int(high - low)
+            else:
+                in_range = bounds
+                total = sum(int(np.count_nonzero(self._in_range(ids, bounds))) for ids in bitmap.chunks())
+
+        start = bisect.bisect_right(self._tpins, after) if after else 0
+        limit = max(0, limit)
+        page: List[int] = []
+        for ids in self._candidates(bitmap, start):
+            if in_range is not None:
+                ids = ids[self._in_range(ids, in_range)]
+            page.extend(ids[:limit + 1 - len(page)].tolist())
+            if len(page) > limit:
+                break
+
+        more = len(page) > limit
+        page = page[:limit]
+        return {
+            "total": total,
+            "taxpayers": [self._row(number) for number in page],
+            "next_after": self._tpins[page[-1]] if more and page else None,
+        }
+
+    def _in_range(self, ids: np.ndarray, bounds: Tuple[float, float]) -> np.ndarray:
+        scores = self._scores[ids]
+        return (scores >= bounds[0]) & (scores <= bounds[1])
+
+    def _candidates(self, bitmap: Optional[Bitmap], start: int) -> Iterator[np.ndarray]:
+        if bitmap is not None:
+            yield from bitmap.chunks(start)
+            return
+        for chunk_start in range(start, len(self), CHUNK_SIZE):
+            yield np.arange(chunk_start, min(chunk_start + CHUNK_SIZE, len(self)))
+
+    def _row(self, number: int) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"tpin": self._tpins[number]}
+        for field, labels in self._label_lists.items():
+            code = self._codes[field][number]
+            row[field] = labels[code] if code >= 0 else None
+        score = self._scores[number]
+        row["compliance_score"] = None if np.isnan(score) else float(score)
+        return row
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "taxpayers": len(self),
+            "bitmaps": sum(len(bitmaps) for bitmaps in self._bitmaps.values()),
+            "memory_bytes": sum(
+                bitmap.memory_bytes for bitmaps in self._bitmaps.values() for bitmap in bitmaps.values()
+            ) + self._scores.nbytes * 2 + self._score_order.nbytes,
+        }
+
+
+def _score(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
@@ -0,0 +1,116 @@
+"""
+Penalty and interest exposure of liabilities, in batches.
+
+Rows of (tax type, amount, due date, payment date) are validated one by one
+and priced together by core.tax_verification.penalties.PenaltyEngine.
+Unpaid liabilities are charged up to an as-of date, so a nightly run over
+every outstanding liability gives the exposure as of that night.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import ZRAConfig
+from core.money import MAX_KWACHA, to_kwacha, to_ngwee
+from core.tax_verification.penalties import PenaltyEngine
+
+INPUT_COLUMNS = ["liability_id", "tpin", "tax_type", "amount", "due_date", "paid_on"]
+CHARGE_COLUMNS = ["days_late", "fixed_penalty", "daily_penalty", "interest", "total"]
+PENALTY_COLUMNS = INPUT_COLUMNS + CHARGE_COLUMNS + ["error"]
+
+# Rules and daily-rate tables are built once, from ZRA_PENALTY_RULES_FILE if set
+penalty_engine = (
+    PenaltyEngine.from_file(ZRAConfig.PENALTY_RULES_FILE)
+    if ZRAConfig.PENALTY_RULES_FILE
+    else PenaltyEngine()
+)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+
+def assess_rows(rows: Sequence[dict], as_of: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Price a chunk of liability rows; see assess_batch."""
+    return assess_batch(rows, as_of)[0]
+
+
+def assess_batch(rows: Sequence[dict], as_of: Optional[date] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Price a chunk of liability rows, and total their charges.
+
+    Args:
+        rows: Dicts with the INPUT_COLUMNS keys; paid_on is empty for
+            unpaid liabilities
+        as_of: Date unpaid liabilities are charged up to (default today)
+
+    Returns:
+        tuple: One dict per row with the PENALTY_COLUMNS keys, charges
+            formatted to 2 decimals in ZMW or empty on error; and the total
+            of the valid rows' charges in ngwee
+
+    Raises:
+        ValueError: If as_of is after the last date the rate tables cover
+    """
+    as_of = as_of or date.today()
+    if as_of > penalty_engine.end:
+        raise ValueError(f"as_of must be on or before {penalty_engine.end}")
+    count = len(rows)
+    tax_types = np.full(count, "", dtype=object)
+    amounts = np.zeros(count)
+    due_dates: List[Optional[date]] = [None] * count
+    paid_on: List[Optional[date]] = [None] * count
+    errors: List[Optional[str]] = [None] * count
+    for i, row in enumerate(rows):
+        tax_type = str(row.get("tax_type") or "").strip().upper()
+        if tax_type not in penalty_engine.rules:
+            errors[i] = f"Unknown tax type: {row.get('tax_type')}" if tax_type else "Missing tax type"
+            continue
+        tax_types[i] = tax_type
+        value = row.get("amount")
+        try:
+            amounts[i] = float(value)
+        except (TypeError, ValueError):
+            errors[i] = "Missing amount" if value in (None, "") else f"Invalid amount: {value}"
+            continue
+        if not 0 <= amounts[i] <= MAX_KWACHA:
+            errors[i] = f"Invalid amount: {value}"
+            continue
+        try:
+            due_dates[i] = _parse_date(row.get("due_date"))
+            if row.get("paid_on") not in (None, ""):
+                paid_on[i] = _parse_date(row.get("paid_on"))
+        except ValueError:
+            errors[i] = "Dates must be YYYY-MM-DD"
+            continue
+        if not (penalty_engine.start <= due_dates[i] and (paid_on[i] or due_dates[i]) <= penalty_engine.end):
+            errors[i] = f"Dates must be between {penalty_engine.start} and {penalty_engine.end}"
+
+    valid = np.array([error is None for error in errors], dtype=bool)
+    index = np.flatnonzero(valid)
+    charges = penalty_engine.assess_many(
+        tax_types[index],
+        to_ngwee(amounts[index]),
+        [due_dates[i] for i in index],
+        [paid_on[i] for i in index],
+        as_of
+    )
+
+    result = []
+    position = {row: n for n, row in enumerate(index.tolist())}
+    for i, row in enumerate(rows):
+        out = {column: row.get(column, "") for column in INPUT_COLUMNS}
+        n = position.get(i)
+        for column in CHARGE_COLUMNS:
+            if n is None:
+                out[column] = ""
+            elif column == "days_late":
+                out[column] = int(charges[column][n])
+            else:
+                out[column] = f"{to_kwacha(charges[column][n]):.2f}"
+        out["error"] = errors[i] or ""
+        result.append(out)
+    return result, int(charges["total"].sum())
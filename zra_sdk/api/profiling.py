@@ -0,0 +1,218 @@
+"""
+Opt-in request profiling for the web app.
+
+A sampled request (one in every ``sample_rate``, or any request carrying the
+profiling header set to the secret token) has its thread's stack sampled at
+a fixed interval by a single background thread. The samples are written as
+folded stacks, the input format of flamegraph.pl and speedscope, and the
+slowest recent profiles are listed by endpoints that also require the token.
+Without a token the header is ignored and the endpoints are not registered.
+
+Nothing is registered on the app unless profiling is enabled, so it costs
+nothing when disabled.
+"""
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+PROFILE_HEADER = "X-ZRA-Profile"
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from one background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._targets: Dict[int, Counter] = {}
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> None:
+        """Start sampling a thread."""
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="zra-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id: int) -> Counter:
+        """Stop sampling a thread and return its folded stack counts."""
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, counts in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[self._fold(frame)] += 1
+
+    def _fold(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = (
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                ).replace(";", ":")
+            labels.append(label)
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+
+class RequestProfiler:
+    """Samples requests of a Flask app and keeps their profiles."""
+
+    def __init__(
+        self,
+        directory: str,
+        token: Optional[str] = None,
+        sample_rate: int = 100,
+        interval: float = 0.005,
+        keep: int = 200,
+        header: str = PROFILE_HEADER
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            directory: Where folded stack files are written
+            token: Secret the profiling header must carry to force profiling
+                or read profiles; neither is possible without one
+            sample_rate: Profile one in every this many requests, 0 to
+                profile only requests carrying the header
+            interval: Seconds between stack samples
+            keep: Recent profiles to keep; older files are deleted
+            header: Request header that forces profiling
+        """
+        self.directory = directory
+        self.token = token or None
+        self.sample_rate = sample_rate
+        self.header = header
+        self.sampler = StackSampler(interval)
+        self._counter = itertools.count(1)
+        self._recent: Deque[Dict[str, Any]] = deque()
+        self._keep = keep
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, value: Optional[str]) -> bool:
+        """Whether a profiling header value carries the token."""
+        if self.token is None or not value:
+            return False
+        return hmac.compare_digest(value.encode("utf-8"), self.token.encode("utf-8"))
+
+    def init_app(self, app, route: str = "/api/debug/profiles") -> None:
+        """Register the profiling hooks, and the listing endpoints if a token is set, on an app."""
+        from flask import Response, g, jsonify, request
+
+        @app.before_request
+        def start_profile():
+            if request.endpoint in ("list_profiles", "get_profile"):
+                return
+            forced = self.authorized(request.headers.get(self.header))
+            sampled = self.sample_rate > 0 and next(self._counter) % self.sample_rate == 0
+            if forced or sampled:
+                g.profile_started = time.perf_counter()
+                self.sampler.start(threading.get_ident())
+
+        @app.teardown_request
+        def finish_profile(exc):
+            started = g.pop("profile_started", None)
+            if started is not None:
+                stacks = self.sampler.stop(threading.get_ident())
+                self._save(request.method, request.path, request.endpoint,
+                           time.perf_counter() - started, stacks, exc)
+
+        if self.token is None:
+            return
+
+        def forbidden():
+            return jsonify({"success": False, "error": f"{self.header} header with the profiling token required"}), 403
+
+        @app.route(route)
+        def list_profiles():
+            """API endpoint listing the slowest recently profiled requests"""
+            if not self.authorized(request.headers.get(self.header)):
+                return forbidden()
+            limit = request.args.get("limit", 20, type=int)
+            return jsonify({"success": True, "profiles": self.slowest(limit)})
+
+        @app.route(f"{route}/<name>")
+        def get_profile(name):
+            """API endpoint returning one profile as folded stacks"""
+            if not self.authorized(request.headers.get(self.header)):
+                return forbidden()
+            folded = self.read(name)
+            if folded is None:
+                return jsonify({"success": False, "error": "Unknown profile"}), 404
+            return Response(folded, mimetype="text/plain")
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The slowest of the recent profiles, slowest first."""
+        with self._lock:
+            profiles = sorted(self._recent, key=lambda p: p["duration_ms"], reverse=True)
+        return profiles[:max(0, limit)]
+
+    def read(self, name: str) -> Optional[str]:
+        """Folded stacks of a recent profile, by file name."""
+        with self._lock:
+            if not any(profile["name"] == name for profile in self._recent):
+                return None
+        with open(os.path.join(self.directory, name), "r", encoding="utf-8") as fh:
+            return fh.read()
+
+    def _save(
+        self,
+        method: str,
+        path: str,
+        endpoint: Optional[str],
+        duration: float,
+        stacks: Counter,
+        exc: Optional[BaseException]
+    ) -> None:
+        now = datetime.now()
+        duration_ms = round(duration * 1000, 1)
+        name = _UNSAFE.sub("_", f"{now:%Y%m%d-%H%M%S-%f}_{method}_{endpoint or path}_{duration_ms:.0f}ms") + ".folded"
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as fh:
+            fh.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+        # Functions with the most samples at the top of the stack
+        self_time: Counter = Counter()
+        for stack, count in stacks.items():
+            self_time[stack.rsplit(";", 1)[-1]] += count
+        profile = {
+            "name": name,
+            "method": method,
+            "path": path,
+            "endpoint": endpoint,
+            "duration_ms": duration_ms,
+            "samples": sum(stacks.values()),
+            "top_functions": [{"function": label, "samples": count} for label, count in self_time.most_common(5)],
+            "error": str(exc) if exc else None,
+            "recorded_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            self._recent.append(profile)
+            expired = self._recent.popleft() if len(self._recent) > self._keep else None
+        if expired is not None:
+            try:
+                os.remove(os.path.join(self.directory, expired["name"]))
+            except OSError:
+                pass
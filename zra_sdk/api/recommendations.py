@@ -0,0 +1,87 @@
+"""
+Declarative compliance recommendation rules.
+
+Rules are plain data (loaded from JSON or defined in code) and compiled once
+into a decision table of (field, comparison, threshold, message) rows that is
+evaluated in a single pass per compliance record.
+"""
+import json
+import operator
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda value, options: value in options,
+}
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        "field": "outstanding_returns", "op": ">", "value": 0,
+        "message": "Submit {outstanding_returns} outstanding tax returns",
+    },
+    {
+        "field": "outstanding_payments", "op": ">", "value": 0,
+        "message": "Clear outstanding payment of ZMW {outstanding_payments:,.2f}",
+    },
+    {
+        "field": "compliance_score", "op": "<", "value": 70,
+        "message": "Schedule meeting with tax consultant to review compliance status",
+    },
+    {
+        "field": "risk_level", "op": "==", "value": "High",
+        "message": "Urgent: Address compliance issues to avoid penalties",
+    },
+]
+DEFAULT_MESSAGE = "Maintain current compliance practices"
+
+
+class RecommendationEngine:
+    """Evaluates compiled recommendation rules against compliance data."""
+
+    def __init__(self, rules: List[Dict[str, Any]], default: Optional[str] = DEFAULT_MESSAGE):
+        """
+        Compile rules into a decision table.
+
+        Args:
+            rules: Rules with field, op, value and message keys. The message
+                is a str.format template over the compliance data fields.
+            default: Recommendation to give when no rule matches
+
+        Raises:
+            ValueError: If a rule is incomplete or uses an unknown operator
+        """
+        self.default = default
+        self._table: List[Tuple[str, Callable[[Any, Any], bool], Any, str]] = []
+        for number, rule in enumerate(rules, 1):
+            missing = {"field", "op", "value", "message"} - set(rule)
+            if missing:
+                raise ValueError(f"Rule {number} is missing {', '.join(sorted(missing))}")
+            if rule["op"] not in OPERATORS:
+                raise ValueError(f"Rule {number} has unknown operator {rule['op']!r}")
+            self._table.append((rule["field"], OPERATORS[rule["op"]], rule["value"], rule["message"]))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RecommendationEngine':
+        """
+        Load rules from a JSON file of the form
+        {"rules": [{"field": ..., "op": ..., "value": ..., "message": ...}], "default": ...}
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            config = json.load(fh)
+        return cls(config["rules"], config.get("default", DEFAULT_MESSAGE))
+
+    def evaluate(self, compliance_data: Dict[str, Any]) -> List[str]:
+        """Return the recommendations whose rules match the compliance data."""
+        recommendations = [
+            message.format_map(compliance_data)
+            for field, compare, threshold, message in self._table
+            if field in compliance_data and compare(compliance_data[field], threshold)
+        ]
+        if not recommendations and self.default:
+            recommendations.append(self.default)
+        return recommendations
@@ -0,0 +1,265 @@
+"""
+Fast rejection of TPINs that are not in the registry.
+
+A Bloom filter holds every registered TPIN: a bit array where each TPIN
+sets a few bits chosen by hashing it. A TPIN with any of its bits unset is
+certainly not registered and is rejected before any cache or data source
+lookup. A TPIN with all its bits set is probably registered. A small share
+of unknown TPINs (the false positive rate) gets through and is turned away
+by the data source instead. Active, Suspended and Pending taxpayers are
+registered (the lookup returns which); Deregistered and Inactive ones are
+left out. Blacklisted TPINs are held exactly, in a set checked before the
+filter, so none gets through as a false positive.
+"""
+import array
+import math
+import threading
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.tax_verification.exceptions import TPINNotFoundError
+
+_WORD_BITS = 64
+_MAX_HASHES = 16
+_TABLE_SIZE = 1024  # masks per half word table; hash bits 0-9 and 10-19 pick them
+
+# Statuses of taxpayers the filter lets through; records without a status count as active
+REGISTERED_STATUSES = frozenset({"active", "suspended", "pending"})
+
+
+def is_registered(record: Mapping[str, Any]) -> bool:
+    """Whether a taxpayer record is registered, i.e. not deregistered or inactive."""
+    status = record.get("status")
+    return status is None or str(status).strip().lower() in REGISTERED_STATUSES
+
+
+def _blocked_false_positive_rate(bits_per_key: float, hashes: int) -> float:
+    """
+    False positive rate of a filter whose keys each set `hashes` bits of one
+    64-bit word, half in each half word; the word loads are Poisson distributed.
+    """
+    load = _WORD_BITS / bits_per_key
+    half = _WORD_BITS // 2
+    low, high = hashes // 2, hashes - hashes // 2
+    rate, probability = 0.0, math.exp(-load)
+    for keys in range(int(load + 12 * math.sqrt(load) + 20)):
+        rate += probability * (1 - (1 - low / half) ** keys) ** low * (1 - (1 - high / half) ** keys) ** high
+        probability *= load / (keys + 1)
+    return rate
+
+
+def _layout(false_positive_rate: float) -> Tuple[float, int]:
+    """Fewest bits per key, and the bits set per key, that reach a false positive rate."""
+    bits_per_key = 2.0
+    while bits_per_key < 4 * _WORD_BITS:
+        rates = [(_blocked_false_positive_rate(bits_per_key, k), k) for k in range(1, _MAX_HASHES + 1)]
+        rate, hashes = min(rates)
+        if rate <= false_positive_rate:
+            return bits_per_key, hashes
+        bits_per_key += 0.5
+    raise ValueError(f"False positive rate {false_positive_rate} is too low")
+
+
+def _hashes(tpins: Sequence[str]) -> np.ndarray:
+    return np.fromiter(map(hash, tpins), dtype=np.int64, count=len(tpins))
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and a bounded false positive rate.
+
+    The filter is register-blocked: each TPIN sets all its bits in one 64-bit
+    word, so a lookup is one hash, one word read and one mask test. The
+    word and the mask, which combines one entry of each of two small
+    tables, are chosen by the TPIN's hash. Hashes are Python's string hashes,
+    so a filter is only valid in the process that built it.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001, seed: int = 0):
+        """
+        Size the filter.
+
+        Args:
+            capacity: Number of TPINs it will hold
+            false_positive_rate: Share of absent TPINs reported as present
+                once the filter holds capacity TPINs
+            seed: Seed of the bit mask tables
+
+        Raises:
+            ValueError: If the false positive rate is not between 0 and 1
+        """
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("False positive rate must be between 0 and 1")
+        bits_per_key, self.hashes = _layout(false_positive_rate)
+        self.false_positive_rate = false_positive_rate
+        self.words = max(1, math.ceil(max(1, capacity) * bits_per_key / _WORD_BITS))
+        if self.words >= 1 << 43:
+            raise ValueError("Too many TPINs for one filter")
+        self.size = self.words * _WORD_BITS
+        self.count = 0
+
+        # Each mask combines a low table entry, with bits in the low half of
+        # the word, and a high table entry, with bits in the high half
+        rng = np.random.default_rng(seed)
+        half = _WORD_BITS // 2
+        self._half_hashes = (self.hashes // 2, self.hashes - self.hashes // 2)
+        tables = []
+        for offset, bits in zip((0, half), self._half_hashes):
+            table = np.zeros(_TABLE_SIZE, dtype=np.uint64)
+            for row in range(_TABLE_SIZE):
+                for bit in rng.choice(half, bits, replace=False):
+                    table[row] |= np.uint64(1) << np.uint64(offset + bit)
+            tables.append(table)
+        self._low_masks, self._high_masks = tables
+        self._low, self._high = tables[0].tolist(), tables[1].tolist()
+        self._bytes = array.array("Q", bytes(8 * self.words))
+        self._bits = np.frombuffer(self._bytes, dtype=np.uint64)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bits.nbytes
+
+    def _locate(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        masks = self._low_masks[hashes & 1023] | self._high_masks[hashes >> 10 & 1023]
+        return (hashes >> 20) % self.words, masks
+
+    def add_many(self, tpins: Sequence[str]) -> None:
+        words, masks = self._locate(_hashes(tpins))
+        np.bitwise_or.at(self._bits, words, masks)
+        self.count += len(tpins)
+
+    def __contains__(self, tpin: str) -> bool:
+        h = hash(tpin)
+        mask = self._low[h & 1023] | self._high[h >> 10 & 1023]
+        return self._bytes[(h >> 20) % self.words] & mask == mask
+
+    def contains_many(self, tpins: Sequence[str]) -> np.ndarray:
+        """Membership of each TPIN, as a bool array."""
+        words, masks = self._locate(_hashes(tpins))
+        return (self._bits[words] & masks) == masks
+
+    def estimated_false_positive_rate(self) -> float:
+        """False positive rate implied by how full each half word is."""
+        bits = np.unpackbits(self._bits.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        half = _WORD_BITS // 2
+        low = bits[:, :half].sum(axis=1) / half
+        high = bits[:, half:].sum(axis=1) / half
+        return float(np.mean(low ** self._half_hashes[0] * high ** self._half_hashes[1]))
+
+
+class RegistryFilter:
+    """Rejects TPINs that are not registered or are blacklisted."""
+
+    def __init__(self, registered: BloomFilter, blocklist: Iterable[str] = ()):
+        self.registered = registered
+        self._blocklist = frozenset(blocklist)
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.rejected = 0
+        self.false_positives = 0
+
+    @classmethod
+    def build(
+        cls,
+        registry: Iterable[str],
+        blocklist: Iterable[str] = (),
+        false_positive_rate: float = 0.001
+    ) -> "RegistryFilter":
+        """
+        Build the filter.
+
+        Args:
+            registry: TPIN of every registered taxpayer
+            blocklist: Blacklisted TPINs, rejected even when registered
+            false_positive_rate: Share of unknown TPINs let through
+        """
+        blocked = frozenset(blocklist)
+        registered = [tpin for tpin in registry if tpin not in blocked]
+        registered_filter = BloomFilter(len(registered), false_positive_rate)
+        registered_filter.add_many(registered)
+        return cls(registered_filter, blocked)
+
+    @classmethod
+    def from_data_source(
+        cls,
+        source,
+        blocklist: Iterable[str] = (),
+        false_positive_rate: float = 0.001
+    ) -> "RegistryFilter":
+        """
+        Build the filter from the registered taxpayer records of a data source.
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        registry = (tpin for tpin, record in source.iter_taxpayers() if is_registered(record))
+        return cls.build(registry, blocklist, false_positive_rate)
+
+    def add(self, taxpayers: Mapping[str, Mapping[str, Any]]) -> None:
+        """
+        Add taxpayers registered after the filter was built, from their
+        records by TPIN; deregistered, inactive and blacklisted ones stay
+        out. A taxpayer deregistered later stays in the filter until it is
+        rebuilt, and its lookup returns the new status. The false positive
+        rate rises once the filter holds more TPINs than it was built for;
+        stats() reports the estimate.
+        """
+        tpins = [
+            tpin for tpin, record in taxpayers.items()
+            if tpin not in self._blocklist and is_registered(record)
+        ]
+        if not tpins:
+            return
+        with self._lock:
+            new = ~self.registered.contains_many(tpins)
+            self.registered.add_many([tpin for tpin, is_new in zip(tpins, new) if is_new])
+
+    def reason(self, tpin: str) -> Optional[str]:
+        """Why a TPIN is rejected, or None if it may be registered."""
+        if tpin in self._blocklist:
+            return f"TPIN {tpin} is blacklisted"
+        if tpin in self.registered:
+            return None
+        return f"TPIN {tpin} not found"
+
+    def check(self, tpin: str) -> None:
+        """
+        Raises:
+            TPINNotFoundError: If the TPIN is certainly not registered, or blacklisted
+        """
+        self.checks += 1
+        reason = self.reason(tpin)
+        if reason is not None:
+            self.rejected += 1
+            raise TPINNotFoundError(reason)
+
+    def allowed_many(self, tpins: Sequence[str]) -> np.ndarray:
+        """Whether each TPIN may be registered, as a bool array."""
+        allowed = self.registered.contains_many(tpins)
+        if self._blocklist:
+            allowed &= np.fromiter((tpin not in self._blocklist for tpin in tpins), dtype=bool, count=len(tpins))
+        self.checks += len(tpins)
+        self.rejected += int(len(tpins) - allowed.sum())
+        return allowed
+
+    def record_false_positive(self) -> None:
+        """Count a TPIN let through that the data source did not know."""
+        self.false_positives += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Sizes, configured and estimated false positive rates, and counts so far."""
+        passed = self.checks - self.rejected
+        return {
+            "registered_tpins": self.registered.count,
+            "blocked_tpins": len(self._blocklist),
+            "bits": self.registered.size,
+            "hashes": self.registered.hashes,
+            "memory_bytes": self.registered.memory_bytes,
+            "false_positive_rate": self.registered.false_positive_rate,
+            "estimated_false_positive_rate": round(self.registered.estimated_false_positive_rate(), 6),
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "false_positives": self.false_positives,
+            "observed_false_positive_share": round(self.false_positives / passed, 6) if passed else 0.0,
+        }
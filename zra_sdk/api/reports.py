@@ -0,0 +1,309 @@
+"""
+Printable compliance reports.
+
+Reports are rendered to HTML or PDF by a pool of worker processes, so
+rendering never runs on a web request thread and throughput grows with the
+number of workers. Rendered documents are cached by (TPIN, data version,
+format), where the data version is a digest of the report content, so a
+report whose data has not changed is only rendered once.
+"""
+import hashlib
+import html
+import json
+import os
+import textwrap
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "html": "text/html; charset=utf-8",
+}
+
+# A4 in points, Helvetica 10pt
+_PAGE_WIDTH, _PAGE_HEIGHT = 595, 842
+_MARGIN = 50
+_LINE_HEIGHT = 14
+_LINES_PER_PAGE = (_PAGE_HEIGHT - 2 * _MARGIN) // _LINE_HEIGHT
+_WRAP_WIDTH = 95
+
+
+def data_version(report: Dict[str, Any]) -> str:
+    """Digest of the report content, ignoring when the report was generated."""
+    content = {key: value for key, value in report.items() if key != "report_generated"}
+    encoded = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def _label(key: str) -> str:
+    return key.replace("_", " ").capitalize()
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, list):
+        return "; ".join(str(item) for item in value) or "None"
+    return str(value)
+
+
+def _report_sections(report: Dict[str, Any]) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """Split a compliance report into titled sections of (label, value) rows."""
+    taxpayer = report.get("taxpayer_info") or {}
+    summary = report.get("compliance_summary") or {}
+    recommendations = report.get("recommendations") or []
+    return [
+        ("Taxpayer", [(_label(key) + ":", _text(value)) for key, value in taxpayer.items()]),
+        ("Compliance Summary", [(_label(key) + ":", _text(value)) for key, value in summary.items()]),
+        ("Recommendations", [(f"{number}.", str(text)) for number, text in enumerate(recommendations, 1)]),
+    ]
+
+
+def render_html(report: Dict[str, Any]) -> str:
+    """Render a compliance report as a standalone HTML document."""
+    tpin = (report.get("taxpayer_info") or {}).get("tpin", "")
+    parts = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset=\"utf-8\">",
+        f"<title>Compliance Report {html.escape(str(tpin))}</title>",
+        "<style>body{font-family:Helvetica,Arial,sans-serif;margin:2em}"
+        "table{border-collapse:collapse}td{padding:2px 12px 2px 0;vertical-align:top}"
+        "td:first-child{font-weight:bold}</style>",
+        "</head><body>",
+        "<h1>ZRA Compliance Report</h1>",
+        f"<p>Generated: {html.escape(str(report.get('report_generated', '')))}</p>",
+    ]
+    for title, rows in _report_sections(report):
+        parts.append(f"<h2>{html.escape(title)}</h2><table>")
+        parts.extend(
+            f"<tr><td>{html.escape(label)}</td><td>{html.escape(value)}</td></tr>"
+            for label, value in rows
+        )
+        parts.append("</table>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def render_pdf(report: Dict[str, Any]) -> bytes:
+    """Render a compliance report as a plain text PDF document."""
+    lines = ["ZRA Compliance Report", f"Generated: {report.get('report_generated', '')}"]
+    for title, rows in _report_sections(report):
+        lines.extend(["", title])
+        for label, value in rows:
+            lines.extend(textwrap.wrap(f"{label} {value}", _WRAP_WIDTH,
+                                       initial_indent="  ", subsequent_indent="      ") or [""])
+    pages = [lines[i:i + _LINES_PER_PAGE] for i in range(0, len(lines), _LINES_PER_PAGE)]
+    return _pdf_document(pages)
+
+
+def _pdf_string(text: str) -> bytes:
+    encoded = text.encode("cp1252", errors="replace")
+    return b"(" + encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _pdf_document(pages: List[List[str]]) -> bytes:
+    """Assemble a minimal PDF with one Helvetica text block per page."""
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once the pages are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        stream = b"BT /F1 10 Tf %d TL %d %d Td " % (_LINE_HEIGHT, _MARGIN, _PAGE_HEIGHT - _MARGIN)
+        stream += b" T* ".join(_pdf_string(line) + b" Tj" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (_PAGE_WIDTH, _PAGE_HEIGHT, len(objects))
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    document = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(document))
+        document += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(document)
+    document += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    document += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    document += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(document)
+
+
+def render_report(report: Dict[str, Any], fmt: str) -> bytes:
+    """Render a compliance report in the given format ("pdf" or "html")."""
+    if fmt == "pdf":
+        return render_pdf(report)
+    return render_html(report).encode("utf-8")
+
+
+@dataclass
+class ReportJob:
+    """A queued report rendering"""
+    job_id: str
+    tpin: str
+    format: str
+    data_version: str
+    status: str = "pending"  # pending, done, failed
+    cached: bool = False
+    error: Optional[str] = None
+    created_at: str = ""
+    completed_at: Optional[str] = None
+    document: Optional[bytes] = None
+
+    @property
+    def filename(self) -> str:
+        return f"compliance_report_{self.tpin}.{self.format}"
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "tpin": self.tpin,
+            "format": self.format,
+            "data_version": self.data_version,
+            "status": self.status,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at,
+        }
+
+
+class ReportService:
+    """
+    Queues report renderings on a process pool and caches the results.
+
+    Concurrent requests for the same (TPIN, data version, format) share one
+    rendering, and later requests are served from the cache.
+    """
+
+    def __init__(
+        self,
+        fetch_report: Callable[[str], Dict[str, Any]],
+        workers: int = 0,
+        cache_size: int = 256,
+        max_jobs: int = 1000
+    ):
+        """
+        Initialize the service.
+
+        Args:
+            fetch_report: Returns the report data of a TPIN, e.g.
+                get_compliance_report; raises ValueError for a bad TPIN
+            workers: Rendering processes, 0 for the CPU count
+            cache_size: Rendered documents to keep
+            max_jobs: Jobs to remember before the oldest are forgotten
+        """
+        self.fetch_report = fetch_report
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], Future] = {}
+        self._jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+
+    def submit(self, tpin: str, fmt: str = "pdf") -> ReportJob:
+        """
+        Queue a report rendering.
+
+        Args:
+            tpin: Taxpayer Identification Number
+            fmt: "pdf" or "html"
+
+        Returns:
+            ReportJob: Already done if the document was cached
+
+        Raises:
+            ValueError: If the format is unknown or the TPIN is invalid
+        """
+        fmt = (fmt or "pdf").lower()
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported report format: {fmt}. Use one of: {', '.join(MEDIA_TYPES)}")
+
+        report = self.fetch_report(tpin)
+        key = (tpin, data_version(report), fmt)
+        job = ReportJob(
+            job_id=uuid.uuid4().hex,
+            tpin=tpin,
+            format=fmt,
+            data_version=key[1],
+            created_at=_now()
+        )
+
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+            document = self._cache.get(key)
+            if document is not None:
+                self._cache.move_to_end(key)
+                job.status, job.cached, job.document, job.completed_at = "done", True, document, _now()
+                return job
+
+            future = self._inflight.get(key)
+            started = future is None
+            if started:
+                future = self._inflight[key] = self._start(report, fmt)
+
+        # Callbacks run straight away if the rendering has already finished
+        if started:
+            future.add_done_callback(lambda done: self._rendered(key, done))
+        future.add_done_callback(lambda done: self._finish(job, done))
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        """Look up a job by ID."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def _start(self, report: Dict[str, Any], fmt: str) -> Future:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            return self._pool.submit(render_report, report, fmt)
+        except BrokenProcessPool:
+            # A worker died; replace the pool once
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool.submit(render_report, report, fmt)
+
+    def _rendered(self, key: Tuple[str, str, str], future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.exception() is None:
+                self._cache[key] = future.result()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def _finish(self, job: ReportJob, future: Future) -> None:
+        error = future.exception()
+        with self._lock:
+            if error is None:
+                job.status, job.document = "done", future.result()
+            else:
+                job.status, job.error = "failed", str(error) or type(error).__name__
+            job.completed_at = _now()
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,319 @@
+"""
+Taxpayer search and autocomplete over names and business names.
+
+The index is built once from the registry and is read-only afterwards:
+
+- Every word of a taxpayer's name and business name is a term. The terms
+  are kept sorted, so the terms starting with a prefix are one contiguous
+  range found by binary search. Postings (the taxpayers having each term)
+  are stored in the same order in one array, so the taxpayers of a whole
+  prefix range are a single slice.
+- Each term is also indexed by its trigrams (three-letter pieces, padded
+  with '$' at both ends), so misspelled words find terms that share most of
+  their trigrams.
+- Each taxpayer's terms are also kept (a forward index), to check the
+  other words of a query against the taxpayers found by its rarest word
+  when that is cheaper than intersecting their postings.
+- Names and business names are kept sorted, so the taxpayers whose name
+  starts with the query are one binary search, and every match is ranked
+  with array sorts whatever the number of matches.
+- TPINs are kept sorted for TPIN prefix search.
+
+Results are ranked: the whole name equal to the query, the name starting
+with the query, every query word found (the last word as a prefix, for
+autocomplete), and then fuzzy matches by trigram similarity.
+"""
+import bisect
+import re
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+# Taxpayers considered per misspelled word, however common its close spellings are
+MAX_CANDIDATES = 1000
+# Fuzzy matches need this share of trigrams in common (Dice coefficient)
+MIN_SIMILARITY = 0.5
+MAX_FUZZY_TERMS = 32
+
+# Scores of each kind of match
+SCORES = {"tpin": 1.0, "exact": 1.0, "prefix": 0.8, "words": 0.6, "fuzzy": 0.5}
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+_AFTER_WORDS = "{"  # sorts after every normalized term
+
+
+def normalize(text: Any) -> str:
+    """Lower-case ASCII words separated by single spaces ("Mwansa-Chileshe Ltd." -> "mwansa chileshe ltd")."""
+    text = str(text or "")
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _ints(values: array) -> np.ndarray:
+    return np.frombuffer(values, dtype=np.int32) if len(values) else np.empty(0, dtype=np.int32)
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Group values by key: (offsets, values sorted by key then value)."""
+    order = np.lexsort((values, keys))
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return offsets, values[order]
+
+
+class TaxpayerSearchIndex:
+    """In-memory search index over TPINs, names and business names."""
+
+    def __init__(self, records: Iterable[Tuple[str, str, str]]):
+        """
+        Build the index.
+
+        Args:
+            records: (TPIN, name, business name) of every taxpayer
+        """
+        self._tpins: List[str] = []
+        self._names: List[str] = []
+        self._businesses: List[str] = []
+        self._keys: List[Tuple[str, str]] = []  # normalized name and business name
+
+        terms: Dict[str, int] = {}
+        term_ids, doc_ids = array("i"), array("i")
+        for doc, (tpin, name, business) in enumerate(records):
+            key = (normalize(name), normalize(business))
+            self._tpins.append(tpin)
+            self._names.append(name or "")
+            self._businesses.append(business or "")
+            self._keys.append(key)
+            for term in set(key[0].split()) | set(key[1].split()):
+                term_ids.append(terms.setdefault(term, len(terms)))
+                doc_ids.append(doc)
+
+        # Terms in sorted order, with their postings in the same order
+        self._terms = sorted(terms)
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[[terms[term] for term in self._terms]] = np.arange(len(terms), dtype=np.int32)
+        term_ranks, doc_ids = rank[_ints(term_ids)], _ints(doc_ids)
+        self._offsets, self._postings = _csr(term_ranks, doc_ids, len(self._terms))
+
+        # Forward index: the terms of each taxpayer (pairs were added in taxpayer order)
+        self._doc_offsets = np.zeros(len(self._tpins) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_ids, minlength=len(self._tpins)), out=self._doc_offsets[1:])
+        self._doc_terms = term_ranks
+
+        # Trigram -> terms
+        grams: Dict[str, int] = {}
+        gram_ids, gram_terms = array("i"), array("i")
+        self._gram_counts = np.zeros(len(self._terms), dtype=np.int32)
+        for term_rank, term in enumerate(self._terms):
+            term_grams = trigrams(term)
+            self._gram_counts[term_rank] = len(term_grams)
+            for gram in term_grams:
+                gram_ids.append(grams.setdefault(gram, len(grams)))
+                gram_terms.append(term_rank)
+        self._grams = grams
+        self._gram_offsets, self._gram_terms = _csr(_ints(gram_ids), _ints(gram_terms), len(grams))
+
+        self._by_tpin = sorted(range(len(self._tpins)), key=self._tpins.__getitem__)
+        self._sorted_tpins = [self._tpins[doc] for doc in self._by_tpin]
+
+        # Names and business names in sorted order, and each taxpayer's place by name
+        self._sorted_keys: List[Tuple[List[str], np.ndarray]] = []
+        for field in (0, 1):
+            by_key = sorted(range(len(self._keys)), key=lambda doc: self._keys[doc][field])
+            self._sorted_keys.append(([self._keys[doc][field] for doc in by_key], np.array(by_key, dtype=np.int64)))
+        self._name_ranks = np.empty(len(self._keys), dtype=np.int64)
+        self._name_ranks[self._sorted_keys[0][1]] = np.arange(len(self._keys))
+        self._name_lengths = np.array([len(name) for name, _ in self._keys], dtype=np.int64)
+        self._terms_per_doc = len(self._doc_terms) / max(1, len(self._tpins))
+
+    @classmethod
+    def from_data_source(cls, source) -> "TaxpayerSearchIndex":
+        """
+        Index every taxpayer record of a data source.
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        return cls(
+            (tpin, record.get("name", ""), record.get("business_name", ""))
+            for tpin, record in source.iter_taxpayers()
+        )
+
+    def __len__(self) -> int:
+        return len(self._tpins)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._terms)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Find taxpayers by TPIN prefix, or by words of their name or business name.
+
+        The last word of the query is matched as a prefix unless the query
+        ends with a space. When too few taxpayers have every word, close
+        spellings are matched too.
+
+        Returns:
+            list: Up to limit {"tpin", "name", "business_name", "score",
+                "match"} dicts, best first
+        """
+        text = normalize(query)
+        limit = max(0, limit)
+        if not text or not limit:
+            return []
+        if text.replace(" ", "").isdigit():
+            return self._search_tpin(text.replace(" ", ""), limit)
+
+        words = text.split()
+        prefix = not str(query)[-1:].isspace()
+        ranges = [self._range(word, prefix and i == len(words) - 1) for i, word in enumerate(words)]
+        found = self._match(words, ranges, limit) if all(high > low for low, high in ranges) else []
+        if len(found) < limit:
+            seen = {doc for doc, _, _ in found}
+            found += [hit for hit in self._fuzzy(words, limit + len(seen)) if hit[0] not in seen][:limit - len(found)]
+        return [self._result(doc, score, match) for doc, score, match in found]
+
+    def _result(self, doc: int, score: float, match: str) -> Dict[str, Any]:
+        return {
+            "tpin": self._tpins[doc],
+            "name": self._names[doc],
+            "business_name": self._businesses[doc],
+            "score": round(score, 3),
+            "match": match,
+        }
+
+    def _search_tpin(self, digits: str, limit: int) -> List[Tuple[int, float, str]]:
+        start = bisect.bisect_left(self._sorted_tpins, digits)
+        found = []
+        for position in range(start, min(start + limit, len(self._sorted_tpins))):
+            if not self._sorted_tpins[position].startswith(digits):
+                break
+            found.append((self._by_tpin[position], SCORES["tpin"], "tpin"))
+        return [self._result(doc, score, match) for doc, score, match in found]
+
+    def _range(self, word: str, prefix: bool) -> Tuple[int, int]:
+        """Ranks of the terms equal to (or starting with) a word."""
+        low = bisect.bisect_left(self._terms, word)
+        if prefix:
+            return low, bisect.bisect_left(self._terms, word + _AFTER_WORDS, low)
+        return low, low + (low < len(self._terms) and self._terms[low] == word)
+
+    def _has_term(self, docs: np.ndarray, low: int, high: int) -> np.ndarray:
+        """Whether each taxpayer has one of the terms ranked low to high."""
+        starts = self._doc_offsets[docs]
+        lengths = self._doc_offsets[docs + 1] - starts
+        ends = np.cumsum(lengths)
+        positions = np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1])
+        terms = self._doc_terms[positions]
+        return np.logical_or.reduceat((terms >= low) & (terms < high), ends - lengths)
+
+    def _postings_of(self, low: int, high: int) -> np.ndarray:
+        """Sorted taxpayers having one of the terms ranked low to high."""
+        postings = self._postings[self._offsets[low]:self._offsets[high]]
+        # One term's postings are sorted and unique, a prefix range's are not
+        if high - low == 1:
+            return postings
+        if len(postings) * 16 < len(self._tpins):
+            return np.unique(postings)
+        has = np.zeros(len(self._tpins), dtype=bool)
+        has[postings] = True
+        return np.flatnonzero(has)
+
+    def _phrase_docs(self, phrase: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Taxpayers whose name or business name is, and starts with, a phrase."""
+        exact, prefix = [], []
+        for keys, docs in self._sorted_keys:
+            low = bisect.bisect_left(keys, phrase)
+            exact.append(docs[low:bisect.bisect_right(keys, phrase, low)])
+            prefix.append(docs[low:bisect.bisect_left(keys, phrase + _AFTER_WORDS, low)])
+        return np.concatenate(exact), np.concatenate(prefix)
+
+    def _match(self, words: List[str], ranges: List[Tuple[int, int]], limit: int) -> List[Tuple[int, float, str]]:
+        """Taxpayers having every word, ranked."""
+        # Start from the word with the fewest postings and narrow down with the others
+        sizes = [int(self._offsets[high] - self._offsets[low]) for low, high in ranges]
+        order = np.argsort(sizes, kind="stable")
+        low, high = ranges[order[0]]
+        docs = self._postings_of(low, high)
+        for i in order[1:]:
+            if not len(docs):
+                break
+            low, high = ranges[i]
+            if high - low == 1 or sizes[i] < len(docs) * self._terms_per_doc:
+                docs = np.intersect1d(docs, self._postings_of(low, high), assume_unique=True)
+            else:
+                docs = docs[self._has_term(docs, low, high)]
+        if not len(docs):
+            return []
+
+        # Rank every match: exact, then prefix, then the other words; shorter
+        # names first, then by name and by position in the registry
+        exact, prefix = self._phrase_docs(" ".join(words))
+        kinds = np.full(len(docs), 2, dtype=np.int8)
+        kinds[np.isin(docs, prefix)] = 1
+        kinds[np.isin(docs, exact)] = 0
+        best = np.lexsort((self._name_ranks[docs], self._name_lengths[docs], kinds))[:limit]
+        match_kinds = ("exact", "prefix", "words")
+        return [
+            (doc, SCORES[match_kinds[kind]], match_kinds[kind])
+            for doc, kind in zip(docs[best].tolist(), kinds[best].tolist())
+        ]
+
+    def _similar_terms(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ranks and similarity of the terms sharing most trigrams with a word."""
+        word_grams = trigrams(word)
+        gram_ids = [self._grams[gram] for gram in word_grams if gram in self._grams]
+        if not gram_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        hits = np.concatenate([self._gram_terms[self._gram_offsets[g]:self._gram_offsets[g + 1]] for g in gram_ids])
+        terms, common = np.unique(hits, return_counts=True)
+        similarity = 2 * common / (len(word_grams) + self._gram_counts[terms])
+        best = np.flatnonzero(similarity >= MIN_SIMILARITY)
+        best = best[np.argsort(-similarity[best], kind="stable")[:MAX_FUZZY_TERMS]]
+        return terms[best], similarity[best]
+
+    def _fuzzy(self, words: List[str], limit: int) -> List[Tuple[int, float, str]]:
+        """Taxpayers with terms spelled like the query words, by average similarity."""
+        all_docs, all_scores = [], []
+        for word in words:
+            terms, similarity = self._similar_terms(word)
+            docs, scores, taken = [], [], 0
+            for term, score in zip(terms.tolist(), similarity.tolist()):
+                postings = self._postings[self._offsets[term]:self._offsets[term + 1]][:MAX_CANDIDATES - taken]
+                docs.append(postings)
+                scores.append(np.full(len(postings), score))
+                taken += len(postings)
+                if taken >= MAX_CANDIDATES:
+                    break
+            if not docs:
+                continue
+            # Best similarity of each taxpayer for this word
+            docs, scores = np.concatenate(docs), np.concatenate(scores)
+            order = np.lexsort((-scores, docs))
+            docs, scores = docs[order], scores[order]
+            first = np.r_[True, docs[1:] != docs[:-1]]
+            all_docs.append(docs[first])
+            all_scores.append(scores[first])
+        if not all_docs:
+            return []
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)) / len(words)
+        best = np.argsort(-scores, kind="stable")[:limit]
+        return [(int(docs[i]), SCORES["fuzzy"] * float(scores[i]), "fuzzy") for i in best]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "taxpayers": len(self),
+            "terms": self.term_count,
+            "trigrams": len(self._grams),
+            "postings": int(len(self._postings)),
+        }
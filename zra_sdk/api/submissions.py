@@ -0,0 +1,224 @@
+"""
+Durable tax return submissions.
+
+Submissions are appended to a write-ahead log (one JSON record per line)
+by a single writer thread. Submissions that arrive while a write is in
+progress are committed together with one fsync (group commit), which keeps
+throughput high under filing-deadline load. Receipt numbers are assigned
+under an exclusive lock on the log after reading any records appended by
+other processes, so they are sequential and unique across workers sharing
+the file. Idempotency keys map to the record they first created, so a
+retried submission returns the original receipt.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the log is then safe for a single process only
+    fcntl = None
+
+
+def payload_digest(payload: Dict[str, Any]) -> str:
+    """Digest identifying the content of a submission."""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class _Pending:
+    """A submission waiting for the writer thread."""
+    __slots__ = ("payload", "key", "digest", "done", "record", "duplicate", "error")
+
+    def __init__(self, payload: Dict[str, Any], key: Optional[str]):
+        self.payload = payload
+        self.key = key
+        self.digest = payload_digest(payload)
+        self.done = threading.Event()
+        self.record: Optional[Dict[str, Any]] = None
+        self.duplicate = False
+        self.error: Optional[Exception] = None
+
+
+class SubmissionLog:
+    """Append-only, group-committed log of tax return submissions."""
+
+    def __init__(self, path: str, max_batch: int = 4096):
+        """
+        Open (or create) the log and replay it.
+
+        Args:
+            path: Log file
+            max_batch: Most submissions committed by one fsync
+        """
+        self.path = path
+        self.max_batch = max_batch
+        self._file = open(path, "a+b")
+        self._offset = 0
+        self._sequence = 0
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        with self._locked():
+            self._catch_up()
+        self._writer = threading.Thread(target=self._write_loop, name="zra-submission-log", daemon=True)
+        self._writer.start()
+
+    def __len__(self) -> int:
+        return self._sequence
+
+    def submit(self, payload: Dict[str, Any], key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Durably record a submission.
+
+        Args:
+            payload: The validated submission
+            key: Idempotency key; a repeated key returns the first record
+
+        Returns:
+            tuple: (record, duplicate), once the record is on disk
+
+        Raises:
+            ValueError: If the key was already used for a different payload
+        """
+        pending = _Pending(payload, key)
+        existing = self._index.get(key) if key else None
+        if existing is not None:
+            # Committed records never change, so no lock is needed
+            self._resolve(pending, existing)
+        else:
+            if not self._writer.is_alive():
+                raise RuntimeError("Submission log is closed")
+            self._queue.put(pending)
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.record, pending.duplicate
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Record created with an idempotency key, as seen by this process."""
+        return self._index.get(key)
+
+    def close(self) -> None:
+        """Commit queued submissions and close the log."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._file.close()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _catch_up(self) -> None:
+        """Replay records appended since the last read (by any process)."""
+        size = os.fstat(self._file.fileno()).st_size
+        if size <= self._offset:
+            return
+        self._file.seek(self._offset)
+        data = self._file.read(size - self._offset)
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._offset += complete
+        if complete < len(data):
+            # A torn write from a crash; the lock guarantees nobody is writing
+            self._file.truncate(self._offset)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        self._sequence = max(self._sequence, record["sequence"])
+        if record.get("idempotency_key"):
+            self._index[record["idempotency_key"]] = record
+
+    @staticmethod
+    def _resolve(pending: _Pending, existing: Dict[str, Any]) -> None:
+        if existing["digest"] != pending.digest:
+            pending.error = ValueError("Idempotency key was already used for a different submission")
+        else:
+            pending.record, pending.duplicate = existing, True
+
+    def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            # Everything that queued up during the previous fsync joins this commit
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                for pending in batch:
+                    if pending.record is None and pending.error is None:
+                        pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _commit(self, batch: List[_Pending]) -> None:
+        with self._locked():
+            self._catch_up()
+            sequence = self._sequence
+            submitted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            staged: Dict[str, Dict[str, Any]] = {}
+            records: List[Dict[str, Any]] = []
+            for pending in batch:
+                if pending.key:
+                    existing = staged.get(pending.key) or self._index.get(pending.key)
+                    if existing is not None:
+                        self._resolve(pending, existing)
+                        continue
+                sequence += 1
+                record = {
+                    "sequence": sequence,
+                    "submission_id": f"TRX{sequence:06d}",
+                    "receipt_number": f"ZRA{sequence:07d}",
+                    "idempotency_key": pending.key,
+                    "digest": pending.digest,
+                    "submitted_at": submitted_at,
+                    "payload": pending.payload,
+                }
+                if pending.key:
+                    staged[pending.key] = record
+                records.append(record)
+                pending.record = record
+
+            if not records:
+                return
+            data = "".join(json.dumps(record, default=str) + "\n" for record in records).encode("utf-8")
+            try:
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception:
+                self._file.truncate(self._offset)
+                for pending in batch:
+                    if pending.record is not None and pending.record["sequence"] > self._sequence:
+                        pending.record, pending.duplicate = None, False
+                raise
+            self._offset += len(data)
+            for record in records:
+                self._apply(record)
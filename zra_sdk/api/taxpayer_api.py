@@ -1,259 +1,169 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable
 from models.taxpayer import Taxpayer, TaxCalculation
 from utils.validators import validate_tpin
-import random
+from core.config import ZRAConfig
+from core.money import Money
+from core.tax_verification.exceptions import InvalidDocumentError, TPINNotFoundError
+from core.tax_verification.turnover import TurnoverTracker
+from core.tax_verification.verifier import TaxVerificationService
+from core.tax_verification.validators import validate_amount, validate_tax_period
+from api.recommendations import RecommendationEngine, DEFAULT_RULES
+from api.submissions import SubmissionLog
+from api.data_sources import DataSource, create_data_source
+from api.registry_filter import RegistryFilter
+from dataclasses import asdict
+import threading
 from datetime import datetime
 
-def verify_taxpayer(tpin: str) -> Taxpayer:
+_data_source: Optional[DataSource] = None
+_data_source_lock = threading.Lock()
+
+def get_data_source() -> DataSource:
+    """The configured data source (ZRA_DATA_SOURCE), created on first use"""
+    global _data_source
+    with _data_source_lock:
+        if _data_source is None:
+            _data_source = create_data_source(ZRAConfig.DATA_SOURCE, ZRAConfig.DATA_SOURCE_PATH)
+        return _data_source
+
+_registry_filter: Optional[RegistryFilter] = None
+_registry_filter_built = False
+
+def get_registry_filter() -> Optional[RegistryFilter]:
     """
-    Verify taxpayer information using TPIN
+    The registry filter, built from the data source on first use.
+    
+    None when disabled (ZRA_REGISTRY_FILTER_FPR=0) or when the data source
+    cannot list its records (http).
     """
+    global _registry_filter, _registry_filter_built
+    if _registry_filter_built:
+        return _registry_filter
+    source = get_data_source()
+    with _data_source_lock:
+        if not _registry_filter_built:
+            _registry_filter_built = True
+            if ZRAConfig.REGISTRY_FILTER_FPR > 0:
+                blocklist: List[str] = []
+                if ZRAConfig.TPIN_BLOCKLIST_FILE:
+                    with open(ZRAConfig.TPIN_BLOCKLIST_FILE, "r", encoding="utf-8") as fh:
+                        blocklist = [line.strip() for line in fh if line.strip()]
+                try:
+                    _registry_filter = RegistryFilter.from_data_source(
+                        source, blocklist, ZRAConfig.REGISTRY_FILTER_FPR
+                    )
+                    # Taxpayers loaded into the source later are let through too
+                    source.subscribe(_registry_filter.add)
+                except NotImplementedError:
+                    _registry_filter = None
+        return _registry_filter
+
+def _check_tpin(tpin: str) -> None:
     if not validate_tpin(tpin):
         raise ValueError("Invalid TPIN format. Must be 9 digits.")
+
+def check_registered(tpin: str) -> None:
+    """
+    Reject a TPIN before any lookup: malformed, or not registered or
+    blacklisted according to the registry filter.
     
-    # Mock database of taxpayers
-    taxpayer_database = {
-        "123456789": {
-            "tpin": "123456789",
-            "name": "John Banda",
-            "business_name": "Banda Enterprises Ltd",
-            "email": "john.banda@bandaenterprises.co.zm",
-            "phone": "+260977123456",
-            "status": "Active",
-            "registration_date": "2022-01-15",
-            "last_filing_date": "2024-01-10",
-            "tax_center": "Lusaka"
-        },
-        "111222333": {
-            "tpin": "111222333",
-            "name": "Pollard Samba",
-            "business_name": "Samba Tech Solutions",
-            "email": "pollard.samba@sambatech.co.zm",
-            "phone": "+260966789123",
-            "status": "Active",
-            "registration_date": "2021-03-20",
-            "last_filing_date": "2024-02-15",
-            "tax_center": "Ndola"
-        },
-        "444555666": {
-            "tpin": "444555666",
-            "name": "Ebenezer Kaluba",
-            "business_name": "Kaluba Holdings Limited",
-            "email": "e.kaluba@kalubaholdings.co.zm",
-            "phone": "+260955456789",
-            "status": "Active",
-            "registration_date": "2020-11-08",
-            "last_filing_date": "2024-03-01",
-            "tax_center": "Kitwe"
-        },
-        "777888999": {
-            "tpin": "777888999",
-            "name": "Saviour Silwamba",
-            "business_name": "Silwamba Legal Practitioners",
-            "email": "saviour@silwambalaw.co.zm",
-            "phone": "+260978321654",
-            "status": "Active",
-            "registration_date": "2019-07-12",
-            "last_filing_date": "2024-01-25",
-            "tax_center": "Lusaka"
-        },
-        "222333444": {
-            "tpin": "222333444",
-            "name": "Pethias Kasempa",
-            "business_name": "Kasempa Mining Supplies",
-            "email": "p.kasempa@kasempamining.co.zm",
-            "phone": "+260967852741",
-            "status": "Active",
-            "registration_date": "2023-05-30",
-            "last_filing_date": "2024-02-28",
-            "tax_center": "Chingola"
-        },
-        "555666777": {
-            "tpin": "555666777",
-            "name": "Lawrence Thor",
-            "business_name": "ThorLabs Innovations",
-            "email": "lawrence.thor@thorlabs.co.zm",
-            "phone": "+260965123789",
-            "status": "Active",
-            "registration_date": "2022-09-14",
-            "last_filing_date": "2024-03-10",
-            "tax_center": "Livingstone"
-        }
-    }
-    
-    if tpin in taxpayer_database:
-        mock_response = taxpayer_database[tpin]
-    else:
-        mock_response = {
-            "tpin": tpin,
-            "name": "Taxpayer Name",
-            "business_name": "Registered Business",
-            "email": f"taxpayer{tpin}@business.co.zm",
-            "phone": "+260900000000",
-            "status": "Active",
-            "registration_date": "2023-01-01",
-            "last_filing_date": "2024-01-01",
-            "tax_center": "Lusaka"
-        }
+    Raises:
+        ValueError: If the TPIN format is invalid
+        TPINNotFoundError: If the TPIN is not registered or is blacklisted
+    """
+    _check_tpin(tpin)
+    registry = get_registry_filter()
+    if registry is not None:
+        registry.check(tpin)
+
+def _not_found(tpin: str) -> TPINNotFoundError:
+    """Error for a TPIN the data source does not know"""
+    registry = get_registry_filter()
+    if registry is not None:
+        registry.record_false_positive()
+    return TPINNotFoundError(f"TPIN {tpin} not found")
+
+def verify_taxpayer(tpin: str) -> Taxpayer:
+    """
+    Verify taxpayer information using TPIN
     
-    return Taxpayer.from_json(mock_response)
+    Raises:
+        ValueError: If the TPIN format is invalid
+        TPINNotFoundError: If the TPIN is not registered or is blacklisted
+    """
+    check_registered(tpin)
+    record = get_data_source().get(tpin)
+    if record is None:
+        raise _not_found(tpin)
+    return Taxpayer.from_json(record)
+
+# Identifies the bands and rates below (and in api.tax_engine); change it
+# whenever they change so cached calculations are invalidated
+TAX_SCHEDULE_VERSION = "2024.1"
 
 def calculate_tax(income: float, tax_type: str = "income") -> TaxCalculation:
     """
     Calculate tax amount based on income and tax type
+    
+    Amounts are computed in whole ngwee; each band's tax is rounded half up.
     """
     if income < 0:
         raise ValueError("Income must be positive")
     
+    amount = Money.from_kwacha(income)
     if tax_type == "income":
-        if income <= 4800:
-            tax_amount = 0
-        elif income <= 6000:
-            tax_amount = (income - 4800) * 0.25
-        elif income <= 12000:
-            tax_amount = 300 + (income - 6000) * 0.30
+        # Band limits in ngwee (ZMW 4,800 / 6,000 / 12,000)
+        if amount <= Money(480_000):
+            tax = Money(0)
+        elif amount <= Money(600_000):
+            tax = (amount - Money(480_000)).apply_rate("0.25")
+        elif amount <= Money(1_200_000):
+            tax = Money(30_000) + (amount - Money(600_000)).apply_rate("0.30")
         else:
-            tax_amount = 2100 + (income - 12000) * 0.37
+            tax = Money(210_000) + (amount - Money(1_200_000)).apply_rate("0.37")
     else:
-        tax_amount = income * 0.16
+        tax = amount.apply_rate("0.16")
     
     return TaxCalculation(
         gross_income=income,
         taxable_income=income,
-        tax_amount=round(tax_amount, 2),
-        tax_breakdown={"base_tax": tax_amount},
-        effective_tax_rate=round((tax_amount / income) * 100, 2) if income > 0 else 0
+        tax_amount=tax.to_kwacha(),
+        tax_breakdown={"base_tax": tax.to_kwacha()},
+        effective_tax_rate=round(tax.ratio(amount) * 100, 2) if amount > 0 else 0
     )
 
 def check_compliance(tpin: str) -> Dict[str, Any]:
     """
     Check taxpayer compliance status
-    """
-    if not validate_tpin(tpin):
-        raise ValueError("Invalid TPIN format. Must be 9 digits.")
     
-    compliance_data = {
-        "123456789": {
-            "compliance_status": "Fully Compliant",
-            "compliance_score": 95,
-            "outstanding_returns": 0,
-            "outstanding_payments": 0.0,
-            "last_audit_date": "2023-11-15",
-            "next_audit_due": "2024-11-15",
-            "risk_level": "Low",
-            "compliance_issues": [],
-            "penalties": 0.0
-        },
-        "111222333": {
-            "compliance_status": "Mostly Compliant",
-            "compliance_score": 78,
-            "outstanding_returns": 1,
-            "outstanding_payments": 1500.0,
-            "last_audit_date": "2023-09-20",
-            "next_audit_due": "2024-09-20",
-            "risk_level": "Medium",
-            "compliance_issues": ["Q4 2023 VAT Return overdue"],
-            "penalties": 250.0
-        },
-        "444555666": {
-            "compliance_status": "Non-Compliant",
-            "compliance_score": 45,
-            "outstanding_returns": 3,
-            "outstanding_payments": 12500.0,
-            "last_audit_date": "2022-12-10",
-            "next_audit_due": "2024-06-10",
-            "risk_level": "High",
-            "compliance_issues": [
-                "Q3 2023 Income Tax overdue",
-                "Q4 2023 VAT Return overdue", 
-                "Q1 2024 PAYE Return overdue"
-            ],
-            "penalties": 1800.0
-        },
-        "777888999": {
-            "compliance_status": "Fully Compliant", 
-            "compliance_score": 98,
-            "outstanding_returns": 0,
-            "outstanding_payments": 0.0,
-            "last_audit_date": "2024-01-05",
-            "next_audit_due": "2025-01-05",
-            "risk_level": "Low",
-            "compliance_issues": [],
-            "penalties": 0.0
-        },
-        "222333444": {
-            "compliance_status": "Under Review",
-            "compliance_score": 65,
-            "outstanding_returns": 2,
-            "outstanding_payments": 7500.0,
-            "last_audit_date": "2023-08-15",
-            "next_audit_due": "2024-08-15", 
-            "risk_level": "Medium",
-            "compliance_issues": [
-                "Q4 2023 Income Tax overdue",
-                "Discrepancy in Q1 2024 filing"
-            ],
-            "penalties": 500.0
-        },
-        "555666777": {
-            "compliance_status": "Mostly Compliant",
-            "compliance_score": 82,
-            "outstanding_returns": 0,
-            "outstanding_payments": 3200.0,
-            "last_audit_date": "2023-10-22",
-            "next_audit_due": "2024-10-22",
-            "risk_level": "Low",
-            "compliance_issues": ["Outstanding VAT payment"],
-            "penalties": 150.0
-        }
-    }
-    
-    if tpin in compliance_data:
-        return compliance_data[tpin]
-    else:
-        status_options = ["Fully Compliant", "Mostly Compliant", "Non-Compliant", "Under Review"]
-        risk_options = ["Low", "Medium", "High"]
-        
-        return {
-            "compliance_status": random.choice(status_options),
-            "compliance_score": random.randint(30, 95),
-            "outstanding_returns": random.randint(0, 4),
-            "outstanding_payments": round(random.uniform(0, 20000), 2),
-            "last_audit_date": "2023-12-01",
-            "next_audit_due": "2024-12-01",
-            "risk_level": random.choice(risk_options),
-            "compliance_issues": ["No data available"] if random.random() > 0.5 else [],
-            "penalties": round(random.uniform(0, 1000), 2)
-        }
+    Raises:
+        ValueError: If the TPIN format is invalid
+        TPINNotFoundError: If the TPIN is not registered or is blacklisted,
+            or has no compliance record
+    """
+    check_registered(tpin)
+    record = get_data_source().get_compliance(tpin)
+    if record is None:
+        raise _not_found(tpin)
+    return record
+
+# Recommendation rules are compiled once, from ZRA_RECOMMENDATION_RULES_FILE if set
+recommendation_engine = (
+    RecommendationEngine.from_file(ZRAConfig.RECOMMENDATION_RULES_FILE)
+    if ZRAConfig.RECOMMENDATION_RULES_FILE
+    else RecommendationEngine(DEFAULT_RULES)
+)
 
 def generate_compliance_recommendations(compliance_data: Dict) -> List[str]:
     """Generate recommendations based on compliance status"""
-    recommendations = []
-    
-    if compliance_data["outstanding_returns"] > 0:
-        recommendations.append(f"Submit {compliance_data['outstanding_returns']} outstanding tax returns")
-    
-    if compliance_data["outstanding_payments"] > 0:
-        recommendations.append(f"Clear outstanding payment of ZMW {compliance_data['outstanding_payments']:,.2f}")
-    
-    if compliance_data["compliance_score"] < 70:
-        recommendations.append("Schedule meeting with tax consultant to review compliance status")
-    
-    if compliance_data["risk_level"] == "High":
-        recommendations.append("Urgent: Address compliance issues to avoid penalties")
-    
-    if not recommendations:
-        recommendations.append("Maintain current compliance practices")
-    
-    return recommendations
+    return recommendation_engine.evaluate(compliance_data)
 
-def get_compliance_report(tpin: str) -> Dict[str, Any]:
-    """
-    Generate a comprehensive compliance report
-    """
-    taxpayer = verify_taxpayer(tpin)
-    compliance = check_compliance(tpin)
-    
+def _build_report(
+    taxpayer: Taxpayer,
+    compliance: Dict[str, Any],
+    report_generated: str
+) -> Dict[str, Any]:
+    """Assemble the compliance report of one taxpayer"""
     return {
         "taxpayer_info": {
             "name": taxpayer.name,
@@ -263,15 +173,174 @@ def get_compliance_report(tpin: str) -> Dict[str, Any]:
         },
         "compliance_summary": compliance,
         "recommendations": generate_compliance_recommendations(compliance),
-        "report_generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "report_generated": report_generated
     }
 
-def submit_tax_return(tax_data: Dict) -> Dict:
-    """Submit tax return data"""
+def get_compliance_report(tpin: str) -> Dict[str, Any]:
+    """
+    Generate a comprehensive compliance report
+    """
+    return _build_report(
+        verify_taxpayer(tpin),
+        check_compliance(tpin),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    )
+
+def _lookup_batch(tpins: Iterable[str], taxpayers: bool = True, compliance: bool = True):
+    """
+    Validate a batch of TPINs and fetch their records with one bulk lookup each.
+    
+    TPINs the registry filter rejects are not looked up.
+    
+    Returns:
+        tuple: (tpins in input order, {tpin: error} for invalid or unknown
+            TPINs, {tpin: Taxpayer}, {tpin: compliance dict}) for the TPINs found
+    """
+    tpins = list(tpins)
+    errors: Dict[str, str] = {}
+    valid: List[str] = []
+    for tpin in dict.fromkeys(tpins):
+        try:
+            _check_tpin(tpin)
+            valid.append(tpin)
+        except ValueError as e:
+            errors[tpin] = str(e)
+    
+    registry = get_registry_filter()
+    if registry is not None and valid:
+        allowed = registry.allowed_many(valid)
+        for tpin in (tpin for tpin, ok in zip(valid, allowed) if not ok):
+            errors[tpin] = registry.reason(tpin)
+        valid = [tpin for tpin, ok in zip(valid, allowed) if ok]
+    
+    source = get_data_source()
+    taxpayer_records = source.get_many(valid) if taxpayers else {}
+    compliance_records = source.get_compliance_many(valid) if compliance else {}
+    found = [
+        tpin for tpin in valid
+        if (not taxpayers or tpin in taxpayer_records) and (not compliance or tpin in compliance_records)
+    ]
+    for tpin in set(valid).difference(found):
+        errors[tpin] = str(_not_found(tpin))
+    return (
+        tpins,
+        errors,
+        {tpin: Taxpayer.from_json(taxpayer_records[tpin]) for tpin in found} if taxpayers else {},
+        {tpin: compliance_records[tpin] for tpin in found} if compliance else {}
+    )
+
+def generate_reports(tpins: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Generate compliance reports for a batch of TPINs, e.g. a whole tax center.
+    
+    The batch shares one generation timestamp and one bulk data source
+    lookup per record type. A TPIN that fails validation gets
+    {"tpin", "error"} instead of a report, so one bad entry does not abort
+    the batch.
+    """
+    report_generated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tpins, errors, taxpayers, compliance = _lookup_batch(tpins)
+    reports: Dict[str, Dict[str, Any]] = {}
+    for tpin in taxpayers:
+        reports[tpin] = _build_report(taxpayers[tpin], compliance[tpin], report_generated)
+    return [
+        reports[tpin] if tpin in reports else {"tpin": tpin, "error": errors[tpin]}
+        for tpin in tpins
+    ]
+
+def verify_taxpayers(tpins: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Verify a batch of TPINs with one bulk data source lookup.
+    
+    Returns one row per TPIN: the taxpayer fields plus an empty "error",
+    or {"tpin", "error"} when verification fails.
+    """
+    tpins, errors, taxpayers, _ = _lookup_batch(tpins, compliance=False)
+    return [
+        {**asdict(taxpayers[tpin]), "error": ""} if tpin in taxpayers else {"tpin": tpin, "error": errors[tpin]}
+        for tpin in tpins
+    ]
+
+def check_compliance_many(tpins: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Check compliance for a batch of TPINs with one bulk data source lookup.
+    
+    Returns one row per TPIN: the TPIN and compliance fields plus an empty
+    "error", or {"tpin", "error"} when the check fails.
+    """
+    tpins, errors, _, compliance = _lookup_batch(tpins, taxpayers=False)
+    return [
+        {"tpin": tpin, **compliance[tpin], "error": ""} if tpin in compliance else {"tpin": tpin, "error": errors[tpin]}
+        for tpin in tpins
+    ]
+
+_submission_log: Optional[SubmissionLog] = None
+_submission_log_lock = threading.Lock()
+
+def get_submission_log() -> SubmissionLog:
+    """The shared submission log, opened on first use"""
+    global _submission_log
+    with _submission_log_lock:
+        if _submission_log is None:
+            _submission_log = SubmissionLog(ZRAConfig.SUBMISSION_LOG)
+        return _submission_log
+
+_turnover_tracker: Optional[TurnoverTracker] = None
+_turnover_tracker_lock = threading.Lock()
+
+def get_turnover_tracker() -> TurnoverTracker:
+    """The shared VAT turnover tracker, with ZRA_VAT_REGISTER_FILE loaded on first use"""
+    global _turnover_tracker
+    with _turnover_tracker_lock:
+        if _turnover_tracker is None:
+            _turnover_tracker = TurnoverTracker()
+            if ZRAConfig.VAT_REGISTER_FILE:
+                _turnover_tracker.load_registrations(ZRAConfig.VAT_REGISTER_FILE)
+        return _turnover_tracker
+
+_verification_service: Optional[TaxVerificationService] = None
+_verification_service_lock = threading.Lock()
+
+def get_verification_service() -> TaxVerificationService:
+    """The shared verification service, checking VAT registration against get_turnover_tracker()"""
+    global _verification_service
+    with _verification_service_lock:
+        if _verification_service is None:
+            _verification_service = TaxVerificationService(turnover=get_turnover_tracker())
+        return _verification_service
+
+def submit_tax_return(tax_data: Dict, idempotency_key: Optional[str] = None) -> Dict:
+    """
+    Submit tax return data
+    
+    The return needs a tpin, a tax_period (YYYY-MM) and an amount. It is
+    recorded durably before this returns; resubmitting with the same
+    idempotency key returns the original receipt instead of filing twice.
+    
+    Raises:
+        ValueError: If the return is invalid, or the idempotency key was
+            already used for a different return
+    """
+    tpin = tax_data.get("tpin")
+    if not validate_tpin(tpin):
+        raise ValueError("Invalid TPIN format. Must be 9 digits.")
+    tax_period = tax_data.get("tax_period")
+    if not isinstance(tax_period, str):
+        raise ValueError("Tax period is required in YYYY-MM format")
+    try:
+        validate_tax_period(tax_period)
+    except InvalidDocumentError as e:
+        raise ValueError(str(e))
+    validate_amount(tax_data.get("amount"))
+    
+    record, duplicate = get_submission_log().submit(
+        tax_data, idempotency_key or tax_data.get("idempotency_key")
+    )
     return {
         "success": True,
-        "submission_id": f"TRX{random.randint(100000, 999999)}",
-        "message": "Tax return submitted successfully",
-        "submission_date": datetime.now().strftime("%Y-%m-%d"),
-        "receipt_number": f"ZRA{random.randint(1000000, 9999999)}"
-    }
\ No newline at end of file
+        "submission_id": record["submission_id"],
+        "message": "Tax return already submitted" if duplicate else "Tax return submitted successfully",
+        "submission_date": record["submitted_at"][:10],
+        "receipt_number": record["receipt_number"],
+        "duplicate": duplicate
+    }
@@ -0,0 +1,566 @@
+"""
+VAT invoice ingestion.
+
+Supplier/buyer invoice files (CSV or JSON lines) are read in chunks. Each
+chunk is parsed into int64 arrays, VAT is computed for the whole chunk at
+once in ngwee (core.money), and the chunk's new invoices are reduced to
+totals per (TPIN, period) before being merged into a VATLedger. The supplier
+of an invoice owes its VAT as output VAT; a registered buyer may claim it as
+input VAT. An invoice is identified by its supplier and invoice number, and
+one the ledger has already counted is skipped as a duplicate. Chunks can be
+parsed in worker processes; the totals are exact integer sums.
+"""
+import csv
+import hashlib
+import itertools
+import json
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from fractions import Fraction
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.money import Money, divide_rounded, to_ngwee
+from core.tax_verification.turnover import TurnoverTracker
+from utils.validators import validate_tpin
+
+INVOICE_COLUMNS = [
+    "invoice_number", "supplier_tpin", "buyer_tpin", "invoice_date", "amount", "pricing", "vat_rate",
+]
+LIABILITY_COLUMNS = [
+    "tpin", "period", "output_vat", "input_vat", "net_vat", "sales", "purchases",
+    "invoices_issued", "invoices_received",
+]
+STANDARD_VAT_RATE = "0.16"
+DEFAULT_CHUNK_SIZE = 100_000
+MAX_ERRORS = 100
+
+# Rates are held in basis points; invoice amounts (ZMW) are capped so that
+# amount * rate stays within int64
+RATE_SCALE = 10_000
+MAX_INVOICE_AMOUNT = 10 ** 11
+
+# Columns of the per-(TPIN, period) totals, all int64 (amounts in ngwee)
+OUTPUT_VAT, INPUT_VAT, SALES, PURCHASES, ISSUED, RECEIVED = range(6)
+_TOTAL_COLUMNS = 6
+
+_PERIOD_SPAN = 1_000_000  # key = tpin * _PERIOD_SPAN + YYYYMM
+_NO_BUYER = -1
+_DATE = re.compile(r"^(\d{4})-(0[1-9]|1[0-2])(-\d{2})?")
+_UNREADABLE = "_unreadable"  # key of the stand-in row for a line that could not be decoded
+
+
+@dataclass
+class InvoiceBatch:
+    """A parsed chunk of invoices; amounts in ngwee, excluding VAT"""
+    supplier: np.ndarray  # int64 TPIN
+    buyer: np.ndarray     # int64 TPIN, -1 for sales to unregistered buyers
+    period: np.ndarray    # int64 YYYYMM
+    net: np.ndarray
+    vat: np.ndarray
+    invoice: np.ndarray   # int64 id of (supplier, invoice number), see invoice_id
+    number: np.ndarray    # invoice numbers (object array of str)
+    row: np.ndarray       # int64 index of each invoice in its chunk
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.supplier)
+
+    def select(self, keep: np.ndarray, errors: List[Dict[str, Any]]) -> "InvoiceBatch":
+        """The invoices where keep is True, with more errors added in row order."""
+        return InvoiceBatch(
+            self.supplier[keep], self.buyer[keep], self.period[keep], self.net[keep], self.vat[keep],
+            self.invoice[keep], self.number[keep], self.row[keep],
+            sorted(self.errors + errors, key=lambda error: error["row"])
+        )
+
+
+def invoice_id(supplier_tpin: int, number: str) -> int:
+    """
+    A 64-bit id of an invoice, from its supplier and invoice number.
+
+    Ids are hashes, so holding every invoice seen takes 8 bytes each. The
+    chance that any two of ten million invoices share an id is about 3 in a
+    million.
+    """
+    digest = hashlib.blake2b(f"{supplier_tpin:09d}/{number}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class InvoiceIds:
+    """
+    A set of invoice ids, held as sorted runs.
+
+    A run is merged into the one before it once it is at least half its
+    size, so there are O(log n) runs and each id is merged O(log n) times.
+    """
+
+    def __init__(self):
+        self._runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self._runs)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Whether each id is in the set."""
+        found = np.zeros(len(ids), dtype=bool)
+        for run in self._runs:
+            position = np.minimum(np.searchsorted(run, ids), len(run) - 1)
+            found |= run[position] == ids
+        return found
+
+    def add(self, ids: np.ndarray) -> None:
+        """Add ids that are not in the set yet."""
+        if not len(ids):
+            return
+        self._runs.append(np.sort(ids))
+        while len(self._runs) > 1 and 2 * len(self._runs[-1]) >= len(self._runs[-2]):
+            last = self._runs.pop()
+            self._runs[-1] = np.sort(np.concatenate([self._runs[-1], last]), kind="stable")
+
+    def update(self, other: "InvoiceIds") -> None:
+        """Add the ids of another set with none in common."""
+        for run in other._runs:
+            self.add(run)
+
+
+# A block of raw input lines: (CSV header fields, or None for JSON lines, lines)
+LineBlock = Tuple[Optional[List[str]], List[str]]
+
+
+def iter_invoice_blocks(lines: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[LineBlock]:
+    """
+    Split invoice input into blocks of lines without parsing them.
+
+    The input is JSON lines if its first non-blank line starts with "{",
+    otherwise CSV with a header naming the INVOICE_COLUMNS and one invoice
+    per line. Blocks are cheap to send to worker processes, which decode
+    them with decode_block.
+    """
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip()), None)
+    if first is None:
+        return
+    header = None
+    if first.lstrip().startswith("{"):
+        lines = itertools.chain([first], lines)
+    else:
+        header = next(csv.reader([first]))
+
+    while True:
+        block = list(itertools.islice(lines, chunk_size))
+        if not block:
+            return
+        yield header, block
+
+
+def decode_block(block: LineBlock) -> List[dict]:
+    """
+    Decode a block of lines into invoice rows.
+
+    A line that cannot be decoded becomes a stand-in row, which
+    parse_invoices reports as an error, so one bad line does not stop the
+    rest of the input.
+    """
+    header, lines = block
+    if header is None:
+        return [_decode_json(line) for line in lines if line.strip()]
+    try:
+        return list(csv.DictReader(lines, fieldnames=header))
+    except csv.Error:
+        rows = []
+        for line in lines:
+            try:
+                rows.extend(csv.DictReader([line], fieldnames=header))
+            except csv.Error as e:
+                rows.append({_UNREADABLE: f"Invalid CSV line: {e}"})
+        return rows
+
+
+def _decode_json(line: str) -> dict:
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        return {_UNREADABLE: f"Invalid JSON line: {e}"}
+    if not isinstance(row, dict):
+        return {_UNREADABLE: "Invalid JSON line: not an object"}
+    return row
+
+
+def iter_invoice_chunks(lines: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    """Read invoices (CSV or JSON lines, see iter_invoice_blocks) in chunks of rows."""
+    for block in iter_invoice_blocks(lines, chunk_size):
+        yield decode_block(block)
+
+
+def _tpin(value: Any) -> Optional[int]:
+    value = str(value).strip() if value is not None else ""
+    if len(value) == 9 and value.isdigit():
+        return int(value)
+    if not validate_tpin(value):
+        return None
+    return int(re.sub(r"[\s-]", "", value))
+
+
+def _rate(value: Any) -> Optional[int]:
+    """A VAT rate (e.g. "0.16") in basis points, None if invalid."""
+    try:
+        rate = Fraction(str(value).strip()) * RATE_SCALE
+    except (ValueError, ZeroDivisionError):
+        return None
+    if rate.denominator != 1 or not 0 <= rate < RATE_SCALE:
+        return None
+    return int(rate)
+
+
+_STANDARD_RATE = _rate(STANDARD_VAT_RATE)
+
+
+def compute_vat(amount: np.ndarray, rate: np.ndarray, inclusive: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split invoice amounts into net amount and VAT.
+
+    Args:
+        amount: int64 invoice amounts in ngwee
+        rate: int64 VAT rates in basis points
+        inclusive: True where the amount includes VAT
+
+    Returns:
+        tuple: (net, vat) int64 arrays in ngwee, VAT rounded half up
+    """
+    amount = np.asarray(amount, dtype=np.int64)
+    rate = np.asarray(rate, dtype=np.int64)
+    denominator = np.where(inclusive, RATE_SCALE + rate, RATE_SCALE)
+    vat = divide_rounded(amount * rate, denominator)
+    net = np.where(inclusive, amount - vat, amount)
+    return net, vat
+
+
+def parse_invoices(rows: List[dict]) -> InvoiceBatch:
+    """
+    Parse and validate a chunk of invoice rows, computing their VAT.
+
+    Rows that are not objects or could not be decoded, and rows with no
+    invoice number or an invalid supplier or buyer TPIN, date, amount,
+    pricing or rate, are left out and reported in ``errors`` with their index
+    in the chunk. A blank buyer TPIN is a sale to an unregistered buyer.
+    Negative amounts (credit notes) reduce VAT.
+    """
+    n = len(rows)
+    supplier = np.empty(n, dtype=np.int64)
+    buyer = np.empty(n, dtype=np.int64)
+    period = np.empty(n, dtype=np.int64)
+    amount = np.empty(n, dtype=np.float64)
+    rate = np.empty(n, dtype=np.int64)
+    inclusive = np.empty(n, dtype=bool)
+    invoice = np.empty(n, dtype=np.int64)
+    number = np.empty(n, dtype=object)
+    keep = np.ones(n, dtype=bool)
+    errors: List[Dict[str, Any]] = []
+
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or _UNREADABLE in row:
+            keep[i] = False
+            error = row[_UNREADABLE] if isinstance(row, dict) else "Invalid row: not an object"
+            errors.append({"row": i, "invoice_number": None, "error": error})
+            continue
+        error = None
+        invoice_number = str(row.get("invoice_number") or "").strip()
+        supplier_tpin = _tpin(row.get("supplier_tpin"))
+        buyer_value = row.get("buyer_tpin")
+        buyer_tpin = _NO_BUYER if buyer_value in (None, "") else _tpin(buyer_value)
+        date = _DATE.match(str(row.get("invoice_date") or ""))
+        pricing = str(row.get("pricing") or "exclusive").strip().lower()
+        rate_value = row.get("vat_rate")
+        row_rate = _STANDARD_RATE if rate_value in (None, "") else _rate(rate_value)
+        try:
+            value = float(row.get("amount"))
+        except (TypeError, ValueError):
+            value = math.nan
+
+        if not invoice_number:
+            error = "Missing invoice number"
+        elif supplier_tpin is None:
+            error = f"Invalid supplier TPIN: {row.get('supplier_tpin')}"
+        elif buyer_tpin is None:
+            error = f"Invalid buyer TPIN: {buyer_value}"
+        elif date is None:
+            error = f"Invalid invoice date: {row.get('invoice_date')}"
+        elif not abs(value) <= MAX_INVOICE_AMOUNT:
+            error = f"Invalid amount: {row.get('amount')}"
+        elif pricing not in ("exclusive", "inclusive"):
+            error = f"Invalid pricing: {row.get('pricing')} (use exclusive or inclusive)"
+        elif row_rate is None:
+            error = f"Invalid VAT rate: {rate_value}"
+
+        if error:
+            keep[i] = False
+            errors.append({"row": i, "invoice_number": row.get("invoice_number"), "error": error})
+            continue
+        supplier[i] = supplier_tpin
+        buyer[i] = buyer_tpin
+        period[i] = int(date.group(1)) * 100 + int(date.group(2))
+        amount[i] = value
+        rate[i] = row_rate
+        inclusive[i] = pricing == "inclusive"
+        invoice[i] = invoice_id(supplier_tpin, invoice_number)
+        number[i] = invoice_number
+
+    net, vat = compute_vat(to_ngwee(amount[keep]), rate[keep], inclusive[keep])
+    return InvoiceBatch(supplier[keep], buyer[keep], period[keep], net, vat,
+                        invoice[keep], number[keep], np.flatnonzero(keep), errors)
+
+
+def aggregate(batch: InvoiceBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a batch to totals per (TPIN, period).
+
+    Returns:
+        tuple: (keys, totals); sorted unique int64 keys and an int64 array
+            with one row of OUTPUT_VAT..RECEIVED totals per key
+    """
+    registered = batch.buyer != _NO_BUYER
+    n_out, n_in = len(batch), int(registered.sum())
+    keys = np.concatenate([
+        batch.supplier * _PERIOD_SPAN + batch.period,
+        batch.buyer[registered] * _PERIOD_SPAN + batch.period[registered],
+    ])
+    values = np.zeros((n_out + n_in, _TOTAL_COLUMNS), dtype=np.int64)
+    values[:n_out, OUTPUT_VAT] = batch.vat
+    values[:n_out, SALES] = batch.net
+    values[:n_out, ISSUED] = 1
+    values[n_out:, INPUT_VAT] = batch.vat[registered]
+    values[n_out:, PURCHASES] = batch.net[registered]
+    values[n_out:, RECEIVED] = 1
+
+    return _reduce(keys, values)
+
+
+def _reduce(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum rows of values over equal keys; returns sorted unique keys."""
+    if not len(keys):
+        return keys, values
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(values[order], starts, axis=0)
+
+
+def process_chunk(rows: List[dict]) -> Tuple[InvoiceBatch, int]:
+    """Parse one chunk; returns (batch, rows read)."""
+    return parse_invoices(rows), len(rows)
+
+
+def process_block(block: LineBlock) -> Tuple[InvoiceBatch, int]:
+    """Decode and parse one block of lines (see process_chunk)."""
+    return process_chunk(decode_block(block))
+
+
+class VATLedger:
+    """
+    Running VAT totals per TPIN and period, merged from invoice chunks.
+
+    Merged chunks are buffered and merge-sorted into the totals once they
+    outgrow them (as fraud.carousel.InvoiceGraphBuilder does with edges), or
+    when the totals are read, so a long ingest costs O(n log n) overall.
+    """
+
+    def __init__(self, turnover: Optional[TurnoverTracker] = None):
+        """
+        Args:
+            turnover: Optional tracker fed with each supplier's sales, to
+                catch unregistered businesses crossing the VAT threshold
+        """
+        self.turnover = turnover
+        self._keys = np.empty(0, dtype=np.int64)
+        self._totals = np.empty((0, _TOTAL_COLUMNS), dtype=np.int64)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._pending_size = 0
+        self._invoices = InvoiceIds()
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()  # one ingest at a time, so duplicates are seen
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._combine()
+            return len(self._keys)
+
+    @property
+    def invoices(self) -> int:
+        """Number of invoices counted."""
+        with self._lock:
+            return len(self._invoices)
+
+    def merge(self, keys: np.ndarray, totals: np.ndarray) -> List[str]:
+        """
+        Add the totals of a reduced chunk (see aggregate). Invoices are not
+        checked for duplicates here; ingest and add_result do that.
+
+        Returns:
+            list: TPINs whose sales just crossed the VAT registration
+                threshold while unregistered (only with a turnover tracker)
+        """
+        breaches: List[str] = []
+        if self.turnover is not None:
+            sellers = totals[:, ISSUED] > 0
+            tpins, periods = np.divmod(keys[sellers], _PERIOD_SPAN)
+            breaches = self.turnover.add_sales(
+                [f"{tpin:09d}" for tpin in tpins.tolist()], periods, totals[sellers, SALES]
+            )
+        if not len(keys):
+            return breaches
+        with self._lock:
+            self._pending.append((keys, totals))
+            self._pending_size += len(keys)
+            # Merge once the pending rows outgrow the totals
+            if self._pending_size > 2 * max(len(self._keys), 1024):
+                self._combine()
+        return breaches
+
+    def _combine(self) -> None:
+        """Merge the pending chunks into the totals. Caller holds the lock."""
+        if not self._pending:
+            return
+        keys, totals = zip(*self._pending)
+        self._keys, self._totals = _reduce(np.concatenate((self._keys,) + keys),
+                                           np.concatenate((self._totals,) + totals))
+        self._pending, self._pending_size = [], 0
+
+    def _new_invoices(self, batch: InvoiceBatch, *uncommitted: InvoiceIds) -> InvoiceBatch:
+        """
+        Leave out invoices already counted, in an uncommitted upload, or
+        earlier in the batch, reporting them as errors.
+        """
+        keep = np.zeros(len(batch), dtype=bool)
+        keep[np.unique(batch.invoice, return_index=True)[1]] = True
+        with self._lock:
+            keep &= ~self._invoices.contains(batch.invoice)
+        for ids in uncommitted:
+            keep &= ~ids.contains(batch.invoice)
+        duplicates = [
+            {"row": int(batch.row[i]), "invoice_number": batch.number[i],
+             "error": f"Duplicate invoice {batch.number[i]} from supplier {int(batch.supplier[i]):09d}"}
+            for i in np.flatnonzero(~keep).tolist()
+        ]
+        return batch.select(keep, duplicates) if duplicates else batch
+
+    def ingest(self, chunks: Iterable[List[dict]]) -> Dict[str, Any]:
+        """
+        Parse chunks of invoice rows, and merge them once all are read.
+
+        An input that fails part way (e.g. a broken upload) leaves the ledger
+        unchanged, so it can be sent again without counting invoices twice.
+        Invoices already counted, e.g. from sending a file again, are
+        skipped and reported as errors.
+
+        Returns:
+            dict: Rows read, accepted and rejected, the first MAX_ERRORS
+                errors with their row number in the input, and the TPINs
+                that crossed the VAT registration threshold unregistered
+        """
+        summary = {"rows": 0, "accepted": 0, "rejected": 0, "errors": [], "threshold_breaches": []}
+        with self._ingest_lock:
+            staged_keys, staged_totals = [], []
+            staged_invoices = InvoiceIds()
+            for chunk in chunks:
+                batch = self._new_invoices(parse_invoices(chunk), staged_invoices)
+                staged_invoices.add(batch.invoice)
+                keys, totals = aggregate(batch)
+                staged_keys.append(keys)
+                staged_totals.append(totals)
+                _tally(summary, len(chunk), batch.errors)
+            if staged_keys:
+                keys, totals = _reduce(np.concatenate(staged_keys), np.concatenate(staged_totals))
+                summary["threshold_breaches"].extend(self.merge(keys, totals))
+                with self._lock:
+                    self._invoices.update(staged_invoices)
+        return summary
+
+    def add_result(self, summary: Dict[str, Any], batch: InvoiceBatch, rows: int) -> None:
+        """Merge the new invoices of a process_chunk result and update an ingest summary."""
+        with self._ingest_lock:
+            batch = self._new_invoices(batch)
+            keys, totals = aggregate(batch)
+            summary.setdefault("threshold_breaches", []).extend(self.merge(keys, totals))
+            with self._lock:
+                self._invoices.add(batch.invoice)
+        _tally(summary, rows, batch.errors)
+
+    def liability(self, tpin: str, period: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        VAT position of a TPIN, per period.
+
+        Args:
+            tpin: Taxpayer Identification Number
+            period: Optional YYYY-MM period, otherwise all periods
+
+        Raises:
+            ValueError: If the TPIN or period is invalid
+        """
+        number = _tpin(tpin)
+        if number is None:
+            raise ValueError("Invalid TPIN format. Must be 9 digits.")
+        low, high = number * _PERIOD_SPAN, (number + 1) * _PERIOD_SPAN
+        if period is not None:
+            match = _DATE.match(period)
+            if match is None:
+                raise ValueError("Invalid tax period format. Use YYYY-MM")
+            low += int(match.group(1)) * 100 + int(match.group(2))
+            high = low + 1
+        with self._lock:
+            self._combine()
+            start, stop = np.searchsorted(self._keys, [low, high])
+            return [_row(key, totals) for key, totals in zip(self._keys[start:stop], self._totals[start:stop])]
+
+    def period_totals(self, period: str) -> Dict[str, Any]:
+        """Totals of a YYYY-MM period across all TPINs."""
+        match = _DATE.match(period)
+        if match is None:
+            raise ValueError("Invalid tax period format. Use YYYY-MM")
+        with self._lock:
+            self._combine()
+            in_period = self._keys % _PERIOD_SPAN == int(match.group(1)) * 100 + int(match.group(2))
+            totals = self._totals[in_period].sum(axis=0)
+        return {
+            "period": period[:7],
+            "taxpayers": int(in_period.sum()),
+            "output_vat": Money(int(totals[OUTPUT_VAT])).to_kwacha(),
+            "input_vat": Money(int(totals[INPUT_VAT])).to_kwacha(),
+            "net_vat": Money(int(totals[OUTPUT_VAT] - totals[INPUT_VAT])).to_kwacha(),
+        }
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """All (TPIN, period) positions in TPIN then period order."""
+        with self._lock:
+            self._combine()
+            keys, totals = self._keys.copy(), self._totals.copy()
+        for key, row in zip(keys, totals):
+            yield _row(key, row)
+
+
+def _tally(summary: Dict[str, Any], rows: int, errors: List[Dict[str, Any]]) -> None:
+    """Count a chunk's rows and errors into an ingest summary."""
+    for error in errors[:max(0, MAX_ERRORS - len(summary["errors"]))]:
+        summary["errors"].append(dict(error, row=summary["rows"] + error["row"] + 1))
+    summary["rows"] += rows
+    summary["accepted"] += rows - len(errors)
+    summary["rejected"] += len(errors)
+
+
+def _row(key: int, totals: np.ndarray) -> Dict[str, Any]:
+    tpin, period = divmod(int(key), _PERIOD_SPAN)
+    output_vat, input_vat = int(totals[OUTPUT_VAT]), int(totals[INPUT_VAT])
+    return {
+        "tpin": f"{tpin:09d}",
+        "period": f"{period // 100:04d}-{period % 100:02d}",
+        "output_vat": Money(output_vat).to_kwacha(),
+        "input_vat": Money(input_vat).to_kwacha(),
+        "net_vat": Money(output_vat - input_vat).to_kwacha(),
+        "sales": Money(int(totals[SALES])).to_kwacha(),
+        "purchases": Money(int(totals[PURCHASES])).to_kwacha(),
+        "invoices_issued": int(totals[ISSUED]),
+        "invoices_received": int(totals[RECEIVED]),
+    }
@@ -0,0 +1,316 @@
+"""
+Velocity and burst detection on web app traffic.
+
+Requests are counted per TPIN and per caller over a sliding time window.
+Each count is kept in a count-min sketch: a few rows of counters indexed by
+hashes of the key, where a key's count is the smallest of its counters.
+Memory therefore stays fixed however many distinct TPINs and callers appear,
+and counts can only be overestimated. The busiest keys are also tracked
+exactly in a small top-K table, and keys whose count reaches a stream's
+threshold are reported as anomalies.
+
+The window is split into buckets, each with its own sketch. When the window
+moves on, the oldest bucket is subtracted from the running total and
+cleared. Recording a request costs a few counter updates.
+
+Streams:
+    tpin_lookups: lookups of a TPIN (verification, compliance, VAT)
+    tpin_submissions: tax return submissions for a TPIN
+    caller_requests: monitored requests from one caller
+    caller_sequential: lookups of a TPIN next to the caller's previous one,
+        a sign of enumerating the register
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+# Requests per window that mark a key as anomalous
+DEFAULT_THRESHOLDS = {
+    "tpin_lookups": 30,
+    "tpin_submissions": 5,
+    "caller_requests": 300,
+    "caller_sequential": 20,
+}
+
+_HASH_MASK = (1 << 64) - 1
+
+
+class SlidingCounter:
+    """Approximate per-key counts over a sliding time window, in fixed memory."""
+
+    def __init__(
+        self,
+        window: float = 60.0,
+        buckets: int = 6,
+        width: int = 2048,
+        depth: int = 4,
+        top_k: int = 50,
+        clock=time.monotonic
+    ):
+        """
+        Initialize the counter.
+
+        Args:
+            window: Window length in seconds
+            buckets: Buckets the window is split into; the window moves on
+                in steps of window / buckets
+            width: Counters per sketch row; more counters, fewer collisions
+            depth: Sketch rows (hash functions)
+            top_k: Keys tracked exactly
+            clock: Source of the current time in seconds
+        """
+        self.window = window
+        self.top_k = top_k
+        self._span = window / buckets
+        self._buckets = buckets
+        self._width = width
+        self._rows = np.arange(depth)
+        self._cells = np.zeros((buckets, depth, width), dtype=np.int32)
+        self._sum = np.zeros((depth, width), dtype=np.int64)
+        self._bucket_totals = [0] * buckets
+        self._bucket = 0
+        self._epoch: Optional[int] = None
+        # key -> [count in window, count per bucket...], exact since the key was admitted
+        self._top: Dict[str, List[int]] = {}
+        self._floor = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the sketches, which does not grow with the number of keys."""
+        return self._cells.nbytes + self._sum.nbytes
+
+    def _index(self, key: str) -> np.ndarray:
+        # Row i uses hash a + i * b (double hashing from one 64-bit hash)
+        h = hash(key) & _HASH_MASK
+        return ((h & 0xFFFFFFFF) + self._rows * ((h >> 32) | 1)) % self._width
+
+    def _advance(self) -> None:
+        """Move the window to the current time, clearing expired buckets."""
+        epoch = int(self._clock() // self._span)
+        if self._epoch is None:
+            self._epoch = epoch
+            return
+        steps = min(epoch - self._epoch, self._buckets)
+        if steps <= 0:
+            return
+        self._epoch = epoch
+        for _ in range(steps):
+            self._bucket = (self._bucket + 1) % self._buckets
+            self._sum -= self._cells[self._bucket]
+            self._cells[self._bucket] = 0
+            self._bucket_totals[self._bucket] = 0
+            for key, entry in list(self._top.items()):
+                entry[0] -= entry[1 + self._bucket]
+                entry[1 + self._bucket] = 0
+                if entry[0] <= 0:
+                    del self._top[key]
+        self._floor = min((entry[0] for entry in self._top.values()), default=0)
+
+    def add(self, key: str, count: int = 1) -> int:
+        """
+        Count a key.
+
+        Returns:
+            int: The key's count in the window, including this one
+        """
+        with self._lock:
+            self._advance()
+            index = self._index(key)
+            self._cells[self._bucket, self._rows, index] += count
+            self._sum[self._rows, index] += count
+            self._bucket_totals[self._bucket] += count
+
+            entry = self._top.get(key)
+            if entry is not None:
+                entry[0] += count
+                entry[1 + self._bucket] += count
+                return entry[0]
+            estimate = int(self._sum[self._rows, index].min())
+            if len(self._top) < self.top_k or estimate > self._floor:
+                self._admit(key, estimate)
+            return estimate
+
+    def _admit(self, key: str, estimate: int) -> None:
+        """Track a key exactly, evicting the smallest tracked key if full. Caller holds the lock."""
+        if len(self._top) >= self.top_k:
+            smallest = min(self._top, key=lambda k: self._top[k][0])
+            if self._top[smallest][0] >= estimate:
+                self._floor = self._top[smallest][0]
+                return
+            del self._top[smallest]
+        # Counts from before admission are only known as the sketch estimate;
+        # they are booked in the current bucket, so they expire a window later
+        entry = [estimate] + [0] * self._buckets
+        entry[1 + self._bucket] = estimate
+        self._top[key] = entry
+        if len(self._top) >= self.top_k:
+            self._floor = min(entry[0] for entry in self._top.values())
+
+    def count(self, key: str) -> int:
+        """A key's count in the window (exact for tracked keys, else an upper bound)."""
+        with self._lock:
+            self._advance()
+            entry = self._top.get(key)
+            if entry is not None:
+                return entry[0]
+            return int(self._sum[self._rows, self._index(key)].min())
+
+    def total(self) -> int:
+        """All counts in the window."""
+        with self._lock:
+            self._advance()
+            return sum(self._bucket_totals)
+
+    def heavy_hitters(self, limit: int = 20, minimum: int = 1) -> List[Dict[str, Any]]:
+        """The tracked keys with the highest counts, highest first."""
+        with self._lock:
+            self._advance()
+            top = sorted(
+                ((key, entry[0]) for key, entry in self._top.items() if entry[0] >= minimum),
+                key=lambda item: item[1], reverse=True
+            )
+        return [{"key": key, "count": count} for key, count in top[:max(0, limit)]]
+
+
+class VelocityMonitor:
+    """Counts monitored requests of a Flask app by TPIN and caller, and reports bursts."""
+
+    def __init__(
+        self,
+        routes: Dict[str, str],
+        window: float = 60.0,
+        thresholds: Optional[Dict[str, int]] = None,
+        top_k: int = 50,
+        width: int = 2048,
+        depth: int = 4,
+        sequential_gap: int = 5,
+        caller_slots: int = 65536,
+        max_alerts: int = 200,
+        clock=time.monotonic
+    ):
+        """
+        Initialize the monitor.
+
+        Args:
+            routes: Endpoint name -> 'lookup' or 'submission'; other routes
+                are not counted
+            window: Window length in seconds
+            thresholds: Requests per window that mark a key as anomalous,
+                per stream (see DEFAULT_THRESHOLDS)
+            top_k: Keys tracked exactly per stream
+            width: Counters per sketch row
+            depth: Sketch rows
+            sequential_gap: Largest TPIN difference counted as sequential
+            caller_slots: Slots remembering each caller's previous TPIN;
+                callers sharing a slot may miss or fake a sequential step
+            max_alerts: Recent threshold crossings kept
+            clock: Source of the current time in seconds
+        """
+        self.routes = routes
+        self.window = window
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.sequential_gap = sequential_gap
+        self.streams = {
+            name: SlidingCounter(window, width=width, depth=depth, top_k=top_k, clock=clock)
+            for name in self.thresholds
+        }
+        self._previous_tpin = np.full(caller_slots, -1, dtype=np.int64)
+        self._alerts: Deque[Dict[str, Any]] = deque(maxlen=max_alerts)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, route: str = "/api/velocity/anomalies") -> None:
+        """Register the counting hook and the anomalies endpoint on an app."""
+        from flask import jsonify, request
+
+        @app.before_request
+        def count_request():
+            kind = self.routes.get(request.endpoint)
+            if kind is None:
+                return None
+            tpin = (request.view_args or {}).get("tpin") or request.args.get("tpin")
+            if tpin is None and request.is_json:
+                data = request.get_json(silent=True)
+                tpin = data.get("tpin") if isinstance(data, dict) else None
+            # X-Forwarded-For is set by the client; trust only what the app's
+            # ProxyFix (ZRA_PROXY_HOPS) has resolved into remote_addr
+            caller = request.remote_addr
+            self.record(kind, str(tpin) if tpin is not None else None, caller or "unknown")
+            return None
+
+        @app.route(route)
+        def velocity_anomalies():
+            """API endpoint listing TPINs and callers whose request rate exceeds the thresholds"""
+            limit = request.args.get("limit", 20, type=int)
+            return jsonify({"success": True, **self.anomalies(limit)})
+
+    def record(self, kind: str, tpin: Optional[str], caller: str) -> List[str]:
+        """
+        Count one request.
+
+        Args:
+            kind: 'lookup' or 'submission'
+            tpin: TPIN the request is about, if any
+            caller: Caller identity, e.g. the client address
+
+        Returns:
+            list: Streams in which this request took a key over its threshold
+        """
+        crossed = [self._add("caller_requests", caller)]
+        if tpin:
+            if kind == "submission":
+                crossed.append(self._add("tpin_submissions", tpin))
+            else:
+                crossed.append(self._add("tpin_lookups", tpin))
+                if self._is_sequential(tpin, caller):
+                    crossed.append(self._add("caller_sequential", caller))
+        return [stream for stream in crossed if stream]
+
+    def _add(self, stream: str, key: str) -> Optional[str]:
+        count = self.streams[stream].add(key)
+        if count != self.thresholds[stream]:
+            return None
+        with self._lock:
+            self._alerts.append({
+                "stream": stream,
+                "key": key,
+                "count": count,
+                "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        return stream
+
+    def _is_sequential(self, tpin: str, caller: str) -> bool:
+        """Whether a TPIN is close to the previous one this caller looked up."""
+        if not tpin.isdigit():
+            return False
+        number = int(tpin)
+        slot = hash(caller) % len(self._previous_tpin)
+        with self._lock:
+            previous = int(self._previous_tpin[slot])
+            self._previous_tpin[slot] = number
+        return previous >= 0 and 0 < abs(number - previous) <= self.sequential_gap
+
+    def anomalies(self, limit: int = 20) -> Dict[str, Any]:
+        """Keys at or over their stream's threshold, and the latest threshold crossings."""
+        streams = {
+            name: {
+                "threshold": self.thresholds[name],
+                "requests": counter.total(),
+                "anomalies": counter.heavy_hitters(limit, minimum=self.thresholds[name]),
+            }
+            for name, counter in self.streams.items()
+        }
+        with self._lock:
+            alerts = list(self._alerts)[-max(0, limit):] if limit > 0 else []
+        return {
+            "window_seconds": self.window,
+            "memory_bytes": sum(counter.memory_bytes for counter in self.streams.values())
+            + self._previous_tpin.nbytes,
+            "streams": streams,
+            "recent_alerts": alerts[::-1],
+        }
@@ -0,0 +1,4 @@
+"""
+Command-line tools for ZRA SDK
+"""
+# CLI package initialization
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+zra - batch verification, compliance and tax runs from the command line.
+
+Input is read from a file or stdin and processed in chunks across worker
+processes. Results are written as CSV, NDJSON or Parquet.
+
+Examples:
+    zra verify tpins.txt -o taxpayers.csv
+    cat tpins.txt | zra compliance --format ndjson > compliance.ndjson
+    zra tax payroll.parquet -o tax_results.parquet --workers 8
+    zra vat invoices.csv -o vat_liability.csv
+    zra carousel invoices.csv --period 2024-01 -o rings.csv
+    zra penalties liabilities.csv --as-of 2024-12-31 -o exposures.csv
+"""
+import argparse
+import csv
+import functools
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional
+
+from api.taxpayer_api import check_compliance_many, verify_taxpayers
+from api.tax_engine import OUTPUT_COLUMNS as TAX_COLUMNS
+from api.tax_engine import calculate_rows, iter_csv_chunks, iter_parquet_chunks
+from api.penalties import PENALTY_COLUMNS, assess_rows
+from api.vat_invoices import LIABILITY_COLUMNS, VATLedger, decode_block, iter_invoice_blocks, parse_invoices, process_block
+from fraud.carousel import CarouselConfig, InvoiceGraphBuilder, reduce_edges, score_rings
+
+FORMATS = ("csv", "ndjson", "parquet")
+VERIFY_COLUMNS = [
+    "tpin", "name", "business_name", "email", "phone", "status", "registration_date",
+    "last_filing_date", "tax_center", "business_category", "error",
+]
+RING_COLUMNS = [
+    "period", "tpins", "length", "throughput", "total_value", "invoices",
+    "component_size", "score", "flags",
+]
+COMPLIANCE_COLUMNS = [
+    "tpin", "compliance_status", "compliance_score", "outstanding_returns",
+    "outstanding_payments", "last_audit_date", "next_audit_due", "risk_level",
+    "compliance_issues", "penalties", "error",
+]
+
+
+def iter_tpin_chunks(stream: IO[str], chunk_size: int) -> Iterator[List[str]]:
+    """Read TPINs, one per line or from the tpin column of a CSV, in chunks."""
+    first = stream.readline()
+    if "tpin" in first.lower().split(","):
+        reader = csv.DictReader(stream, fieldnames=[f.strip().lower() for f in first.split(",")])
+        tpins: Iterable[str] = (row["tpin"] for row in reader)
+    else:
+        tpins = _chain_lines(first, stream)
+
+    chunk: List[str] = []
+    for tpin in tpins:
+        tpin = (tpin or "").strip()
+        if not tpin:
+            continue
+        chunk.append(tpin)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _chain_lines(first: str, stream: IO[str]) -> Iterator[str]:
+    yield first
+    yield from stream
+
+
+class ResultWriter:
+    """Writes result rows as CSV, NDJSON or Parquet."""
+
+    def __init__(self, path: Optional[str], fmt: str, columns: List[str]):
+        self.fmt = fmt
+        self.columns = columns
+        self._parquet = None
+        if fmt == "parquet":
+            if not path:
+                raise ValueError("Parquet output needs an output file (-o)")
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Parquet support requires pyarrow: pip install pyarrow")
+            self._pa = pa
+            self._schema = pa.schema([(name, pa.string()) for name in columns])
+            self._parquet = pq.ParquetWriter(path, self._schema)
+            self._file = None
+            return
+
+        self._file = open(path, "w", encoding="utf-8", newline="") if path else sys.stdout
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, columns, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if self.fmt == "ndjson":
+            self._file.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+            return
+
+        flat = [{name: _flatten(row.get(name)) for name in self.columns} for row in rows]
+        if self.fmt == "csv":
+            self._csv.writerows(flat)
+        else:
+            self._parquet.write_table(self._pa.Table.from_pylist(flat, schema=self._schema))
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._file is not sys.stdout:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+def _flatten(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return "; ".join(str(item) for item in value)
+    return str(value)
+
+
+class Progress:
+    """Single-line progress report on stderr."""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.count = 0
+        self.started = time.time()
+
+    def update(self, count: int) -> None:
+        self.count += count
+        if self.enabled:
+            rate = self.count / max(time.time() - self.started, 1e-9)
+            sys.stderr.write(f"\r{self.count:,} rows ({rate:,.0f}/s)")
+            sys.stderr.flush()
+
+    def finish(self) -> None:
+        if self.enabled:
+            sys.stderr.write(f"\rDone: {self.count:,} rows in {time.time() - self.started:.1f}s\n")
+
+
+def run_chunks(
+    worker: Callable[[Any], List[Dict[str, Any]]],
+    chunks: Iterator[Any],
+    writer: ResultWriter,
+    workers: int,
+    progress: Progress
+) -> int:
+    """
+    Process chunks with a pool of worker processes, writing results in input order.
+
+    Returns:
+        int: Number of rows written
+    """
+    return _drain(map_chunks(worker, chunks, workers), writer, progress)
+
+
+def map_chunks(worker: Callable[[Any], Any], chunks: Iterator[Any], workers: int) -> Iterator[Any]:
+    """Apply worker to each chunk, in worker processes if workers > 1, yielding results in input order."""
+    if workers <= 1:
+        yield from map(worker, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Bound how far reading can run ahead of the workers
+        yield from _bounded_map(pool, worker, chunks, workers * 2)
+
+
+def _bounded_map(pool: ProcessPoolExecutor, worker, chunks: Iterator[Any], window: int):
+    pending = []
+    for chunk in chunks:
+        pending.append(pool.submit(worker, chunk))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def _drain(results: Iterable[List[Dict[str, Any]]], writer: ResultWriter, progress: Progress) -> int:
+    total = 0
+    for rows in results:
+        writer.write(rows)
+        total += len(rows)
+        progress.update(len(rows))
+    progress.finish()
+    return total
+
+
+def _output_format(args: argparse.Namespace) -> str:
+    if args.format:
+        return args.format
+    if args.output:
+        extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+        if extension in ("json", "jsonl"):
+            return "ndjson"
+        if extension in FORMATS:
+            return extension
+    return "csv"
+
+
+def _open_input(path: str) -> IO[str]:
+    if path == "-":
+        return sys.stdin
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def command_lookup(args: argparse.Namespace) -> int:
+    """Handle the verify and compliance subcommands."""
+    worker, columns = {
+        "verify": (verify_taxpayers, VERIFY_COLUMNS),
+        "compliance": (check_compliance_many, COMPLIANCE_COLUMNS),
+    }[args.command]
+    stream = _open_input(args.input)
+    writer = ResultWriter(args.output, _output_format(args), columns)
+    try:
+        chunks = iter_tpin_chunks(stream, args.chunk_size)
+        return run_chunks(worker, chunks, writer, args.workers, Progress(args.progress))
+    finally:
+        writer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def command_tax(args: argparse.Namespace) -> int:
+    """Handle the tax subcommand."""
+    if args.input.lower().endswith(".parquet"):
+        stream = None
+        chunks = iter_parquet_chunks(args.input, args.chunk_size)
+    else:
+        stream = _open_input(args.input)
+        chunks = iter_csv_chunks(stream, args.chunk_size)
+
+    writer = ResultWriter(args.output, _output_format(args), TAX_COLUMNS)
+    try:
+        return run_chunks(calculate_rows, chunks, writer, args.workers, Progress(args.progress))
+    finally:
+        writer.close()
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+
+
+def command_vat(args: argparse.Namespace) -> int:
+    """Handle the vat subcommand."""
+    stream = _open_input(args.input)
+    ledger = VATLedger()
+    summary: Dict[str, Any] = {"rows": 0, "accepted": 0, "rejected": 0, "errors": []}
+    progress = Progress(args.progress)
+    try:
+        blocks = iter_invoice_blocks(stream, args.chunk_size)
+        for result in map_chunks(process_block, blocks, args.workers):
+            ledger.add_result(summary, *result)
+            progress.update(result[1])
+        progress.finish()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    if summary["rejected"]:
+        sys.stderr.write(f"zra vat: {summary['rejected']:,} of {summary['rows']:,} invoices rejected\n")
+        for error in summary["errors"][:10]:
+            sys.stderr.write(f"  row {error['row']}: {error['error']}\n")
+
+    writer = ResultWriter(args.output, _output_format(args), LIABILITY_COLUMNS)
+    try:
+        rows = ledger.rows()
+        while True:
+            block = list(itertools.islice(rows, 10_000))
+            if not block:
+                return len(ledger)
+            writer.write(block)
+    finally:
+        writer.close()
+
+
+def _invoice_edges(block):
+    batch = parse_invoices(decode_block(block))
+    return reduce_edges(batch.supplier, batch.buyer, batch.period, batch.net), len(block[1]), len(batch.errors)
+
+
+def command_carousel(args: argparse.Namespace) -> int:
+    """Handle the carousel subcommand."""
+    config = CarouselConfig(max_cycle_length=args.max_length, min_edge_value=args.min_value)
+    stream = _open_input(args.input)
+    builder = InvoiceGraphBuilder()
+    rejected = 0
+    progress = Progress(args.progress)
+    try:
+        blocks = iter_invoice_blocks(stream, args.chunk_size)
+        for edges, rows, errors in map_chunks(_invoice_edges, blocks, args.workers):
+            builder.add_edges(edges)
+            rejected += errors
+            progress.update(rows)
+        progress.finish()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    if rejected:
+        sys.stderr.write(f"zra carousel: {rejected:,} invalid invoices skipped (see zra vat for details)\n")
+
+    periods = builder.periods()
+    if args.period:
+        period = int(args.period.replace("-", "")[:6]) if args.period[:4].isdigit() else None
+        if period is None or period not in periods:
+            raise ValueError(f"No invoices for period {args.period}")
+        periods = [period]
+
+    writer = ResultWriter(args.output, _output_format(args), RING_COLUMNS)
+    count = 0
+    try:
+        for period in periods:
+            rings = builder.build(period).find_rings(config)
+            rings = score_rings(rings, check_compliance_many, config)
+            writer.write([ring.to_dict() for ring in rings])
+            count += len(rings)
+    finally:
+        writer.close()
+    return count
+
+
+def command_penalties(args: argparse.Namespace) -> int:
+    """Handle the penalties subcommand."""
+    as_of = date.fromisoformat(args.as_of) if args.as_of else date.today()
+    stream = _open_input(args.input)
+    writer = ResultWriter(args.output, _output_format(args), PENALTY_COLUMNS)
+    try:
+        chunks = iter_csv_chunks(stream, args.chunk_size)
+        worker = functools.partial(assess_rows, as_of=as_of)
+        return run_chunks(worker, chunks, writer, args.workers, Progress(args.progress))
+    finally:
+        writer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="zra", description="ZRA SDK batch tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    for name, handler, help_text in (
+        ("verify", command_lookup, "verify taxpayers by TPIN"),
+        ("compliance", command_lookup, "check taxpayer compliance by TPIN"),
+        ("tax", command_tax, "calculate tax for a payroll (employee_id,income,tax_type)"),
+        ("vat", command_vat, "compute VAT liability per TPIN and period from invoices (CSV or JSON lines)"),
+        ("carousel", command_carousel, "find circular trading rings in invoices (CSV or JSON lines)"),
+        ("penalties", command_penalties,
+         "price penalties and interest on liabilities (liability_id,tpin,tax_type,amount,due_date,paid_on)"),
+    ):
+        sub = subcommands.add_parser(name, help=help_text)
+        sub.add_argument("input", nargs="?", default="-", help="input file, '-' for stdin (default)")
+        sub.add_argument("-o", "--output", help="output file (default: stdout)")
+        sub.add_argument("-f", "--format", choices=FORMATS,
+                         help="output format (default: from the output extension, else csv)")
+        sub.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                         help="worker processes (default: CPU count)")
+        sub.add_argument("-c", "--chunk-size", type=int, default=10_000, help="rows per chunk")
+        sub.add_argument("--progress", dest="progress", action="store_true",
+                         default=sys.stderr.isatty(), help="report progress on stderr (default: if a tty)")
+        sub.add_argument("--no-progress", dest="progress", action="store_false")
+        if name == "carousel":
+            sub.add_argument("--period", help="only this YYYY-MM period (default: every period)")
+            sub.add_argument("--max-length", type=int, default=CarouselConfig.max_cycle_length,
+                             help="longest ring, in taxpayers (default: %(default)s)")
+            sub.add_argument("--min-value", type=float, default=CarouselConfig.min_edge_value,
+                             help="smallest flow between two taxpayers, ZMW (default: %(default)s)")
+        if name == "penalties":
+            sub.add_argument("--as-of", help="YYYY-MM-DD unpaid liabilities are charged up to (default: today)")
+        sub.set_defaults(handler=handler)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except (OSError, ValueError, ImportError) as e:
+        sys.stderr.write(f"zra {args.command}: {e}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
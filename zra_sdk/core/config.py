@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,9 +11,63 @@ class ZRAConfig:
     API_KEY = os.getenv('ZRA_API_KEY', '')
     TIMEOUT = int(os.getenv('ZRA_TIMEOUT', '30'))
     
+    # Taxpayer data: memory (sample data), sqlite, snapshot or http (ZRA API)
+    DATA_SOURCE = os.getenv('ZRA_DATA_SOURCE', 'memory')
+    DATA_SOURCE_PATH = os.getenv('ZRA_DATA_SOURCE_PATH', '')
+    
+    # Registry filter: unknown and deregistered TPINs are rejected before any
+    # lookup (false positive rate, 0 = disabled); blacklisted TPINs, one per line
+    REGISTRY_FILTER_FPR = float(os.getenv('ZRA_REGISTRY_FILTER_FPR', '0.001'))
+    TPIN_BLOCKLIST_FILE = os.getenv('ZRA_TPIN_BLOCKLIST_FILE', '')
+    
+    # Local data feeds
+    COMPLIANCE_EVENTS_FILE = os.getenv('ZRA_COMPLIANCE_EVENTS_FILE', '')
+    RECOMMENDATION_RULES_FILE = os.getenv('ZRA_RECOMMENDATION_RULES_FILE', '')
+    
+    # Report rendering (0 workers = CPU count)
+    REPORT_WORKERS = int(os.getenv('ZRA_REPORT_WORKERS', '0'))
+    REPORT_CACHE_SIZE = int(os.getenv('ZRA_REPORT_CACHE_SIZE', '256'))
+    
+    # Background batch jobs
+    JOB_DB = os.getenv('ZRA_JOB_DB') or os.path.join(tempfile.gettempdir(), 'zra_jobs.sqlite3')
+    JOB_WORKERS = int(os.getenv('ZRA_JOB_WORKERS', '2'))
+    JOB_CHUNK_SIZE = int(os.getenv('ZRA_JOB_CHUNK_SIZE', '500'))
+    
+    # Tax return submissions (write-ahead log)
+    SUBMISSION_LOG = os.getenv('ZRA_SUBMISSION_LOG') or os.path.join(tempfile.gettempdir(), 'zra_submissions.log')
+    
+    # Admission control (0 capacity = disabled)
+    ADMISSION_CAPACITY = int(os.getenv('ZRA_ADMISSION_CAPACITY', '64'))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ZRA_ADMISSION_QUEUE_TIMEOUT', '2.0'))
+    
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted (0 = none)
+    PROXY_HOPS = int(os.getenv('ZRA_PROXY_HOPS', '0'))
+    
+    # Velocity detection: request counts per TPIN and caller (0 window = disabled)
+    VELOCITY_WINDOW = float(os.getenv('ZRA_VELOCITY_WINDOW', '60'))
+    VELOCITY_TPIN_LIMIT = int(os.getenv('ZRA_VELOCITY_TPIN_LIMIT', '30'))
+    VELOCITY_CALLER_LIMIT = int(os.getenv('ZRA_VELOCITY_CALLER_LIMIT', '300'))
+    
+    # VAT registration: file of VAT-registered TPINs, one per line
+    VAT_REGISTER_FILE = os.getenv('ZRA_VAT_REGISTER_FILE', '')
+
+    # Audit scheduling: audits per week per tax center, with overrides like "Lusaka=50,Ndola=20"
+    AUDIT_CAPACITY = int(os.getenv('ZRA_AUDIT_CAPACITY', '20'))
+    AUDIT_CAPACITIES = os.getenv('ZRA_AUDIT_CAPACITIES', '')
+
+    # Penalties and interest: JSON rules per tax type (default rules if unset)
+    PENALTY_RULES_FILE = os.getenv('ZRA_PENALTY_RULES_FILE', '')
+    
+    # Request profiling (off unless a directory is set; 0 sample rate = header only)
+    PROFILE_DIR = os.getenv('ZRA_PROFILE_DIR', '')
+    PROFILE_SAMPLE_RATE = int(os.getenv('ZRA_PROFILE_SAMPLE_RATE', '100'))
+    # Secret for the X-ZRA-Profile header and the profile listing (both off if unset)
+    PROFILE_TOKEN = os.getenv('ZRA_PROFILE_TOKEN', '')
+    
     # Endpoints
     VERIFY_TAXPAYER = '/v1/taxpayer/verify'
     CALCULATE_TAX = '/v1/tax/calculate'
+    COMPLIANCE_STATUS = '/v1/compliance/status'
     
     @classmethod
     def validate(cls):
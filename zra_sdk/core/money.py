@@ -0,0 +1,249 @@
+"""
+Fixed-point money.
+
+Amounts are held as whole ngwee (1 ZMW = 100 ngwee): Money for single
+amounts and int64 NumPy arrays for batches. Sums are exact, and rounding
+happens once, explicitly, with a chosen rule when a rate is applied or a
+decimal amount is converted.
+"""
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal, InvalidOperation
+from fractions import Fraction
+from typing import Tuple, Union
+
+import numpy as np
+
+NGWEE_PER_KWACHA = 100
+
+# Largest amount an int64 batch accepts; leaves headroom for multiplying by rates
+MAX_NGWEE = 2 ** 53
+MAX_KWACHA = MAX_NGWEE / NGWEE_PER_KWACHA
+
+# Rounding rules for amounts exactly halfway between two ngwee
+HALF_UP = ROUND_HALF_UP      # away from zero, the default
+HALF_EVEN = ROUND_HALF_EVEN  # banker's rounding
+
+Number = Union[int, float, str, Decimal, Fraction]
+
+
+def _ratio(value: Number) -> Fraction:
+    """Exact value of a number; floats are taken at their shortest repr (0.1 is 1/10)."""
+    if isinstance(value, bool):
+        raise TypeError("Amount must be a number")
+    if isinstance(value, (float, np.floating)):
+        value = repr(float(value))
+    elif isinstance(value, np.integer):
+        value = int(value)
+    try:
+        return Fraction(value)
+    except (InvalidOperation, ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid amount: {value}") from e
+
+
+def _round_fraction(value: Fraction, rounding: str) -> int:
+    quotient, remainder = divmod(value.numerator, value.denominator)
+    twice = 2 * remainder
+    if twice > value.denominator:
+        return quotient + 1
+    if twice < value.denominator:
+        return quotient
+    if rounding == HALF_EVEN:
+        return quotient + (quotient & 1)
+    return quotient + 1 if value > 0 else quotient
+
+
+class Money:
+    """An exact amount in ZMW, stored as an integer number of ngwee."""
+    __slots__ = ("ngwee",)
+
+    def __init__(self, ngwee: int = 0):
+        if isinstance(ngwee, bool) or not isinstance(ngwee, (int, np.integer)):
+            raise TypeError("Money is created from whole ngwee; use Money.from_kwacha for ZMW amounts")
+        self.ngwee = int(ngwee)
+
+    @classmethod
+    def from_kwacha(cls, amount: Number, rounding: str = HALF_UP) -> "Money":
+        """
+        Convert a ZMW amount, rounding to the nearest ngwee.
+
+        Args:
+            amount: Amount in ZMW; floats are read at their shortest decimal
+                representation, so 1.005 rounds like the decimal 1.005
+            rounding: HALF_UP or HALF_EVEN
+
+        Raises:
+            ValueError: If the amount is not a finite number
+        """
+        if isinstance(amount, Money):
+            return amount
+        return cls(_round_fraction(_ratio(amount) * NGWEE_PER_KWACHA, rounding))
+
+    def to_kwacha(self) -> float:
+        """The amount in ZMW as a float, for JSON and display."""
+        return self.ngwee / NGWEE_PER_KWACHA
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.ngwee).scaleb(-2)
+
+    def apply_rate(self, rate: Number, rounding: str = HALF_UP) -> "Money":
+        """Multiply by a rate (e.g. "0.16") and round to the nearest ngwee."""
+        return Money(_round_fraction(_ratio(rate) * self.ngwee, rounding))
+
+    def ratio(self, other: "Money") -> float:
+        """This amount as a fraction of another (0.0 if the other is zero)."""
+        return self.ngwee / other.ngwee if other.ngwee else 0.0
+
+    def _coerce(self, other) -> int:
+        if isinstance(other, Money):
+            return other.ngwee
+        if other == 0 and isinstance(other, int):  # lets sum() start from 0
+            return 0
+        return NotImplemented
+
+    def __add__(self, other):
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else Money(self.ngwee + ngwee)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else Money(self.ngwee - ngwee)
+
+    def __rsub__(self, other):
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else Money(ngwee - self.ngwee)
+
+    def __mul__(self, other):
+        if isinstance(other, int) and not isinstance(other, bool):
+            return Money(self.ngwee * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self) -> "Money":
+        return Money(-self.ngwee)
+
+    def __abs__(self) -> "Money":
+        return Money(abs(self.ngwee))
+
+    def __bool__(self) -> bool:
+        return self.ngwee != 0
+
+    def __eq__(self, other) -> bool:
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else self.ngwee == ngwee
+
+    def __lt__(self, other) -> bool:
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else self.ngwee < ngwee
+
+    def __le__(self, other) -> bool:
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else self.ngwee <= ngwee
+
+    def __gt__(self, other) -> bool:
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else self.ngwee > ngwee
+
+    def __ge__(self, other) -> bool:
+        ngwee = self._coerce(other)
+        return NotImplemented if ngwee is NotImplemented else self.ngwee >= ngwee
+
+    def __hash__(self) -> int:
+        return hash(self.ngwee)
+
+    def __float__(self) -> float:
+        return self.to_kwacha()
+
+    def __str__(self) -> str:
+        sign = "-" if self.ngwee < 0 else ""
+        kwacha, ngwee = divmod(abs(self.ngwee), NGWEE_PER_KWACHA)
+        return f"{sign}{kwacha}.{ngwee:02d}"
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+
+# Batches: int64 arrays of ngwee
+
+def to_ngwee(amounts, rounding: str = HALF_UP) -> np.ndarray:
+    """
+    Convert an array of ZMW amounts to int64 ngwee.
+
+    Float amounts are scaled and rounded to the nearest ngwee. Values within
+    a few ULPs of a half ngwee are treated as exact halves (1.005 is stored
+    just below 1.005 in binary) and rounded by the given rule, so results
+    match Money.from_kwacha.
+
+    Raises:
+        ValueError: If any amount is NaN, infinite or beyond MAX_KWACHA
+    """
+    values = np.asarray(amounts)
+    scaled = values.astype(np.float64) * NGWEE_PER_KWACHA
+    if not np.all(np.abs(scaled) <= MAX_NGWEE):
+        raise ValueError(f"Amounts must be finite numbers no larger than {MAX_KWACHA:.0f}")
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64) * NGWEE_PER_KWACHA
+
+    floor = np.floor(scaled)
+    fraction = scaled - floor
+    tolerance = 8 * np.spacing(np.abs(scaled))
+    if rounding == HALF_EVEN:
+        half = floor + (np.fmod(floor, 2) != 0)
+    else:
+        half = np.where(scaled > 0, floor + 1, floor)
+    rounded = np.where(
+        fraction < 0.5 - tolerance, floor,
+        np.where(fraction > 0.5 + tolerance, floor + 1, half)
+    )
+    return rounded.astype(np.int64)
+
+
+def to_kwacha(ngwee) -> np.ndarray:
+    """Convert int64 ngwee to float64 ZMW, the nearest float to each exact amount."""
+    return np.asarray(ngwee, dtype=np.int64) / NGWEE_PER_KWACHA
+
+
+def rate_fraction(rate: Number) -> Tuple[int, int]:
+    """A rate as an exact (numerator, denominator) pair, e.g. "0.16" -> (4, 25)."""
+    value = _ratio(rate)
+    return value.numerator, value.denominator
+
+
+def divide_rounded(numerator, denominator, rounding: str = HALF_UP) -> np.ndarray:
+    """
+    Integer division of an int64 array by a positive integer (or an array
+    of them), rounded to nearest by the given rule.
+    """
+    numerator = np.asarray(numerator, dtype=np.int64)
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice = 2 * remainder
+    if rounding == HALF_EVEN:
+        at_half = quotient & 1
+    else:
+        at_half = (numerator > 0).astype(np.int64)
+    return quotient + np.where(twice > denominator, 1, np.where(twice < denominator, 0, at_half))
+
+
+def apply_rate(ngwee, rate: Number, rounding: str = HALF_UP) -> np.ndarray:
+    """
+    Multiply int64 ngwee by an exact rate and round each result to the nearest ngwee.
+
+    Rates with long decimals (large numerators) are applied with Python
+    integers when the int64 product could overflow.
+
+    Raises:
+        OverflowError: If a result does not fit in int64
+    """
+    numerator, denominator = rate_fraction(rate)
+    ngwee = np.asarray(ngwee, dtype=np.int64)
+    largest = max(abs(int(ngwee.min())), abs(int(ngwee.max()))) if ngwee.size else 0
+    if largest * abs(numerator) < 2 ** 63 and denominator < 2 ** 62:
+        return divide_rounded(ngwee * numerator, denominator, rounding)
+    exact = [_round_fraction(Fraction(value * numerator, denominator), rounding) for value in ngwee.ravel().tolist()]
+    return np.array(exact, dtype=np.int64).reshape(ngwee.shape)
+
+
+def total(ngwee) -> Money:
+    """Exact sum of an array of ngwee."""
+    return Money(int(np.sum(np.asarray(ngwee, dtype=np.int64), dtype=np.int64)))
@@ -0,0 +1,242 @@
+"""
+Penalties and interest on late tax liabilities.
+
+Each tax type has a rule combining three charges on a liability paid late:
+
+- fixed: a set amount plus a share of the liability, charged once;
+- per day: a simple daily rate on the liability for every day late,
+  optionally capped at a share of the liability;
+- interest: an annual rate compounded daily on the liability.
+
+Rates may change over time. For each rule, the engine precomputes tables
+over calendar days: the running sum of the daily penalty rates, and the
+running sum of the log of each day's interest growth. The charge for any
+stretch of days is then the difference of two table entries. A batch of
+liabilities is priced with a few array lookups, whatever its dates.
+Amounts are whole ngwee, and each charge is rounded to the nearest ngwee.
+"""
+import json
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..money import Money, apply_rate, rate_fraction, to_kwacha
+from .constants import TaxType
+
+# A rate, or (effective from, rate) steps of a rate that changes over time
+RateSchedule = Union[str, float, Sequence[Tuple[Any, Union[str, float]]]]
+
+DAYS_PER_YEAR = 365
+TABLE_START = date(2000, 1, 1)
+TABLE_YEARS_AHEAD = 10
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+@dataclass(frozen=True)
+class PenaltyRule:
+    """How a tax type's late liabilities are charged."""
+    fixed: int = 0                            # ngwee, once when late
+    fixed_rate: str = "0"                     # share of the liability, once when late
+    daily_rate: RateSchedule = "0"            # share of the liability per day late
+    max_daily_share: Optional[str] = None     # cap on the per-day penalty, as a share
+    interest_rate: RateSchedule = "0"         # per year, compounded daily
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], base: Optional["PenaltyRule"] = None) -> "PenaltyRule":
+        """
+        A rule from its JSON form; fixed is in ZMW and the other fields are
+        rates. Fields left out keep their value in base.
+        """
+        rule = base or cls()
+        changes = {key: data[key] for key in ("fixed_rate", "daily_rate", "max_daily_share", "interest_rate") if key in data}
+        if "fixed" in data:
+            changes["fixed"] = Money.from_kwacha(data["fixed"]).ngwee
+        return replace(rule, **changes)
+
+
+# Starting rules, to be replaced with the rates in force through
+# ZRA_PENALTY_RULES_FILE
+_STANDARD_RULE = PenaltyRule(fixed_rate="0.05", interest_rate="0.12")
+DEFAULT_RULES: Dict[str, PenaltyRule] = {
+    **{tax_type.name: _STANDARD_RULE for tax_type in TaxType},
+    "VAT": PenaltyRule(fixed_rate="0.05", daily_rate="0.0005", max_daily_share="0.5", interest_rate="0.12"),
+}
+
+
+def _to_days(values) -> np.ndarray:
+    """Dates (date objects, ISO strings or datetime64) as days since 1970; missing dates are NaT."""
+    values = np.asarray(values)
+    if values.dtype.kind != "M":
+        values = np.array([None if value in (None, "") else value for value in values.ravel()],
+                          dtype="datetime64[D]").reshape(values.shape)
+    return values.astype("datetime64[D]")
+
+
+def _day_rates(schedule: RateSchedule, start: date, days: int, per: int) -> np.ndarray:
+    """The rate in force on each day of a table, divided by per."""
+    if isinstance(schedule, (str, int, float)):
+        schedule = [(start, schedule)]
+    rates = np.zeros(days)
+    for effective, rate in sorted((_to_date(when), value) for when, value in schedule):
+        first = max(0, (effective - start).days)
+        rates[first:] = float(rate) / per
+    return rates
+
+
+def _check_rates(name: str, rule: PenaltyRule) -> None:
+    """Raise ValueError if a rule's rates are not numbers, or are negative."""
+    schedules = {"daily_rate": rule.daily_rate, "interest_rate": rule.interest_rate}
+    rates = {"fixed_rate": [rule.fixed_rate], "max_daily_share": [rule.max_daily_share or "0"]}
+    for field, schedule in schedules.items():
+        steps = [(None, schedule)] if isinstance(schedule, (str, int, float)) else schedule
+        rates[field] = [rate for _, rate in steps]
+    for field, values in rates.items():
+        for value in values:
+            try:
+                numerator, _ = rate_fraction(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{name} {field} is not a rate: {value!r}") from e
+            if numerator < 0:
+                raise ValueError(f"{name} {field} must not be negative: {value!r}")
+
+
+def _to_date(value: Any) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    return np.floor(values + 0.5).astype(np.int64)
+
+
+class PenaltyEngine:
+    """Prices penalties and interest on batches of late liabilities."""
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, PenaltyRule]] = None,
+        start: date = TABLE_START,
+        end: Optional[date] = None
+    ):
+        """
+        Precompute the daily-rate tables.
+
+        Args:
+            rules: Rule by tax type name (e.g. "VAT"); defaults to DEFAULT_RULES
+            start: First due date the tables cover
+            end: Last payment date the tables cover (default ten years ahead)
+
+        Raises:
+            ValueError: If a rate is not a number or is negative
+        """
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        for name, rule in self.rules.items():
+            _check_rates(name, rule)
+        self.start = start
+        self.end = end or date.today() + timedelta(days=DAYS_PER_YEAR * TABLE_YEARS_AHEAD)
+        self._first = int((np.datetime64(start, "D") - _EPOCH).astype(np.int64))
+        days = (self.end - start).days + 2
+        self._tables: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for name, rule in self.rules.items():
+            # Entry k covers the days before start + k, so days (due, paid]
+            # are table[paid + 1] - table[due + 1]
+            daily = np.zeros(days + 1)
+            np.cumsum(_day_rates(rule.daily_rate, start, days, 1), out=daily[1:])
+            growth = np.zeros(days + 1)
+            np.cumsum(np.log1p(_day_rates(rule.interest_rate, start, days, DAYS_PER_YEAR)), out=growth[1:])
+            self._tables[name] = (daily, growth)
+
+    @classmethod
+    def from_file(cls, path: str) -> "PenaltyEngine":
+        """
+        Load rules from a JSON file of the form
+        {"VAT": {"fixed": 0, "fixed_rate": "0.05", "daily_rate": "0.0005",
+        "max_daily_share": "0.5", "interest_rate": [["2024-01-01", "0.135"]]}};
+        tax types left out keep their default rule.
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            config = json.load(fh)
+        rules = dict(DEFAULT_RULES)
+        for name, data in config.items():
+            rules[name] = PenaltyRule.from_dict(data, rules.get(name))
+        return cls(rules)
+
+    def assess(self, tax_type: str, amounts, due_dates, paid_on=None, as_of: Optional[date] = None) -> Dict[str, np.ndarray]:
+        """
+        Price a batch of liabilities of one tax type.
+
+        Args:
+            tax_type: Tax type name, e.g. "VAT"
+            amounts: Liabilities in ngwee (int64 array)
+            due_dates: Due date of each liability
+            paid_on: Payment date of each liability; missing (None or NaT)
+                for unpaid liabilities, charged up to as_of
+            as_of: Date unpaid liabilities are charged up to (default today)
+
+        Returns:
+            dict: int64 arrays "days_late", and "fixed_penalty",
+                "daily_penalty", "interest" and "total" in ngwee
+
+        Raises:
+            ValueError: If the tax type has no rule, or a date is missing or
+                outside the tables
+        """
+        rule = self.rules.get(tax_type)
+        if rule is None:
+            raise ValueError(f"No penalty rule for tax type {tax_type}")
+        daily, growth = self._tables[tax_type]
+
+        amounts = np.maximum(np.asarray(amounts, dtype=np.int64), 0)
+        due = _to_days(due_dates)
+        if np.isnat(due).any():
+            raise ValueError("Every liability needs a due date")
+        paid = _to_days(paid_on) if paid_on is not None else np.full(due.shape, np.datetime64("NaT"), "datetime64[D]")
+        paid = np.where(np.isnat(paid), np.datetime64(as_of or date.today(), "D"), paid)
+
+        due_index = (due - _EPOCH).astype(np.int64) - self._first + 1
+        paid_index = (paid - _EPOCH).astype(np.int64) - self._first + 1
+        paid_index = np.maximum(paid_index, due_index)
+        if len(due_index) and (due_index.min() < 1 or paid_index.max() >= len(daily)):
+            raise ValueError(f"Dates must be between {self.start} and {self.end}")
+
+        late = paid_index > due_index
+        fixed = np.where(late, rule.fixed + apply_rate(amounts, rule.fixed_rate), 0)
+        per_day = _round(amounts * (daily[paid_index] - daily[due_index]))
+        if rule.max_daily_share is not None:
+            per_day = np.minimum(per_day, apply_rate(amounts, rule.max_daily_share))
+        interest = _round(amounts * np.expm1(growth[paid_index] - growth[due_index]))
+        return {
+            "days_late": paid_index - due_index,
+            "fixed_penalty": fixed,
+            "daily_penalty": per_day,
+            "interest": interest,
+            "total": fixed + per_day + interest,
+        }
+
+    def assess_many(self, tax_types, amounts, due_dates, paid_on=None, as_of: Optional[date] = None) -> Dict[str, np.ndarray]:
+        """Price a batch of liabilities of mixed tax types; see assess."""
+        tax_types = np.asarray(tax_types, dtype=object)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        due_dates = _to_days(due_dates)
+        paid_on = _to_days(paid_on) if paid_on is not None else None
+        result = {key: np.zeros(len(amounts), dtype=np.int64) for key in
+                  ("days_late", "fixed_penalty", "daily_penalty", "interest", "total")}
+        for tax_type in set(tax_types.tolist()):
+            rows = np.flatnonzero(tax_types == tax_type)
+            charges = self.assess(
+                tax_type, amounts[rows], due_dates[rows], None if paid_on is None else paid_on[rows], as_of
+            )
+            for key, values in charges.items():
+                result[key][rows] = values
+        return result
+
+    def assess_one(self, tax_type: str, amount: Money, due_date: date, paid_on: Optional[date] = None,
+                   as_of: Optional[date] = None) -> Dict[str, Any]:
+        """Price one liability; amounts in the result are in ZMW."""
+        charges = self.assess(tax_type, [amount.ngwee], [due_date], [paid_on], as_of)
+        return {
+            key: int(values[0]) if key == "days_late" else float(to_kwacha(values[0]))
+            for key, values in charges.items()
+        }
@@ -0,0 +1,230 @@
+"""
+Rolling 12-month turnover per TPIN, for the VAT registration threshold.
+"""
+import threading
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from ..money import Money
+from .constants import VAT_REGISTRATION_THRESHOLD
+
+WINDOW_MONTHS = 12
+
+
+def month_index(day: date) -> int:
+    """Months since year 0 (January 2024 is 2024 * 12)."""
+    return day.year * 12 + day.month - 1
+
+
+def period_index(period) -> np.ndarray:
+    """Month indexes of YYYYMM periods."""
+    period = np.asarray(period, dtype=np.int64)
+    return (period // 100) * 12 + period % 100 - 1
+
+
+class TurnoverTracker:
+    """
+    Rolling 12-month sales totals per TPIN, with VAT registration status.
+
+    Each TPIN has twelve monthly buckets, one per calendar month slot, tagged
+    with the month they hold. A sale updates one bucket in O(1): a bucket
+    holding an older month is reset first, and a sale older than the month
+    in its slot is outside every current window and is dropped. The result
+    does not depend on the order sales arrive in. Turnover up to a month is
+    the sum of the buckets holding the twelve months ending there.
+
+    Unregistered TPINs whose turnover exceeds the registration threshold are
+    flagged as sales arrive, once registrations have been loaded: until
+    then every TPIN would count as unregistered. A TPIN whose turnover falls
+    back under the threshold loses its flag, so crossing again is reported
+    again.
+    """
+
+    def __init__(self, threshold: float = VAT_REGISTRATION_THRESHOLD, capacity: int = 1024):
+        """
+        Initialize the tracker.
+
+        Args:
+            threshold: Annual turnover requiring VAT registration, ZMW
+            capacity: Initial number of TPINs
+        """
+        self.threshold = Money.from_kwacha(threshold)
+        self._rows: Dict[str, int] = {}
+        self._tpins: List[str] = []
+        self._sales = np.zeros((capacity, WINDOW_MONTHS), dtype=np.int64)   # ngwee
+        self._months = np.full((capacity, WINDOW_MONTHS), -1, dtype=np.int64)
+        self._registered = np.zeros(capacity, dtype=bool)
+        self._flagged = np.zeros(capacity, dtype=bool)
+        self._latest = -1
+        self.registrations_loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tpins)
+
+    def _row(self, tpin: str) -> int:
+        row = self._rows.get(tpin)
+        if row is None:
+            row = self._rows[tpin] = len(self._tpins)
+            self._tpins.append(tpin)
+            if row >= len(self._registered):
+                grow = len(self._registered)
+                self._sales = np.vstack([self._sales, np.zeros_like(self._sales[:grow])])
+                self._months = np.vstack([self._months, np.full_like(self._months[:grow], -1)])
+                self._registered = np.concatenate([self._registered, np.zeros(grow, dtype=bool)])
+                self._flagged = np.concatenate([self._flagged, np.zeros(grow, dtype=bool)])
+        return row
+
+    def set_registered(self, tpins: Iterable[str], registered: bool = True) -> None:
+        """Record the VAT registration status of TPINs; breaches are reported from then on."""
+        with self._lock:
+            for tpin in tpins:
+                self._registered[self._row(tpin)] = registered
+            self.registrations_loaded = True
+
+    def load_registrations(self, path: str) -> int:
+        """
+        Mark the TPINs listed in a file (one per line) as VAT registered.
+
+        Returns:
+            int: Number of TPINs read
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            tpins = [line.strip() for line in fh if line.strip()]
+        self.set_registered(tpins)
+        return len(tpins)
+
+    def is_registered(self, tpin: str) -> bool:
+        """Whether a TPIN is registered for VAT; unknown TPINs are not."""
+        row = self._rows.get(tpin)
+        return row is not None and bool(self._registered[row])
+
+    def add_sale(self, tpin: str, sale_date: date, amount: Any) -> bool:
+        """
+        Add one sale (ZMW, or Money; negative for credit notes).
+
+        Returns:
+            bool: True if this sale made an unregistered TPIN cross the threshold
+        """
+        month = month_index(sale_date)
+        ngwee = Money.from_kwacha(amount).ngwee
+        with self._lock:
+            latest = self._latest
+            row = self._row(tpin)
+            slot = month % WINDOW_MONTHS
+            if self._months[row, slot] < month:
+                self._months[row, slot] = month
+                self._sales[row, slot] = 0
+            if self._months[row, slot] == month:
+                self._sales[row, slot] += ngwee
+            self._latest = max(self._latest, month)
+            return len(self._flag(np.array([row]), latest)) > 0
+
+    def add_sales(self, tpins: Sequence[str], periods, amounts) -> List[str]:
+        """
+        Add a batch of sales, e.g. per-period totals from a VATLedger.
+
+        Args:
+            tpins: TPIN of each sale
+            periods: YYYYMM of each sale
+            amounts: int64 amounts in ngwee
+
+        Returns:
+            list: TPINs that crossed the threshold while unregistered
+        """
+        months = period_index(periods)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        if not len(months):
+            return []
+        with self._lock:
+            latest = self._latest
+            rows = np.fromiter((self._row(tpin) for tpin in tpins), dtype=np.int64, count=len(months))
+            cells = rows * WINDOW_MONTHS + months % WINDOW_MONTHS
+
+            # Newest month per cell in this batch, and the batch's sales in it
+            order = np.lexsort((months, cells))
+            cells, months, amounts = cells[order], months[order], amounts[order]
+            starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            newest = months[np.r_[starts[1:], len(cells)] - 1]
+            in_newest = months == np.repeat(newest, np.diff(np.r_[starts, len(cells)]))
+            added = np.add.reduceat(np.where(in_newest, amounts, 0), starts)
+            cells = cells[starts]
+
+            held = self._months.reshape(-1)
+            sales = self._sales.reshape(-1)
+            month = np.maximum(held[cells], newest)
+            sales[cells] = np.where(held[cells] == month, sales[cells], 0) + np.where(newest == month, added, 0)
+            held[cells] = month
+            self._latest = max(self._latest, int(newest.max()))
+            return self._flag(np.unique(rows), latest)
+
+    def _flag(self, rows: np.ndarray, latest: int) -> List[str]:
+        """
+        Flag unregistered rows now over the threshold, and unflag rows back
+        under it. A new latest month moves every window, so all flagged rows
+        are checked again then. Caller holds the lock.
+        """
+        if self._latest != latest:
+            rows = np.union1d(rows, np.flatnonzero(self._flagged[:len(self._tpins)]))
+        over = self._turnover(rows, self._latest) > self.threshold.ngwee
+        self._flagged[rows[~over]] = False
+        if not self.registrations_loaded:
+            return []
+        new = rows[over & ~self._registered[rows] & ~self._flagged[rows]]
+        self._flagged[new] = True
+        return [self._tpins[row] for row in new.tolist()]
+
+    def _turnover(self, rows: np.ndarray, as_of: int) -> np.ndarray:
+        months = self._months[rows]
+        window = (months <= as_of) & (months > as_of - WINDOW_MONTHS)
+        return np.where(window, self._sales[rows], 0).sum(axis=1)
+
+    def _as_of(self, as_of: Optional[date]) -> int:
+        return self._latest if as_of is None else month_index(as_of)
+
+    def turnover(self, tpin: str, as_of: Optional[date] = None) -> Money:
+        """
+        Sales in the twelve months up to as_of (default: the latest month seen).
+
+        Only the latest twelve months are kept, so for an earlier as_of the
+        months before the current window are no longer counted.
+        """
+        with self._lock:
+            row = self._rows.get(tpin)
+            if row is None:
+                return Money(0)
+            return Money(int(self._turnover(np.array([row]), self._as_of(as_of))[0]))
+
+    def registration_status(self, tpin: str, as_of: Optional[date] = None) -> Dict[str, Any]:
+        """Registration, rolling turnover and whether registration is required."""
+        turnover = self.turnover(tpin, as_of)
+        registered = self.is_registered(tpin)
+        required = turnover > self.threshold
+        return {
+            "tpin": tpin,
+            "vat_registered": registered,
+            "rolling_turnover": turnover.to_kwacha(),
+            "threshold": self.threshold.to_kwacha(),
+            "registration_required": required,
+            "breach": required and not registered and self.registrations_loaded,
+            "registrations_loaded": self.registrations_loaded,
+        }
+
+    def breaches(self, as_of: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Unregistered TPINs over the threshold, largest turnover first; none
+        until registrations are loaded.
+        """
+        if not self.registrations_loaded:
+            return []
+        with self._lock:
+            rows = np.arange(len(self._tpins))
+            turnover = self._turnover(rows, self._as_of(as_of))
+            over = np.flatnonzero((turnover > self.threshold.ngwee) & ~self._registered[rows])
+            over = over[np.argsort(-turnover[over], kind="stable")]
+            return [
+                {"tpin": self._tpins[row], "rolling_turnover": Money(int(turnover[row])).to_kwacha()}
+                for row in over.tolist()
+            ]
@@ -5,6 +5,7 @@ import re
 from datetime import datetime,date
 from typing import Optional, Tuple
 
+from ..money import Money
 from .constants import TPIN_LENGTH, TPIN_PREFIX, TPIN_REGEX
 from .exceptions import InvalidTPINError, InvalidDocumentError
 
@@ -57,25 +58,29 @@ def validate_tax_period(tax_period: str) -> tuple[datetime, datetime]:
     except ValueError as e:
         raise InvalidDocumentError(f"Invalid tax period format. Use YYYY-MM: {e}")
 
-def validate_amount(amount: float, minimum: Optional[float] = 0) -> None:
+def validate_amount(amount: float, minimum: Optional[float] = 0) -> Money:
     """
     Validate tax amount.
     
+    The comparison is made in whole ngwee, so it is exact.
+    
     Args:
-        amount: The amount to validate
+        amount: The amount to validate (ZMW, or Money)
         minimum: Optional minimum allowed amount
         
     Returns:
-        bool: True if amount is valid
+        Money: The amount rounded to the nearest ngwee
         
     Raises:
         ValueError: If amount is invalid
     """
-    if not isinstance(amount, (int, float)):
+    if isinstance(amount, bool) or not isinstance(amount, (int, float, Money)):
         raise ValueError("Amount must be a number")
     
-    if amount < minimum:
+    value = Money.from_kwacha(amount)
+    if minimum is not None and value < Money.from_kwacha(minimum):
         raise ValueError(f"Amount must be greater than {minimum}")
+    return value
     
 def validate_filing_period(filing_period: date) -> None:
     """
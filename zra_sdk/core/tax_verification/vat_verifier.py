@@ -6,6 +6,9 @@ from typing import Dict,Any,Optional
 from .base_verifier import BaseTaxVerifier
 from .constants import VerificationStatus,ComplianceStatus,FilingMode
 from .exceptions import InvalidTPINError
+from .penalties import PenaltyEngine
+from .turnover import TurnoverTracker
+from ..money import Money
 
 class VATVerifier(BaseTaxVerifier):
     """Verification logic for Value Added Tax (VAT)."""
@@ -14,6 +17,17 @@ class VATVerifier(BaseTaxVerifier):
        FilingMode.ELECTRONIC : 18
     }
 
+    def __init__(self, turnover: Optional[TurnoverTracker] = None, penalties: Optional[PenaltyEngine] = None):
+        """
+        Args:
+            turnover: Registrations and rolling turnover to check VAT
+                registration against; without it, or before registrations
+                are loaded into it, every TPIN counts as registered
+            penalties: Prices late returns when verify is given the VAT due
+        """
+        self.turnover = turnover
+        self.penalties = penalties
+
     def get_due_date(self, filing_mode: FilingMode, filing_period: date) -> date:
         """ Calculate VAT filing due date based on filing mode
         
@@ -35,7 +49,8 @@ class VATVerifier(BaseTaxVerifier):
         
         return date(year, next_month, day)
 
-    def verify(self, tpin: str, filing_mode: FilingMode, filing_period: date, filed_on:Optional[date] = None) -> Dict[str,Any]:
+    def verify(self, tpin: str, filing_mode: FilingMode, filing_period: date, filed_on:Optional[date] = None,
+               vat_due: Optional[Money] = None) -> Dict[str,Any]:
         """Verify VAT compliance for a given TPIN.
         
         Args:
@@ -43,6 +58,8 @@ class VATVerifier(BaseTaxVerifier):
             filing_mode: Mode of filing (Manual or electronic)
             filing_period: The tax period (Month/Year)
             filed_on: Optional date when the return was filed
+            vat_due: Optional VAT due for the period; with a penalty engine,
+                a late return gets its penalty and interest
             
             Returns: 
                 Dict containing verification results with status and compliance info
@@ -55,12 +72,18 @@ class VATVerifier(BaseTaxVerifier):
                         "status":VerificationStatus.REJECTED.value,
                         "reason": str(e)}
         #Check VAT registration
-        #NOTE: This is a placeholder for actual registration check(against database/API)
         registered_vat = self._check_vat_registration(tpin)
         if not registered_vat:
-            return {"tpin": tpin,
-                    "status": VerificationStatus.REJECTED.value,
-                    "reason": "Not registered for VAT"}
+            result = {"tpin": tpin,
+                      "status": VerificationStatus.REJECTED.value,
+                      "reason": "Not registered for VAT"}
+            if self.turnover is not None:
+                registration = self.turnover.registration_status(tpin)
+                result["rolling_turnover"] = registration["rolling_turnover"]
+                result["registration_required"] = registration["registration_required"]
+                if registration["registration_required"]:
+                    result["reason"] = "Not registered for VAT although turnover exceeds the registration threshold"
+            return result
         
         #Calculate due date
         due_date = self.get_due_date(filing_mode, filing_period)
@@ -87,7 +110,7 @@ class VATVerifier(BaseTaxVerifier):
             }
         else:
              late_days = (filed_on - due_date).days
-             return {
+             result = {
                   "tpin": tpin,
                   "status": VerificationStatus.VERIFIED.value,
                   "compliance": ComplianceStatus.NON_COMPLIANT.value,
@@ -96,8 +119,12 @@ class VATVerifier(BaseTaxVerifier):
                   "filing_period": filing_period.isoformat(),
                   "late_by": late_days
              }
+             if self.penalties is not None and vat_due is not None:
+                  result["penalty"] = self.penalties.assess_one("VAT", vat_due, due_date, filed_on)
+             return result
     def _check_vat_registration(self, tpin: str) -> bool:
-        """Placeholder method to check if TPIN is registered for VAT.
+        """Check if TPIN is registered for VAT, using the turnover tracker's
+        registrations when one is attached.
         
         Args:
             tpin: Taxpayer Identification Number
@@ -105,5 +132,7 @@ class VATVerifier(BaseTaxVerifier):
             Returns:
                 bool: True if registered, False otherwise
         """
-        return True
+        if self.turnover is None or not self.turnover.registrations_loaded:
+            return True
+        return self.turnover.is_registered(tpin)
     
\ No newline at end of file
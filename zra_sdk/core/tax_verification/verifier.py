@@ -16,24 +16,28 @@ from .exceptions import (
 from .validators import validate_tpin, validate_tax_period
 from ..taxpayer.models import Taxpayer, TaxRegistration
 from ..taxpayer.status import ComplianceChecker
+from .turnover import TurnoverTracker
 from .vat_verifier import VATVerifier
 
 
 class TaxVerificationService:
     """Main service for tax verification operations."""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, turnover: Optional[TurnoverTracker] = None):
         """
         Initialize the tax verification service.
         
         Args:
             api_key: Optional API key for ZRA services
+            turnover: VAT registrations and rolling turnover that VAT
+                registration checks are answered from, e.g. the shared
+                api.taxpayer_api.get_turnover_tracker()
         """
         self.api_key = api_key
         self._compliance_checker = ComplianceChecker()
         # Registry of tax-type specific verifiers
         self._verifiers: Dict[TaxType, Any] = {
-            TaxType.VAT: VATVerifier()
+            TaxType.VAT: VATVerifier(turnover=turnover)
         }
     
     async def verify_taxpayer(self, tpin: str) -> Taxpayer:
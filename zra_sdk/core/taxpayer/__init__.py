@@ -11,6 +11,8 @@ from .models import (
     BusinessCategory,
 )
 from .status import ComplianceChecker
+from .incremental import ComplianceEngine, ComplianceEvent, ComplianceEventType
+from .audits import AuditScheduler
 
 __all__ = [
     "Taxpayer",
@@ -20,4 +22,8 @@ __all__ = [
     "Contact",
     "BusinessCategory",
     "ComplianceChecker",
+    "ComplianceEngine",
+    "ComplianceEvent",
+    "ComplianceEventType",
+    "AuditScheduler",
 ]
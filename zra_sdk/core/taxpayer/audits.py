@@ -0,0 +1,450 @@
+"""
+Risk-ranked audit scheduling with per-tax-center weekly capacity.
+
+Taxpayers whose audit is due by the end of a week are ranked by
+
+    priority = RISK_WEIGHTS[risk level] + (100 - compliance score) / 100
+               + days overdue / OVERDUE_DAYS_PER_POINT
+
+with days overdue counted at the end of the week. For every taxpayer due by
+then, this is a fixed key (the same formula with the due date in place of
+the week's end) plus a term shared by all of them. The ranking therefore
+does not change as weeks pass, and the keys are kept in heaps per tax
+center:
+
+- a ready heap of taxpayers already due, highest priority first;
+- a pending heap of taxpayers due later, earliest due date first. Planning a
+  week moves those due by its end into the ready heap.
+
+A compliance change pushes a new entry for the taxpayer and leaves the old
+one behind. Stale entries are skipped when they come up, and a tax center's
+heaps are rebuilt once stale entries outnumber live ones. A plan pops up to
+each tax center's capacity from its ready heap. Plain plans push the
+entries back; committed plans keep the taxpayers out of the queue until
+their audit is recorded.
+"""
+import heapq
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+RISK_WEIGHTS = {"High": 3.0, "Medium": 2.0, "Low": 1.0}
+DEFAULT_RISK_WEIGHT = RISK_WEIGHTS["Medium"]
+DEFAULT_SCORE = 50.0
+OVERDUE_DAYS_PER_POINT = 90
+
+# Days from an audit to the next one, by risk level
+AUDIT_INTERVALS = {"High": 180, "Medium": 365, "Low": 730}
+DEFAULT_AUDIT_INTERVAL = AUDIT_INTERVALS["Medium"]
+
+UNASSIGNED = "Unassigned"
+
+# Heaps are rebuilt when a tax center has more stale entries than this and
+# than live ones
+_MIN_STALE = 1024
+
+
+def parse_capacities(text: str) -> Dict[str, int]:
+    """Parse per-tax-center capacities written as "Lusaka=50,Ndola=20"."""
+    capacities = {}
+    for item in (text or "").split(","):
+        if item.strip():
+            center, _, capacity = item.partition("=")
+            capacities[center.strip()] = int(capacity)
+    return capacities
+
+
+def _day(value: Any) -> Optional[int]:
+    """A date, or an ISO date string, as a day number (None if missing or invalid)."""
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+@dataclass
+class _Entry:
+    """A taxpayer's place in the audit queue."""
+    __slots__ = ("tax_center", "risk_level", "compliance_score", "due", "last_audit", "version", "scheduled")
+    tax_center: str
+    risk_level: Optional[str]
+    compliance_score: Optional[float]
+    due: int
+    last_audit: Optional[int]
+    version: int
+    scheduled: Optional[int]  # start of the week the audit is scheduled in
+
+    @property
+    def key(self) -> float:
+        """Priority with the due date in place of the week's end."""
+        score = DEFAULT_SCORE if self.compliance_score is None else self.compliance_score
+        return (
+            RISK_WEIGHTS.get(self.risk_level, DEFAULT_RISK_WEIGHT)
+            + (100 - score) / 100
+            - self.due / OVERDUE_DAYS_PER_POINT
+        )
+
+
+class AuditScheduler:
+    """Priority queue of taxpayers due for audit, planned week by week."""
+
+    def __init__(self, capacities: Optional[Dict[str, int]] = None, default_capacity: int = 20):
+        """
+        Initialize an empty scheduler.
+
+        Args:
+            capacities: Audits per week by tax center
+            default_capacity: Audits per week of tax centers not in capacities
+        """
+        self.capacities = dict(capacities or {})
+        self.default_capacity = default_capacity
+        self.state = "ready"
+        self.error: Optional[str] = None  # why the last background load failed
+        self._entries: Dict[str, _Entry] = {}
+        self._ready: Dict[str, List[Tuple[float, str, int]]] = {}
+        self._pending: Dict[str, List[Tuple[int, float, str, int]]] = {}
+        self._stale: Dict[str, int] = {}
+        self._horizon = date.today().toordinal()
+        self._backlog: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data_source(cls, source, capacities: Optional[Dict[str, int]] = None, default_capacity: int = 20,
+                         today: Optional[date] = None) -> "AuditScheduler":
+        """
+        Queue every taxpayer of a data source, with its compliance record.
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        scheduler = cls(capacities, default_capacity)
+        scheduler.load(_source_records(source), today)
+        return scheduler
+
+    def load_in_background(self, source, today: Optional[date] = None) -> threading.Thread:
+        """
+        Queue every taxpayer of a data source from a daemon thread.
+
+        Updates made meanwhile are applied once the records are loaded. state
+        is "loading" until then, and "unavailable" if the source cannot
+        list its records or the load fails; error then says why it failed.
+        Updates made before a failure are dropped.
+        """
+        with self._lock:
+            self.state = "loading"
+            self.error = None
+            self._backlog = []
+
+        def run():
+            try:
+                self.load(_source_records(source), today)
+            except Exception as e:
+                if not isinstance(e, NotImplementedError):
+                    logger.exception("Could not load the audit queue")
+                with self._lock:
+                    self.error = None if isinstance(e, NotImplementedError) else str(e) or type(e).__name__
+                    self.state = "unavailable"
+                    self._backlog = None
+
+        thread = threading.Thread(target=run, name="audit-scheduler-load", daemon=True)
+        thread.start()
+        return thread
+
+    def load(self, records: Iterable[Tuple[str, Dict[str, Any], Dict[str, Any]]],
+             today: Optional[date] = None) -> int:
+        """
+        Queue taxpayers in bulk, replacing any queued before.
+
+        Args:
+            records: (TPIN, taxpayer record, compliance record) of every
+                taxpayer; records provide tax_center, and risk_level,
+                compliance_score, last_audit_date and next_audit_due
+            today: Date taxpayers never audited are due (default today)
+
+        Returns:
+            int: Number of taxpayers queued
+        """
+        today_day = (today or date.today()).toordinal()
+        entries = {}
+        for tpin, taxpayer, compliance in records:
+            risk_level = compliance.get("risk_level")
+            last_audit = _day(compliance.get("last_audit_date"))
+            due = _day(compliance.get("next_audit_due"))
+            if due is None:
+                due = today_day if last_audit is None else last_audit + AUDIT_INTERVALS.get(risk_level, DEFAULT_AUDIT_INTERVAL)
+            score = compliance.get("compliance_score")
+            entries[tpin] = _Entry(
+                taxpayer.get("tax_center") or UNASSIGNED, risk_level,
+                None if score is None else float(score), due, last_audit, 0, None
+            )
+
+        with self._lock:
+            self._entries = entries
+            self._horizon = today_day
+            self._rebuild()
+            backlog, self._backlog = self._backlog or [], None
+            for tpin, changes in backlog:
+                self._update(tpin, **changes)
+            self.state = "ready"
+        return len(entries)
+
+    def _rebuild(self, center: Optional[str] = None) -> None:
+        """Rebuild the heaps of one tax center, or of all. Caller holds the lock."""
+        centers = [center] if center is not None else list(self._ready)
+        for name in centers:
+            self._ready[name], self._pending[name], self._stale[name] = [], [], 0
+        for tpin, entry in self._entries.items():
+            if entry.scheduled is None and (center is None or entry.tax_center == center):
+                self._queue(tpin, entry, heapify=False)
+        for name in [center] if center is not None else list(self._ready):
+            heapq.heapify(self._ready[name])
+            heapq.heapify(self._pending[name])
+
+    def _queue(self, tpin: str, entry: _Entry, heapify: bool = True) -> None:
+        """Put an entry in its tax center's ready or pending heap. Caller holds the lock."""
+        center = entry.tax_center
+        if center not in self._ready:
+            self._ready[center], self._pending[center], self._stale[center] = [], [], 0
+        if entry.due <= self._horizon:
+            item, heap = (-entry.key, tpin, entry.version), self._ready[center]
+        else:
+            item, heap = (entry.due, -entry.key, tpin, entry.version), self._pending[center]
+        if heapify:
+            heapq.heappush(heap, item)
+        else:
+            heap.append(item)
+
+    def _retire(self, entry: _Entry) -> Optional[str]:
+        """
+        Leave an entry's heap item behind as stale. Caller holds the lock.
+
+        Returns:
+            str: The tax center of the stale item, if the entry was queued
+        """
+        if entry.scheduled is not None:
+            return None
+        self._stale[entry.tax_center] += 1
+        return entry.tax_center
+
+    def _compact(self, center: Optional[str]) -> None:
+        """Rebuild a tax center's heaps if stale items outnumber live ones. Caller holds the lock."""
+        if center is None:
+            return
+        live = len(self._ready[center]) + len(self._pending[center]) - self._stale[center]
+        if self._stale[center] > max(_MIN_STALE, live):
+            self._rebuild(center)
+
+    def update(
+        self,
+        tpin: str,
+        tax_center: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        compliance_score: Optional[float] = None,
+        next_audit_due: Any = None
+    ) -> None:
+        """
+        Requeue a taxpayer after a change; fields left as None keep their value.
+
+        A taxpayer not queued yet is added, due now unless next_audit_due
+        is given.
+        """
+        changes = {
+            "tax_center": tax_center, "risk_level": risk_level,
+            "compliance_score": compliance_score, "next_audit_due": next_audit_due,
+        }
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.append((tpin, changes))
+                return
+            self._update(tpin, **changes)
+
+    def _update(self, tpin, tax_center, risk_level, compliance_score, next_audit_due) -> None:
+        entry = self._entries.get(tpin)
+        if entry is None:
+            entry = self._entries[tpin] = _Entry(UNASSIGNED, None, None, date.today().toordinal(), None, 0, None)
+            stale = None
+        else:
+            stale = self._retire(entry)
+        entry.version += 1
+        if tax_center is not None:
+            entry.tax_center = tax_center
+        if risk_level is not None:
+            entry.risk_level = risk_level
+        if compliance_score is not None:
+            entry.compliance_score = float(compliance_score)
+        if _day(next_audit_due) is not None:
+            entry.due = _day(next_audit_due)
+        if entry.scheduled is None:
+            self._queue(tpin, entry)
+        self._compact(stale)
+
+    def record_audit(self, tpin: str, audit_date: Optional[date] = None) -> date:
+        """
+        Record a completed audit and requeue the taxpayer for the next one.
+
+        Returns:
+            date: When the next audit is due, by the taxpayer's risk level
+
+        Raises:
+            KeyError: If the taxpayer is not queued
+        """
+        audit_day = (audit_date or date.today()).toordinal()
+        with self._lock:
+            entry = self._entries[tpin]
+            stale = self._retire(entry)
+            entry.version += 1
+            entry.scheduled = None
+            entry.last_audit = audit_day
+            entry.due = audit_day + AUDIT_INTERVALS.get(entry.risk_level, DEFAULT_AUDIT_INTERVAL)
+            self._queue(tpin, entry)
+            self._compact(stale)
+            return date.fromordinal(entry.due)
+
+    def plan(
+        self,
+        week: Optional[date] = None,
+        weeks: int = 1,
+        tax_centers: Optional[Sequence[str]] = None,
+        commit: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Plan the audits of one or more weeks.
+
+        Each week, each tax center gets up to its capacity of the highest
+        priority taxpayers due by the end of the week and not planned in an
+        earlier week.
+
+        Args:
+            week: Any day of the first week (default this week); weeks start
+                on Monday
+            weeks: Number of consecutive weeks
+            tax_centers: Tax centers to plan (default all)
+            commit: Mark the planned taxpayers as scheduled, out of the queue
+                until record_audit
+
+        Returns:
+            list: One {"week_start", "week_end", "audits", "by_tax_center"}
+                dict per week; audits are highest priority first
+        """
+        start = _week_start(week or date.today())
+        plans = []
+        with self._lock:
+            centers = list(tax_centers) if tax_centers is not None else sorted(self._ready)
+            taken: List[Tuple[str, Tuple[float, str, int]]] = []
+            for offset in range(max(0, weeks)):
+                week_start = start + timedelta(weeks=offset)
+                end = week_start.toordinal() + 6
+                audits = []
+                for center in centers:
+                    if center not in self._ready:
+                        continue
+                    self._release(center, end)
+                    picked, later = self._pop(center, end, self.capacities.get(center, self.default_capacity))
+                    for item in later:
+                        heapq.heappush(self._ready[center], item)
+                    for item in picked:
+                        entry = self._entries[item[1]]
+                        audits.append(self._audit(item[1], entry, end))
+                        if commit:
+                            entry.scheduled = week_start.toordinal()
+                        else:
+                            taken.append((center, item))
+                audits.sort(key=lambda audit: -audit["priority"])
+                by_center: Dict[str, int] = {}
+                for audit in audits:
+                    by_center[audit["tax_center"]] = by_center.get(audit["tax_center"], 0) + 1
+                plans.append({
+                    "week_start": week_start.isoformat(),
+                    "week_end": date.fromordinal(end).isoformat(),
+                    "audits": audits,
+                    "by_tax_center": by_center,
+                })
+            for center, item in taken:
+                heapq.heappush(self._ready[center], item)
+        return plans
+
+    def _release(self, center: str, end: int) -> None:
+        """Move a tax center's taxpayers due by a day into its ready heap. Caller holds the lock."""
+        pending, ready = self._pending[center], self._ready[center]
+        while pending and pending[0][0] <= end:
+            _, key, tpin, version = heapq.heappop(pending)
+            heapq.heappush(ready, (key, tpin, version))
+        self._horizon = max(self._horizon, end)
+
+    def _pop(self, center: str, end: int, capacity: int) -> Tuple[list, list]:
+        """
+        Pop up to capacity live items due by a day. Caller holds the lock.
+
+        Returns:
+            tuple: (items picked, items due after the day, to push back)
+        """
+        ready = self._ready[center]
+        picked, later = [], []
+        while ready and len(picked) < capacity:
+            item = heapq.heappop(ready)
+            entry = self._entries.get(item[1])
+            if entry is None or entry.version != item[2] or entry.scheduled is not None or entry.tax_center != center:
+                self._stale[center] = max(0, self._stale[center] - 1)
+                continue
+            if entry.due > end:
+                later.append(item)
+            else:
+                picked.append(item)
+        return picked, later
+
+    @staticmethod
+    def _audit(tpin: str, entry: _Entry, end: int) -> Dict[str, Any]:
+        return {
+            "tpin": tpin,
+            "tax_center": entry.tax_center,
+            "risk_level": entry.risk_level,
+            "compliance_score": entry.compliance_score,
+            "next_audit_due": date.fromordinal(entry.due).isoformat(),
+            "days_overdue": max(0, end - entry.due),
+            "priority": round(entry.key + end / OVERDUE_DAYS_PER_POINT, 3),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Queued and scheduled taxpayers, and heap sizes by tax center."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "error": self.error,
+                "taxpayers": len(self._entries),
+                "scheduled": sum(entry.scheduled is not None for entry in self._entries.values()),
+                "tax_centers": {
+                    center: {
+                        "capacity": self.capacities.get(center, self.default_capacity),
+                        "ready": len(self._ready[center]),
+                        "pending": len(self._pending[center]),
+                        "stale": self._stale[center],
+                    }
+                    for center in sorted(self._ready)
+                },
+            }
+
+
+def _source_records(source, batch_size: int = 10000) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """(TPIN, taxpayer record, compliance record) of every taxpayer of a data source."""
+    batch = []
+    for tpin, taxpayer in source.iter_taxpayers():
+        batch.append((tpin, taxpayer))
+        if len(batch) >= batch_size:
+            yield from _with_compliance(source, batch)
+            batch = []
+    yield from _with_compliance(source, batch)
+
+
+def _with_compliance(source, batch):
+    compliance = source.get_compliance_many([tpin for tpin, _ in batch]) if batch else {}
+    return [(tpin, taxpayer, compliance.get(tpin) or {}) for tpin, taxpayer in batch]
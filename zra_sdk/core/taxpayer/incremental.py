@@ -0,0 +1,330 @@
+"""
+Incremental compliance tracking driven by filing, payment and penalty events.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from ..money import Money
+from ..tax_verification.constants import ComplianceStatus
+from .models import ComplianceRecord
+from .status import ComplianceChecker
+
+logger = logging.getLogger(__name__)
+
+# Lowest score reported as "Mostly Compliant" rather than "Non-Compliant"
+MOSTLY_COMPLIANT_SCORE = 70.0
+
+
+class ComplianceEventType(Enum):
+    """Kinds of change events that affect a taxpayer's compliance."""
+    FILING = "filing"
+    PAYMENT = "payment"
+    PENALTY = "penalty"
+
+
+@dataclass
+class ComplianceEvent:
+    """
+    A single change to a taxpayer's obligations.
+
+    ``delta`` is signed. For FILING events it is the change in outstanding
+    returns (+1 when a return falls due, -1 when it is filed). For PAYMENT
+    and PENALTY events it is the change in the outstanding amount in ZMW
+    (positive when assessed, negative when paid).
+    """
+    tpin: str
+    event_type: ComplianceEventType
+    delta: float
+    occurred_at: Optional[datetime] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'ComplianceEvent':
+        """Create a ComplianceEvent from a decoded JSON object"""
+        occurred_at = data.get('occurred_at')
+        return cls(
+            tpin=str(data['tpin']),
+            event_type=ComplianceEventType(data['type']),
+            delta=float(data.get('delta', 0)),
+            occurred_at=datetime.fromisoformat(occurred_at) if occurred_at else None
+        )
+
+
+@dataclass
+class _TaxpayerState:
+    """Running obligations of a single taxpayer, amounts in ngwee."""
+    outstanding_returns: int = 0
+    outstanding_payments: int = 0
+    penalties: int = 0
+    last_audit_date: Optional[str] = None
+    next_audit_due: Optional[str] = None
+
+    @classmethod
+    def from_compliance(cls, record: Dict[str, Any]) -> '_TaxpayerState':
+        """Starting state from a compliance record in the check_compliance format"""
+        return cls(
+            int(record.get('outstanding_returns') or 0),
+            Money.from_kwacha(record.get('outstanding_payments') or 0).ngwee,
+            Money.from_kwacha(record.get('penalties') or 0).ngwee,
+            record.get('last_audit_date'),
+            record.get('next_audit_due')
+        )
+
+
+def _status_label(record: ComplianceRecord) -> str:
+    """compliance_status in the wording of the data sources"""
+    if record.status == ComplianceStatus.COMPLIANT:
+        return "Fully Compliant"
+    if record.score >= MOSTLY_COMPLIANT_SCORE:
+        return "Mostly Compliant"
+    return "Non-Compliant"
+
+
+class ComplianceEngine:
+    """
+    Materialized view of compliance records kept up to date from change events.
+
+    Each event only touches the state of its own TPIN, and the affected
+    ComplianceRecord is rebuilt once per batch, so reads are plain dict lookups.
+    The first event of a TPIN starts from its record in ``source`` (any
+    DataSource), so deltas apply to the taxpayer's actual obligations.
+    """
+
+    def __init__(self, source=None):
+        """
+        Args:
+            source: DataSource seeding TPINs on their first event; without
+                one, they start with no obligations
+        """
+        self._source = source
+        self._states: Dict[str, _TaxpayerState] = {}
+        self._records: Dict[str, ComplianceRecord] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._offsets: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._follower: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.invalid_events = 0  # event file lines skipped as unreadable
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, tpin: str) -> bool:
+        return tpin in self._records
+
+    def subscribe(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Call listener(tpin, summary) after each change to a TPIN's record."""
+        self._listeners.append(listener)
+
+    def _notify(self, tpins: Iterable[str]) -> None:
+        for tpin in tpins:
+            summary = self._summaries[tpin]
+            for listener in self._listeners:
+                listener(tpin, summary)
+
+    def seed(
+        self,
+        tpin: str,
+        outstanding_returns: int = 0,
+        outstanding_payments: float = 0.0,
+        penalties: float = 0.0
+    ) -> ComplianceRecord:
+        """
+        Set the starting obligations of a taxpayer, e.g. from a registry snapshot.
+
+        Args:
+            tpin: Taxpayer Identification Number
+            outstanding_returns: Number of returns not yet filed
+            outstanding_payments: Unpaid tax in ZMW
+            penalties: Unpaid penalties in ZMW
+
+        Returns:
+            ComplianceRecord: The materialized record for the TPIN
+        """
+        with self._lock:
+            self._states[tpin] = _TaxpayerState(
+                outstanding_returns,
+                Money.from_kwacha(outstanding_payments).ngwee,
+                Money.from_kwacha(penalties).ngwee
+            )
+            record = self._refresh(tpin, datetime.utcnow())
+        self._notify([tpin])
+        return record
+
+    def apply(self, event: ComplianceEvent) -> ComplianceRecord:
+        """Apply a single event and return the updated record of its TPIN."""
+        self.apply_many([event])
+        return self._records[event.tpin]
+
+    def apply_many(self, events: Iterable[ComplianceEvent]) -> int:
+        """
+        Apply a batch of events.
+
+        Deltas are accumulated first and each affected TPIN is rebuilt once.
+        TPINs not seen before are seeded from the source with one bulk lookup.
+
+        Returns:
+            int: Number of events applied
+        """
+        events = list(events)
+        unseen = [tpin for tpin in dict.fromkeys(event.tpin for event in events) if tpin not in self._states]
+        # Looked up outside the lock, so reads are not held up by the source
+        seeds = self._source.get_compliance_many(unseen) if self._source is not None and unseen else {}
+
+        count = 0
+        dirty: Set[str] = set()
+        with self._lock:
+            for event in events:
+                state = self._states.get(event.tpin)
+                if state is None:
+                    seed = seeds.get(event.tpin)
+                    state = self._states[event.tpin] = (
+                        _TaxpayerState.from_compliance(seed) if seed is not None else _TaxpayerState()
+                    )
+
+                if event.event_type == ComplianceEventType.FILING:
+                    state.outstanding_returns = max(0, state.outstanding_returns + int(event.delta))
+                elif event.event_type == ComplianceEventType.PAYMENT:
+                    delta = Money.from_kwacha(event.delta).ngwee
+                    state.outstanding_payments = max(0, state.outstanding_payments + delta)
+                else:
+                    delta = Money.from_kwacha(event.delta).ngwee
+                    state.penalties = max(0, state.penalties + delta)
+
+                dirty.add(event.tpin)
+                count += 1
+
+            now = datetime.utcnow()
+            for tpin in dirty:
+                self._refresh(tpin, now)
+        self._notify(dirty)
+        return count
+
+    def consume_file(self, path: str) -> int:
+        """
+        Apply events appended to a JSON lines file since the last call.
+
+        Only complete lines are consumed, so a writer may append concurrently.
+        Lines that are not a valid event are skipped, counted in
+        invalid_events and logged, so they are not read again.
+
+        Args:
+            path: Path of the event log, one JSON event per line
+
+        Returns:
+            int: Number of events applied
+        """
+        if not os.path.exists(path):
+            return 0
+
+        offset = self._offsets.get(path, 0)
+        if os.path.getsize(path) < offset:
+            # The log was truncated or rotated, start over
+            offset = 0
+
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            chunk = fh.read()
+
+        end = chunk.rfind(b'\n') + 1
+        events = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(ComplianceEvent.from_json(json.loads(line)))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.invalid_events += 1
+                logger.warning("Skipping invalid event in %s: %r (%s)", path, line[:200], e)
+        self._offsets[path] = offset + end
+        return self.apply_many(events)
+
+    def consume_queue(self, events: 'queue.Queue[ComplianceEvent]', timeout: Optional[float] = None) -> int:
+        """
+        Drain and apply all events currently waiting on a queue.
+
+        Args:
+            events: Queue of ComplianceEvent objects
+            timeout: Seconds to wait for the first event, None to not wait
+
+        Returns:
+            int: Number of events applied
+        """
+        batch = []
+        try:
+            batch.append(events.get(block=timeout is not None, timeout=timeout))
+            while True:
+                batch.append(events.get_nowait())
+        except queue.Empty:
+            pass
+        return self.apply_many(batch)
+
+    def follow(self, path: str, interval: float = 1.0) -> None:
+        """
+        Tail an event file from a background thread until stop() is called.
+        Errors are logged and the file is read again after interval.
+        """
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.consume_file(path)
+                except Exception:
+                    logger.exception("Could not apply events from %s", path)
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._follower = threading.Thread(target=run, name="compliance-follower", daemon=True)
+        self._follower.start()
+
+    def stop(self) -> None:
+        """Stop the background follower, if any."""
+        self._stop.set()
+        if self._follower is not None:
+            self._follower.join()
+            self._follower = None
+
+    def get_record(self, tpin: str) -> Optional[ComplianceRecord]:
+        """Return the current compliance record of a TPIN, or None if unknown."""
+        record = self._records.get(tpin)
+        if record is not None and not record.is_valid:
+            with self._lock:
+                record = self._refresh(tpin, datetime.utcnow())
+        return record
+
+    def get_summary(self, tpin: str) -> Optional[Dict[str, Any]]:
+        """Return the compliance summary of a TPIN in the check_compliance format."""
+        if self.get_record(tpin) is None:
+            return None
+        return self._summaries[tpin]
+
+    def _refresh(self, tpin: str, now: datetime) -> ComplianceRecord:
+        """Rebuild the record and summary of a single TPIN. Caller holds the lock."""
+        state = self._states[tpin]
+        record = ComplianceChecker.build_record(
+            returns_filed=state.outstanding_returns == 0,
+            payments_current=state.outstanding_payments <= 0,
+            no_penalties=state.penalties <= 0,
+            now=now
+        )
+        self._records[tpin] = record
+        self._summaries[tpin] = {
+            "compliance_status": _status_label(record),
+            "compliance_score": record.score,
+            "outstanding_returns": state.outstanding_returns,
+            "outstanding_payments": Money(state.outstanding_payments).to_kwacha(),
+            "last_audit_date": state.last_audit_date,
+            "next_audit_due": state.next_audit_due,
+            "risk_level": ComplianceChecker.get_risk_level(record.score),
+            "compliance_issues": list(record.issues),
+            "penalties": Money(state.penalties).to_kwacha(),
+            "last_verified": record.last_verified.isoformat(),
+            "valid_until": record.valid_until.isoformat()
+        }
+        return record
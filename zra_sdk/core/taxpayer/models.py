@@ -1,14 +1,24 @@
 """
 Compatibility layer re-exporting taxpayer models from zra_sdk.models.
 """
-from ...models.taxpayer import (
-    Address,
-    Contact,
-    TaxRegistration,
-    ComplianceRecord,
-    BusinessCategory,
-    Taxpayer,
-)
+try:
+    from ...models.taxpayer import (
+        Address,
+        Contact,
+        TaxRegistration,
+        ComplianceRecord,
+        BusinessCategory,
+        Taxpayer,
+    )
+except ImportError:
+    from models.taxpayer import (
+        Address,
+        Contact,
+        TaxRegistration,
+        ComplianceRecord,
+        BusinessCategory,
+        Taxpayer,
+    )
 
 __all__ = [
     "Address",
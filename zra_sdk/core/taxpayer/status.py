@@ -5,6 +5,8 @@ from datetime import datetime, timedelta
 from typing import List, Optional, Tuple
 from calendar import monthrange
 
+import numpy as np
+
 from .models import ComplianceRecord
 from ..tax_verification.constants import ComplianceStatus
 
@@ -30,42 +32,85 @@ class ComplianceChecker:
         Returns:
             ComplianceRecord: Updated compliance record
         """
-        issues: List[str] = []
-        
         # TODO: Implement actual verification logic
         # This is a placeholder implementation
+        return ComplianceChecker.build_record(
+            returns_filed=not tax_returns or ComplianceChecker._verify_tax_returns(tpin),
+            payments_current=not tax_payments or ComplianceChecker._verify_tax_payments(tpin),
+            no_penalties=not penalties or ComplianceChecker._verify_penalties(tpin),
+        )
+
+    @staticmethod
+    def build_record(
+        returns_filed: bool,
+        payments_current: bool,
+        no_penalties: bool,
+        now: Optional[datetime] = None
+    ) -> ComplianceRecord:
+        """
+        Build a compliance record from the outcome of the individual checks.
+
+        Args:
+            returns_filed: Whether all tax returns have been filed
+            payments_current: Whether all tax payments are up to date
+            no_penalties: Whether there are no outstanding penalties
+            now: Verification timestamp, defaults to the current UTC time
+
+        Returns:
+            ComplianceRecord: Compliance record valid until the end of next month
+        """
+        issues: List[str] = []
         status = ComplianceStatus.COMPLIANT
         score = 100.0
-        
-        if tax_returns and not ComplianceChecker._verify_tax_returns(tpin):
+
+        if not returns_filed:
             issues.append("Outstanding tax returns")
             status = ComplianceStatus.NON_COMPLIANT
             score -= 30.0
-            
-        if tax_payments and not ComplianceChecker._verify_tax_payments(tpin):
+
+        if not payments_current:
             issues.append("Outstanding tax payments")
             status = ComplianceStatus.NON_COMPLIANT
             score -= 40.0
 
-        if penalties and not ComplianceChecker._verify_penalties(tpin):
+        if not no_penalties:
             issues.append("Unpaid penalties")
             status = ComplianceStatus.NON_COMPLIANT
             score -= 30.0
 
-        now = datetime.utcnow()
-        #Calculate valid_until as end of next month
-        next_month = now.month % 12 + 1
-        next_year = now.year + (1 if now.month == 12 else 0)
-        last_day = monthrange(next_year, next_month)[1]
-        valid_until = datetime(next_year, next_month, last_day, 23, 59, 59)
-
+        now = now or datetime.utcnow()
         return ComplianceRecord(
             status=status,
             last_verified=now,
-            valid_until=valid_until,
+            valid_until=ComplianceChecker.valid_until(now),
             issues=issues,
             score= max(0.0, score)
         )
+
+    @staticmethod
+    def valid_until(now: datetime) -> datetime:
+        """Return the expiry of a record verified at ``now`` (end of next month)."""
+        next_month = now.month % 12 + 1
+        next_year = now.year + (1 if now.month == 12 else 0)
+        last_day = monthrange(next_year, next_month)[1]
+        return datetime(next_year, next_month, last_day, 23, 59, 59)
+
+    @staticmethod
+    def get_risk_level(score: float) -> str:
+        """
+        Map a compliance score to a risk level.
+
+        Args:
+            score: Compliance score (0-100)
+
+        Returns:
+            str: "Low", "Medium" or "High"
+        """
+        if score >= 80:
+            return "Low"
+        if score >= 50:
+            return "Medium"
+        return "High"
     
     @staticmethod
     def check_compliance_status(record: ComplianceRecord) -> Tuple[bool, str]:
@@ -141,4 +186,50 @@ class ComplianceChecker:
         elif filing_history_months >= 12:
             score = min(100, score + 5)
 
-        return score
\ No newline at end of file
+        return score
+
+    @staticmethod
+    def calculate_compliance_scores(
+        returns_filed,
+        payments_current,
+        no_penalties,
+        filing_history_months=12
+    ) -> np.ndarray:
+        """
+        Vectorized calculate_compliance_score over a population of taxpayers.
+
+        Args:
+            returns_filed: Array of bools, whether all tax returns have been filed.
+            payments_current: Array of bools, whether all tax payments are up to date.
+            no_penalties: Array of bools, whether there are any outstanding penalties.
+            filing_history_months: Array (or scalar) of months of filing history.
+
+        Returns:
+            np.ndarray: float64 scores, element-wise equal to calculate_compliance_score.
+        """
+        score = np.full(np.shape(returns_filed), 100.0)
+        score += np.where(np.asarray(returns_filed, dtype=bool), 40.0, 0.0)
+        score += np.where(np.asarray(payments_current, dtype=bool), 40.0, 0.0)
+        score += np.where(np.asarray(no_penalties, dtype=bool), 30.0, 0.0)
+
+        # Adjust score based on filing history
+        history = np.asarray(filing_history_months)
+        return np.where(
+            history >= 24,
+            np.minimum(100.0, score + 10.0),
+            np.where(history >= 12, np.minimum(100.0, score + 5.0), score)
+        )
+
+    @staticmethod
+    def get_risk_levels(scores) -> np.ndarray:
+        """
+        Vectorized get_risk_level.
+
+        Args:
+            scores: Array of compliance scores
+
+        Returns:
+            np.ndarray: Array of "Low", "Medium" or "High"
+        """
+        scores = np.asarray(scores)
+        return np.where(scores >= 80, "Low", np.where(scores >= 50, "Medium", "High"))
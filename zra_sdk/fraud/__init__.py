@@ -0,0 +1,24 @@
+"""
+Fraud and anomaly detection for ZRA SDK
+"""
+from .carousel import CarouselConfig, CarouselRing, InvoiceGraph, InvoiceGraphBuilder, score_rings
+from .entity_resolution import EntityCluster, EntityResolver
+from .peer_stats import KLLSketch, PeerScore, PeerStatsIndex
+from .pipeline import DetectionConfig, DetectionPipeline, PipelineStats, TaxRecord
+
+__all__ = [
+    'CarouselConfig',
+    'CarouselRing',
+    'DetectionConfig',
+    'DetectionPipeline',
+    'EntityCluster',
+    'EntityResolver',
+    'InvoiceGraph',
+    'InvoiceGraphBuilder',
+    'KLLSketch',
+    'PeerScore',
+    'PeerStatsIndex',
+    'PipelineStats',
+    'TaxRecord',
+    'score_rings',
+]
@@ -0,0 +1,416 @@
+"""
+Carousel (circular trading) detection on the invoice graph.
+
+Invoice flows of a tax period become a directed graph, supplier -> buyer,
+stored in CSR form: int64 edge arrays, with parallel invoices merged into one
+edge carrying their total value. Goods in a carousel come back to where they
+started. Such rings are found in two steps:
+
+1. The graph is trimmed of edges below a value floor and of nodes with no
+   incoming or outgoing flow left. Both steps are vectorized and drop most
+   of the acyclic bulk of normal trade cheaply.
+2. Strongly connected components are found in the remaining core, and
+   short simple cycles are enumerated inside each one.
+
+Each cycle is scored by its value throughput (its smallest flow) and by the
+compliance records of its members. A missing trader collects VAT without
+filing or paying it.
+"""
+import heapq
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TPIN_SPAN = 1_000_000_000  # edge key = supplier * _TPIN_SPAN + buyer
+
+RING_WEIGHTS = {
+    "throughput": 0.35,
+    "non_compliant": 0.35,
+    "missing_trader": 0.3,
+}
+
+
+@dataclass
+class CarouselConfig:
+    """Limits and thresholds of ring detection; values in ZMW"""
+    max_cycle_length: int = 4
+    min_edge_value: float = 10_000.0    # flows below this never form a ring
+    max_cycles_per_component: int = 100
+    max_search_steps: int = 1_000_000   # per component, bounds dense components
+    value_scale: float = 1_000_000.0    # throughput that counts as fully suspicious
+
+
+@dataclass
+class CarouselRing:
+    """A cycle of invoice flows"""
+    tpins: List[str]          # in flow order; the last supplies the first
+    period: Optional[str]
+    throughput: float         # smallest flow along the cycle, ZMW
+    total_value: float        # sum of the flows along the cycle, ZMW
+    invoices: int
+    component_size: int       # taxpayers in the strongly connected component
+    score: float = 0.0
+    flags: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tpins": self.tpins,
+            "period": self.period,
+            "length": len(self.tpins),
+            "throughput": self.throughput,
+            "total_value": self.total_value,
+            "invoices": self.invoices,
+            "component_size": self.component_size,
+            "score": round(self.score, 3),
+            "flags": self.flags,
+        }
+
+
+def reduce_edges(supplier, buyer, period, amount) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Merge invoices into edges, per period.
+
+    Args:
+        supplier, buyer: int64 TPIN arrays; buyers < 0 (unregistered) and
+            self-invoices are ignored
+        period: int64 YYYYMM array
+        amount: int64 invoice values in ngwee
+
+    Returns:
+        dict: period -> (sorted edge keys, total value, invoice count)
+    """
+    supplier = np.asarray(supplier, dtype=np.int64)
+    buyer = np.asarray(buyer, dtype=np.int64)
+    period = np.asarray(period, dtype=np.int64)
+    amount = np.asarray(amount, dtype=np.int64)
+    keep = (buyer >= 0) & (buyer != supplier)
+    keys = supplier[keep] * _TPIN_SPAN + buyer[keep]
+    period, amount = period[keep], amount[keep]
+
+    edges = {}
+    for value in np.unique(period):
+        in_period = period == value
+        edges[int(value)] = _merge(keys[in_period], amount[in_period], np.ones(int(in_period.sum()), dtype=np.int64))
+    return edges
+
+
+def _merge(keys: np.ndarray, value: np.ndarray, count: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum value and count over equal keys; returns sorted unique keys."""
+    if not len(keys):
+        return keys, value, count
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(value[order], starts), np.add.reduceat(count[order], starts)
+
+
+class InvoiceGraphBuilder:
+    """Accumulates merged invoice edges per period from streamed chunks."""
+
+    def __init__(self):
+        self._pending: Dict[int, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {}
+        self._sizes: Dict[int, Tuple[int, int]] = {}  # period -> (pending edges, edges after last merge)
+
+    def add(self, supplier, buyer, period, amount) -> None:
+        """Add a chunk of invoices (see reduce_edges for the arguments)."""
+        self.add_edges(reduce_edges(supplier, buyer, period, amount))
+
+    def add_batch(self, batch: Any) -> None:
+        """Add a parsed invoice batch (api.vat_invoices.InvoiceBatch); values exclude VAT."""
+        self.add(batch.supplier, batch.buyer, batch.period, batch.net)
+
+    def add_edges(self, edges: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> None:
+        """Add the result of reduce_edges, e.g. computed in a worker process."""
+        for period, reduced in edges.items():
+            pending = self._pending.setdefault(period, [])
+            pending.append(reduced)
+            size, merged = self._sizes.get(period, (0, 0))
+            size += len(reduced[0])
+            # Re-merge once the pending edges double, so repeated flows don't pile up
+            if size > 2 * max(merged, 1024):
+                pending[:] = [self._combine(pending)]
+                size = merged = len(pending[0][0])
+            self._sizes[period] = (size, merged)
+
+    def periods(self) -> List[int]:
+        return sorted(self._pending)
+
+    def build(self, period: int) -> "InvoiceGraph":
+        """The graph of one YYYYMM period."""
+        pending = self._pending.get(period)
+        if not pending:
+            return InvoiceGraph.from_edges(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                                           np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), period)
+        keys, value, count = self._combine(pending)
+        supplier, buyer = np.divmod(keys, _TPIN_SPAN)
+        return InvoiceGraph.from_edges(supplier, buyer, value, count, period)
+
+    @staticmethod
+    def _combine(pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return _merge(*(np.concatenate(column) for column in zip(*pending)))
+
+
+class InvoiceGraph:
+    """Directed supplier -> buyer graph in CSR form; values in ngwee."""
+
+    def __init__(
+        self,
+        tpins: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        value: np.ndarray,
+        count: np.ndarray,
+        period: Optional[int] = None
+    ):
+        self.tpins = tpins        # node -> int64 TPIN, sorted
+        self.indptr = indptr      # edges of node i are indptr[i]:indptr[i + 1]
+        self.indices = indices    # edge -> buyer node
+        self.value = value        # edge -> total invoice value, ngwee
+        self.count = count        # edge -> number of invoices
+        self.period = period
+
+    @classmethod
+    def from_edges(cls, supplier, buyer, value, count, period: Optional[int] = None) -> "InvoiceGraph":
+        """Build from merged edges (unique supplier/buyer pairs)."""
+        supplier = np.asarray(supplier, dtype=np.int64)
+        buyer = np.asarray(buyer, dtype=np.int64)
+        tpins, nodes = np.unique(np.concatenate([supplier, buyer]), return_inverse=True)
+        src, dst = nodes[:len(supplier)], nodes[len(supplier):]
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(len(tpins) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(tpins)), out=indptr[1:])
+        return cls(tpins, indptr, dst[order], np.asarray(value, dtype=np.int64)[order],
+                   np.asarray(count, dtype=np.int64)[order], period)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.tpins)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def period_label(self) -> Optional[str]:
+        return None if self.period is None else f"{self.period // 100:04d}-{self.period % 100:02d}"
+
+    def _core(self, min_value: int) -> Tuple[np.ndarray, List[int], List[int], np.ndarray]:
+        """
+        The part of the graph that can hold cycles: edges worth at least
+        min_value ngwee, trimmed of nodes without incoming or outgoing flow
+        until a round removes under 1% of the edges.
+
+        Returns:
+            tuple: (graph node of each core node, core CSR indptr and
+                indices as lists, graph edge of each core edge)
+        """
+        src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+        edges = np.flatnonzero(self.value >= min_value)
+        while len(edges):
+            s, d = src[edges], self.indices[edges]
+            alive = (np.bincount(s, minlength=self.num_nodes) > 0) & (np.bincount(d, minlength=self.num_nodes) > 0)
+            keep = alive[s] & alive[d]
+            edges = edges[keep]
+            # Deep acyclic chains lose one layer per round; leave the rest to Tarjan
+            if keep.sum() > 0.99 * len(keep):
+                break
+
+        # Renumber the surviving nodes 0..k-1; edges stay in (src, dst) order.
+        # Trimming stops early, so drop edges into nodes left without
+        # outgoing flow: they lie on no cycle
+        nodes = np.unique(src[edges])
+        edges = edges[np.isin(self.indices[edges], nodes)]
+        local_src = np.searchsorted(nodes, src[edges])
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(local_src, minlength=len(nodes)), out=indptr[1:])
+        indices = np.searchsorted(nodes, self.indices[edges])
+        return nodes, indptr.tolist(), indices.tolist(), edges
+
+    def strongly_connected_components(self, min_value: int = 0, min_size: int = 2) -> List[np.ndarray]:
+        """
+        Strongly connected components of the graph restricted to edges worth
+        at least min_value ngwee, as arrays of node ids, largest first.
+        """
+        nodes, indptr, indices, _ = self._core(min_value)
+        return sorted(
+            (nodes[np.asarray(c)] for c in _tarjan(indptr, indices) if len(c) >= min_size),
+            key=len, reverse=True
+        )
+
+    def find_rings(self, config: Optional[CarouselConfig] = None) -> List[CarouselRing]:
+        """Short high-value cycles, highest throughput first."""
+        config = config or CarouselConfig()
+        nodes, indptr, indices, edge_ids = self._core(int(round(config.min_edge_value * 100)))
+        values = self.value[edge_ids].tolist()
+
+        rings: List[CarouselRing] = []
+        for component in _tarjan(indptr, indices):
+            if len(component) < 2:
+                continue
+            for cycle, edge_path in _cycles(component, indptr, indices, values, config):
+                flows = self.value[edge_ids[edge_path]]
+                rings.append(CarouselRing(
+                    tpins=[f"{int(t):09d}" for t in self.tpins[nodes[cycle]]],
+                    period=self.period_label(),
+                    throughput=int(flows.min()) / 100,
+                    total_value=int(flows.sum()) / 100,
+                    invoices=int(self.count[edge_ids[edge_path]].sum()),
+                    component_size=len(component),
+                ))
+        rings.sort(key=lambda ring: ring.throughput, reverse=True)
+        return rings
+
+
+def _tarjan(indptr: List[int], indices: List[int]) -> List[List[int]]:
+    """Iterative Tarjan; strongly connected components as node lists."""
+    n = len(indptr) - 1
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, indptr[root])]
+        while work:
+            v, i = work[-1]
+            if i < indptr[v + 1]:
+                work[-1] = (v, i + 1)
+                w = indices[i]
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, indptr[w]))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[v] < low[parent]:
+                    low[parent] = low[v]
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def _cycles(
+    component: List[int],
+    indptr: List[int],
+    indices: List[int],
+    values: List[int],
+    config: CarouselConfig
+) -> List[Tuple[List[int], List[int]]]:
+    """
+    Simple cycles of up to max_cycle_length nodes within one component,
+    each found once (from its smallest node), keeping those with the
+    highest throughput.
+
+    Returns:
+        list: (nodes, edge positions) per cycle
+    """
+    members = set(component)
+    best: List[Tuple[int, int, List[int], List[int]]] = []  # min-heap of (throughput, tiebreak, nodes, edges)
+    steps = 0
+    found = 0
+
+    for start in sorted(component):
+        # Depth-first over paths start -> ... that only visit nodes above start
+        path, edge_path, on_path = [start], [], {start}
+        work = [indptr[start]]
+        while work and steps < config.max_search_steps:
+            v = path[-1]
+            i = work[-1]
+            if i >= indptr[v + 1]:
+                work.pop()
+                on_path.discard(path.pop())
+                if edge_path:
+                    edge_path.pop()
+                continue
+            work[-1] = i + 1
+            steps += 1
+            w = indices[i]
+            if w == start and len(path) >= 2:
+                edges = edge_path + [i]
+                throughput = min(values[e] for e in edges)
+                found += 1
+                item = (throughput, found, list(path), edges)
+                if len(best) < config.max_cycles_per_component:
+                    heapq.heappush(best, item)
+                elif throughput > best[0][0]:
+                    heapq.heapreplace(best, item)
+            elif w > start and w in members and w not in on_path and len(path) < config.max_cycle_length:
+                path.append(w)
+                edge_path.append(i)
+                on_path.add(w)
+                work.append(indptr[w])
+    return [(nodes, edges) for _, _, nodes, edges in sorted(best, reverse=True)]
+
+
+def score_rings(
+    rings: Sequence[CarouselRing],
+    lookup: Callable[[List[str]], Iterable[Mapping[str, Any]]],
+    config: Optional[CarouselConfig] = None
+) -> List[CarouselRing]:
+    """
+    Score rings with the compliance records of their members.
+
+    Args:
+        rings: Rings from InvoiceGraph.find_rings
+        lookup: Bulk compliance lookup returning one record with a "tpin"
+            per TPIN, e.g. api.taxpayer_api.check_compliance_many
+        config: Detection configuration
+
+    Returns:
+        list: The rings, highest score first
+    """
+    config = config or CarouselConfig()
+    tpins = sorted({tpin for ring in rings for tpin in ring.tpins})
+    records = {record["tpin"]: record for record in lookup(tpins)} if tpins else {}
+
+    for ring in rings:
+        members = [records.get(tpin) or {} for tpin in ring.tpins]
+        non_compliant = sum(
+            1 for record in members
+            if record.get("risk_level") == "High" or _number(record.get("compliance_score"), 100) < 50
+        ) / len(members)
+        missing_traders = [
+            tpin for tpin, record in zip(ring.tpins, members)
+            if _number(record.get("outstanding_returns")) > 0 and _number(record.get("outstanding_payments")) > 0
+        ]
+        throughput = min(1.0, math.log1p(ring.throughput) / math.log1p(config.value_scale))
+
+        ring.flags = []
+        if throughput >= 1.0:
+            ring.flags.append("high_throughput")
+        if non_compliant >= 0.5:
+            ring.flags.append("non_compliant_members")
+        ring.flags.extend(f"missing_trader:{tpin}" for tpin in missing_traders)
+        ring.score = (
+            RING_WEIGHTS["throughput"] * throughput
+            + RING_WEIGHTS["non_compliant"] * non_compliant
+            + RING_WEIGHTS["missing_trader"] * (1.0 if missing_traders else 0.0)
+        )
+    return sorted(rings, key=lambda ring: ring.score, reverse=True)
+
+
+def _number(value: Any, default: float = 0) -> float:
+    return default if value is None or value == "" else float(value)
@@ -0,0 +1,318 @@
+"""
+Detection of the same entity registered under multiple TPINs.
+
+Records are linked when they share a normalized phone number or email, or
+when their names are near-duplicates. Name candidates are blocked with
+MinHash/LSH, so only records that land in a common LSH bucket are ever
+compared and matching stays sub-quadratic on large registries.
+"""
+import re
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from utils.validators import validate_email, validate_phone
+
+# Legal-form words that do not distinguish one business from another
+LEGAL_SUFFIXES = {
+    "ltd", "limited", "plc", "co", "company", "inc", "incorporated",
+    "corp", "corporation", "llc", "llp", "the",
+}
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a Zambian phone number to +260XXXXXXXXX.
+
+    Returns:
+        str or None: The normalized number, None if it is not a valid number
+    """
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", phone)
+    if digits.startswith("260"):
+        candidate = "+" + digits
+    elif digits.startswith("0"):
+        candidate = "+260" + digits[1:]
+    else:
+        candidate = "+260" + digits
+    return candidate if validate_phone(candidate) else None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """
+    Normalize an email address: lowercase and drop any +tag from the local part.
+
+    Returns:
+        str or None: The normalized address, None if it is not a valid address
+    """
+    if not email:
+        return None
+    email = email.strip().lower()
+    if not validate_email(email):
+        return None
+    local, domain = email.rsplit("@", 1)
+    return f"{local.split('+', 1)[0]}@{domain}"
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase, strip punctuation and legal suffixes, and sort the words."""
+    if not name:
+        return ""
+    words = [w for w in _NON_ALNUM.split(name.lower()) if w and w not in LEGAL_SUFFIXES]
+    return " ".join(sorted(words))
+
+
+@lru_cache(maxsize=65536)
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Character shingles of a normalized name."""
+    if len(text) <= size:
+        return frozenset([text] if text else [])
+    return frozenset(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def jaccard(a: str, b: str) -> float:
+    """Jaccard similarity of the shingle sets of two normalized names."""
+    sa, sb = shingles(a), shingles(b)
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+
+@dataclass
+class EntityCluster:
+    """TPINs that appear to belong to the same entity"""
+    tpins: List[str]
+    reasons: Set[str] = field(default_factory=set)  # phone, email, name, business_name
+
+
+class _UnionFind:
+    """Disjoint sets over record indices."""
+
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+
+    def find(self, item: int) -> int:
+        parent = self.parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self.parent[parent]
+            self.parent[item] = grandparent
+            item, parent = parent, grandparent
+        return item
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class _LSHField:
+    """MinHash/LSH band keys of one name field, stored compactly."""
+
+    def __init__(self, hashes: Tuple[np.ndarray, np.ndarray], band_mix: np.ndarray, bands: int):
+        self.a, self.b = hashes
+        self.band_mix = band_mix
+        self.bands = bands
+        self.indices = array("q")
+        self.keys = array("I")
+
+    def add_chunk(self, indices: List[int], names: List[str]) -> None:
+        """Compute MinHash signatures for a chunk of names in one vectorized pass."""
+        hashed: List[int] = []
+        offsets: List[int] = []
+        kept: List[int] = []
+        for index, name in zip(indices, names):
+            grams = shingles(name)
+            if not grams:
+                continue
+            offsets.append(len(hashed))
+            kept.append(index)
+            hashed.extend(zlib.crc32(g.encode()) for g in grams)
+        if not kept:
+            return
+
+        values = np.asarray(hashed, dtype=np.uint64)
+        # Multiply-shift hashing, one row per permutation (wraps mod 2**64)
+        permuted = (self.a[:, None] * values[None, :] + self.b[:, None]) >> np.uint64(32)
+        signatures = np.minimum.reduceat(permuted, offsets, axis=1).T  # (records, num_perm)
+
+        rows = signatures.reshape(len(kept), self.bands, -1)
+        band_keys = ((rows * self.band_mix).sum(axis=2) >> np.uint64(32)).astype(np.uint32)
+        # Salt each band so equal keys in different bands do not collide
+        band_keys ^= np.arange(self.bands, dtype=np.uint32) * np.uint32(0x9E3779B1)
+
+        self.indices.extend(kept)
+        self.keys.extend(band_keys.ravel().tolist())
+
+    def candidate_groups(self, max_bucket: int) -> Iterable[np.ndarray]:
+        """Yield groups of record indices that share a band key."""
+        if not self.indices:
+            return
+        indices = np.frombuffer(self.indices, dtype=np.int64)
+        keys = np.frombuffer(self.keys, dtype=np.uint32).reshape(len(indices), self.bands)
+        for band in range(self.bands):
+            column = keys[:, band]
+            order = np.argsort(column, kind="stable")
+            sorted_keys = column[order]
+            boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(sorted_keys)]))
+            sizes = ends - starts
+            useful = (sizes > 1) & (sizes <= max_bucket)
+            for start, end in zip(starts[useful], ends[useful]):
+                yield indices[order[start:end]]
+
+
+class EntityResolver:
+    """
+    Clusters taxpayer records that appear to be the same entity.
+
+    Phones and emails are exact blocking keys. Names and business names are
+    blocked with MinHash/LSH and candidate pairs are confirmed by shingle
+    Jaccard similarity. A personal name match alone is weak evidence, so it
+    also requires a partially similar business name.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.6,
+        num_perm: int = 48,
+        bands: int = 12,
+        max_bucket: int = 500,
+        chunk_size: int = 10_000,
+        seed: int = 1
+    ):
+        """
+        Initialize the resolver.
+
+        Args:
+            threshold: Minimum name similarity (Jaccard) to link two records
+            num_perm: MinHash permutations, must be divisible by bands
+            bands: LSH bands; more bands find less similar pairs
+            max_bucket: LSH buckets larger than this are too common to be
+                informative and are skipped
+            chunk_size: Records hashed per vectorized batch
+            seed: Seed for the hash functions
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.max_bucket = max_bucket
+        self.chunk_size = chunk_size
+
+        rng = np.random.default_rng(seed)
+        bound = np.iinfo(np.uint64).max
+
+        def hash_family() -> Tuple[np.ndarray, np.ndarray]:
+            a = rng.integers(1, bound, size=num_perm, dtype=np.uint64) | np.uint64(1)
+            b = rng.integers(0, bound, size=num_perm, dtype=np.uint64)
+            return a, b
+
+        band_mix = rng.integers(1, bound, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+        self._fields = {
+            "name": _LSHField(hash_family(), band_mix, bands),
+            "business_name": _LSHField(hash_family(), band_mix, bands),
+        }
+
+        self._tpins: List[str] = []
+        self._names: List[str] = []
+        self._business_names: List[str] = []
+        self._contacts: Dict[str, Dict[str, int]] = {"phone": {}, "email": {}}
+        self._links: List[Tuple[int, int, str]] = []
+        self._pending: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._tpins)
+
+    def add(self, record: Any) -> None:
+        """Add a Taxpayer or a dict with tpin, name, business_name, email and phone."""
+        get = record.get if isinstance(record, dict) else (lambda key: getattr(record, key, None))
+        index = len(self._tpins)
+        self._tpins.append(str(get("tpin")))
+        self._names.append(normalize_name(get("name")))
+        self._business_names.append(normalize_name(get("business_name")))
+
+        for kind, value in (("phone", normalize_phone(get("phone"))),
+                            ("email", normalize_email(get("email")))):
+            if value is None:
+                continue
+            first = self._contacts[kind].setdefault(value, index)
+            if first != index:
+                self._links.append((first, index, kind))
+
+        self._pending.append(index)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def add_many(self, records: Iterable[Any]) -> int:
+        """Add records from an iterable; returns the number added."""
+        count = 0
+        for record in records:
+            self.add(record)
+            count += 1
+        return count
+
+    def clusters(self, min_size: int = 2) -> List[EntityCluster]:
+        """
+        Resolve the records added so far into clusters.
+
+        Args:
+            min_size: Smallest number of distinct TPINs to report
+
+        Returns:
+            list: EntityClusters, largest first
+        """
+        self._flush()
+        groups = _UnionFind()
+        reasons: Dict[Tuple[int, int], str] = {}
+        for a, b, kind in self._links:
+            groups.union(a, b)
+            reasons[(a, b)] = kind
+
+        for kind, lsh in self._fields.items():
+            for members in lsh.candidate_groups(self.max_bucket):
+                members = members.tolist()
+                for i, a in enumerate(members):
+                    for b in members[i + 1:]:
+                        if groups.find(a) == groups.find(b):
+                            continue
+                        if self._names_match(kind, a, b):
+                            groups.union(a, b)
+                            reasons[(a, b)] = kind
+
+        members_by_root: Dict[int, Set[int]] = {}
+        for index in list(groups.parent):
+            members_by_root.setdefault(groups.find(index), set()).add(index)
+        reasons_by_root: Dict[int, Set[str]] = {}
+        for (a, _), kind in reasons.items():
+            reasons_by_root.setdefault(groups.find(a), set()).add(kind)
+
+        result = []
+        for root, members in members_by_root.items():
+            tpins = sorted({self._tpins[i] for i in members})
+            if len(tpins) >= min_size:
+                result.append(EntityCluster(tpins, reasons_by_root.get(root, set())))
+        result.sort(key=lambda cluster: len(cluster.tpins), reverse=True)
+        return result
+
+    def _names_match(self, kind: str, a: int, b: int) -> bool:
+        business = jaccard(self._business_names[a], self._business_names[b])
+        if kind == "business_name":
+            return business >= self.threshold
+        return (jaccard(self._names[a], self._names[b]) >= self.threshold
+                and business >= self.threshold / 2)
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        self._fields["name"].add_chunk(self._pending, [self._names[i] for i in self._pending])
+        self._fields["business_name"].add_chunk(
+            self._pending, [self._business_names[i] for i in self._pending]
+        )
+        self._pending = []
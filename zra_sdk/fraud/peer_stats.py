@@ -0,0 +1,286 @@
+"""
+Peer-group statistics for outlier detection.
+
+Values are summarised per (tax_center, business_category) group with a KLL
+quantile sketch, so memory per group is bounded however many values are
+added. Each group keeps a snapshot of its percentiles, median and median
+absolute deviation that is refreshed as values arrive, which makes
+"how unusual is this value for its peers" a constant-time lookup.
+
+The index may be shared between threads: adds and refreshes take a lock,
+and a refresh swaps in a new snapshot, so lookups read a consistent one
+without locking.
+"""
+import math
+import random
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Scales MAD to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+PERCENTILES = 100
+
+
+class KLLSketch:
+    """
+    KLL streaming quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Keeps O(k log(n/k)) items and answers rank queries with error around 1/k.
+    """
+
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: Optional[int] = None):
+        self.k = k
+        self.c = c
+        self.count = 0
+        self._random = random.Random(seed)
+        self._compactors: List[List[float]] = []
+        self._size = 0
+        self._max_size = 0
+        self._grow()
+
+    def add(self, value: float) -> None:
+        """Add a value to the sketch."""
+        self._compactors[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: 'KLLSketch') -> None:
+        """Fold another sketch into this one."""
+        while len(self._compactors) < len(other._compactors):
+            self._grow()
+        for level, items in enumerate(other._compactors):
+            self._compactors[level].extend(items)
+        self.count += other.count
+        self._size = sum(len(items) for items in self._compactors)
+        while self._size >= self._max_size:
+            self._compress()
+
+    def weighted_items(self) -> List[Tuple[float, int]]:
+        """Return the retained (value, weight) pairs sorted by value."""
+        items = [
+            (value, 1 << level)
+            for level, compactor in enumerate(self._compactors)
+            for value in compactor
+        ]
+        items.sort()
+        return items
+
+    def quantiles(self, fractions: Iterable[float]) -> List[float]:
+        """
+        Return approximate quantiles.
+
+        Args:
+            fractions: Ascending fractions between 0 and 1
+
+        Returns:
+            list: One value per fraction, empty if the sketch is empty
+        """
+        return _weighted_quantiles(self.weighted_items(), list(fractions))
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self) -> None:
+        self._compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self._compactors)))
+
+    def _compress(self) -> None:
+        for level in range(len(self._compactors)):
+            compactor = self._compactors[level]
+            if len(compactor) >= self._capacity(level):
+                if level + 1 >= len(self._compactors):
+                    self._grow()
+                compactor.sort()
+                # Keep the odd item out at this level, promote every other one
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                offset = self._random.randint(0, 1)
+                self._compactors[level + 1].extend(compactor[offset::2])
+                self._compactors[level] = leftover
+                self._size = sum(len(items) for items in self._compactors)
+                if self._size < self._max_size:
+                    break
+
+
+def _weighted_quantiles(items: List[Tuple[float, int]], fractions: List[float]) -> List[float]:
+    """Quantiles of sorted (value, weight) pairs."""
+    if not items:
+        return []
+    total = sum(weight for _, weight in items)
+    result = []
+    cumulative = 0
+    index = 0
+    for fraction in fractions:
+        target = fraction * total
+        while index < len(items) - 1 and cumulative + items[index][1] <= target:
+            cumulative += items[index][1]
+            index += 1
+        result.append(items[index][0])
+    return result
+
+
+@dataclass
+class PeerScore:
+    """How a value compares to its peer group"""
+    percentile: float  # 0-100
+    robust_z: float    # (value - median) / (1.4826 * MAD)
+    peer_count: int
+    group: Tuple[Optional[str], Optional[str]]
+
+
+class _Snapshot(NamedTuple):
+    """Statistics of a peer group at one point in time."""
+    breakpoints: List[float]
+    median: float
+    mad: float
+    count: int
+
+
+class _GroupStats:
+    """Sketch of one peer group plus its last snapshot."""
+    __slots__ = ("sketch", "pending", "snapshot")
+
+    def __init__(self, k: int):
+        self.sketch = KLLSketch(k)
+        self.pending = 0
+        self.snapshot: Optional[_Snapshot] = None
+
+    def refresh(self) -> None:
+        """Replace the snapshot with one of the sketch as it is now. Caller holds the index lock."""
+        items = self.sketch.weighted_items()
+        breakpoints = _weighted_quantiles(items, [i / PERCENTILES for i in range(PERCENTILES + 1)])
+        median = breakpoints[PERCENTILES // 2]
+        deviations = sorted((abs(value - median), weight) for value, weight in items)
+        mad = _weighted_quantiles(deviations, [0.5])[0]
+        self.snapshot = _Snapshot(breakpoints, median, mad, self.sketch.count)
+        self.pending = 0
+
+
+class PeerStatsIndex:
+    """
+    Incrementally maintained percentile and MAD statistics per peer group.
+
+    A peer group is (tax_center, business_category). Every value also feeds
+    a tax_center-wide group, which is used when the exact group has fewer
+    than ``min_peers`` values.
+    """
+
+    def __init__(self, k: int = 200, min_peers: int = 30, refresh_fraction: float = 0.01):
+        """
+        Initialize the index.
+
+        Args:
+            k: Sketch accuracy parameter, rank error is roughly 1/k
+            min_peers: Minimum group size before a group is used for scoring
+            refresh_fraction: Fraction of a group's size that may be added
+                before its snapshot is rebuilt
+        """
+        self.k = k
+        self.min_peers = min_peers
+        self.refresh_fraction = refresh_fraction
+        self._groups: Dict[Tuple[Optional[str], Optional[str]], _GroupStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data_source(cls, source, field: str = "outstanding_payments", batch_size: int = 10000,
+                         **kwargs) -> "PeerStatsIndex":
+        """
+        Index a numeric compliance record field of every taxpayer of a data
+        source, grouped by the taxpayer's tax_center and business_category.
+
+        Raises:
+            NotImplementedError: If the source cannot list its records
+        """
+        index = cls(**kwargs)
+        batch: List[Tuple[str, dict]] = []
+
+        def add_batch():
+            compliance = source.get_compliance_many([tpin for tpin, _ in batch])
+            for tpin, taxpayer in batch:
+                try:
+                    value = float((compliance.get(tpin) or {})[field])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                index.add(taxpayer.get("tax_center"), taxpayer.get("business_category"), value)
+            batch.clear()
+
+        for tpin, taxpayer in source.iter_taxpayers():
+            batch.append((tpin, taxpayer))
+            if len(batch) >= batch_size:
+                add_batch()
+        add_batch()
+        return index
+
+    def add(self, tax_center: Optional[str], business_category: Optional[str], value: float) -> None:
+        """Add an observed value for a taxpayer in the given peer group."""
+        keys = [(tax_center, business_category)]
+        if business_category is not None:
+            keys.append((tax_center, None))
+        with self._lock:
+            for key in keys:
+                group = self._groups.get(key)
+                if group is None:
+                    group = self._groups[key] = _GroupStats(self.k)
+                group.sketch.add(value)
+                group.pending += 1
+
+    def score(
+        self,
+        tax_center: Optional[str],
+        business_category: Optional[str],
+        value: float
+    ) -> Optional[PeerScore]:
+        """
+        Rate how unusual a value is for its peers.
+
+        Args:
+            tax_center: Tax center of the taxpayer
+            business_category: Business category of the taxpayer
+            value: Observed value
+
+        Returns:
+            PeerScore, or None if neither the group nor its tax center has
+            at least ``min_peers`` values
+        """
+        key = (tax_center, business_category)
+        group = self._groups.get(key)
+        if group is None or group.sketch.count < self.min_peers:
+            key = (tax_center, None)
+            group = self._groups.get(key)
+            if group is None or group.sketch.count < self.min_peers:
+                return None
+
+        snapshot = group.snapshot
+        if snapshot is None or group.pending > group.sketch.count * self.refresh_fraction:
+            with self._lock:
+                if group.snapshot is snapshot:
+                    group.refresh()
+                snapshot = group.snapshot
+
+        breakpoints = snapshot.breakpoints
+        position = bisect_left(breakpoints, value)
+        if position == 0:
+            percentile = 0.0
+        elif position > PERCENTILES:
+            percentile = 100.0
+        else:
+            low, high = breakpoints[position - 1], breakpoints[position]
+            fraction = (value - low) / (high - low) if high > low else 1.0
+            percentile = (position - 1 + fraction) * 100.0 / PERCENTILES
+
+        deviation = value - snapshot.median
+        if snapshot.mad > 0:
+            robust_z = deviation / (MAD_SCALE * snapshot.mad)
+        else:
+            robust_z = 0.0 if deviation == 0 else math.copysign(math.inf, deviation)
+
+        return PeerScore(percentile, robust_z, snapshot.count, key)
+
+    def group_count(self, tax_center: Optional[str], business_category: Optional[str] = None) -> int:
+        """Number of values seen for a peer group."""
+        group = self._groups.get((tax_center, business_category))
+        return group.sketch.count if group else 0
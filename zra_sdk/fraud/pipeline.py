@@ -0,0 +1,387 @@
+"""
+Streaming anomaly detection over filing and payment records.
+
+Records flow through generator stages
+(parse -> validate TPIN -> enrich -> extract features -> score),
+each running in its own thread and connected by bounded queues of batches,
+so memory stays flat however long the input is.
+
+The stage threads share the GIL, so together they use about one core.
+Parsing and TPIN validation, the costliest stages and the only stateless
+ones, can run in worker processes instead (``workers``). Feature extraction
+keeps per-TPIN history and peer statistics that depend on record order, so
+it and the cheap stages around it stay in one process; with parsing spread
+over the workers a run is bound by that stage.
+"""
+import csv
+import itertools
+import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from utils.validators import validate_tpin
+from .peer_stats import PeerStatsIndex
+
+FLAG_WEIGHTS = {
+    "unregistered_tpin": 0.5,
+    "late_filing_pattern": 0.3,
+    "income_drop": 0.4,
+    "vat_ratio_outlier": 0.4,
+}
+
+
+@dataclass
+class TaxRecord:
+    """A filing or payment record moving through the pipeline"""
+    record_type: str  # filing, payment
+    tpin: str
+    period: str  # YYYY-MM
+    amount: float  # declared income for filings, amount paid for payments
+    vat_amount: float = 0.0
+    due_date: Optional[date] = None
+    submitted_on: Optional[date] = None
+    tax_center: Optional[str] = None
+    business_category: Optional[str] = None
+    features: Dict[str, float] = field(default_factory=dict)
+    flags: List[str] = field(default_factory=list)
+    score: float = 0.0
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TaxRecord':
+        """Create TaxRecord from a JSON object or CSV row"""
+        return cls(
+            record_type=data.get('record_type') or 'filing',
+            tpin=str(data.get('tpin', '')).strip(),
+            period=data.get('period', ''),
+            amount=float(data.get('amount') or 0),
+            vat_amount=float(data.get('vat_amount') or 0),
+            due_date=_parse_date(data.get('due_date')),
+            submitted_on=_parse_date(data.get('submitted_on')),
+        )
+
+
+@dataclass
+class DetectionConfig:
+    """Thresholds used by the feature and scoring stages"""
+    late_streak: int = 3            # consecutive late submissions to flag
+    income_drop_ratio: float = 0.5  # fractional fall in declared income to flag
+    min_prior_income: float = 10_000.0
+    vat_ratio_z: float = 3.5        # robust z-score against peers to flag
+    min_peers: int = 30
+    alert_threshold: float = 0.3
+
+
+@dataclass
+class PipelineStats:
+    """Record counts observed by a pipeline run"""
+    parsed: int = 0
+    malformed: int = 0
+    invalid_tpin: int = 0
+    flagged: int = 0
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+
+def parse_records(lines: Iterable[str], fmt: str, stats: PipelineStats) -> Iterator[TaxRecord]:
+    """Parse JSON lines or CSV rows into TaxRecords, skipping malformed input."""
+    rows = csv.DictReader(lines) if fmt == "csv" else (line for line in lines if line.strip())
+    for row in rows:
+        try:
+            record = TaxRecord.from_json(row if fmt == "csv" else json.loads(row))
+        except (ValueError, TypeError, AttributeError):
+            stats.malformed += 1
+            continue
+        stats.parsed += 1
+        yield record
+
+
+def validate_records(records: Iterable[TaxRecord], stats: PipelineStats) -> Iterator[TaxRecord]:
+    """Drop records whose TPIN is malformed."""
+    for record in records:
+        if validate_tpin(record.tpin):
+            yield record
+        else:
+            stats.invalid_tpin += 1
+
+
+def parse_batch(batch: Tuple[str, List[str]]) -> Tuple[List[tuple], PipelineStats]:
+    """
+    Parse and validate a batch of lines, e.g. in a worker process.
+
+    Records come back as columns of plain values, dates as ordinals (0 for
+    none), which cost a fraction of pickling TaxRecords; see
+    records_from_columns.
+
+    Args:
+        batch: (fmt, lines); CSV lines start with the header line
+
+    Returns:
+        tuple: (columns of the valid records, counts of the batch)
+    """
+    fmt, lines = batch
+    stats = PipelineStats()
+    rows = [
+        (record.record_type, record.tpin, record.period, record.amount, record.vat_amount,
+         record.due_date.toordinal() if record.due_date else 0,
+         record.submitted_on.toordinal() if record.submitted_on else 0)
+        for record in validate_records(parse_records(lines, fmt, stats), stats)
+    ]
+    return list(zip(*rows)), stats
+
+
+def records_from_columns(columns: List[tuple]) -> List[TaxRecord]:
+    """TaxRecords from the columns returned by parse_batch."""
+    from_ordinal = date.fromordinal
+    return [
+        TaxRecord(record_type, tpin, period, amount, vat_amount,
+                  from_ordinal(due) if due else None, from_ordinal(submitted) if submitted else None)
+        for record_type, tpin, period, amount, vat_amount, due, submitted in zip(*columns)
+    ]
+
+
+def enrich_records(
+    records: Iterable[TaxRecord],
+    registry: Optional[Mapping[str, Any]]
+) -> Iterator[TaxRecord]:
+    """Attach the peer group from the taxpayer registry, flagging unknown TPINs."""
+    for record in records:
+        if registry is not None:
+            taxpayer = registry.get(record.tpin)
+            if taxpayer is None:
+                record.flags.append("unregistered_tpin")
+            elif isinstance(taxpayer, dict):
+                record.tax_center = taxpayer.get('tax_center')
+                record.business_category = taxpayer.get('business_category')
+            else:
+                record.tax_center = taxpayer.tax_center
+                record.business_category = taxpayer.business_category
+        yield record
+
+
+def extract_features(
+    records: Iterable[TaxRecord],
+    config: DetectionConfig,
+    peers: PeerStatsIndex
+) -> Iterator[TaxRecord]:
+    """
+    Compute per-record features against per-TPIN history and peer statistics.
+
+    Records of a TPIN are expected in period order. State is O(1) per TPIN,
+    and VAT ratios are compared with the peer group before being added to it.
+    """
+    late_streaks: Dict[str, int] = {}
+    last_income: Dict[str, float] = {}
+
+    for record in records:
+        features = record.features
+
+        if record.due_date and record.submitted_on:
+            late_days = (record.submitted_on - record.due_date).days
+            streak = late_streaks.get(record.tpin, 0) + 1 if late_days > 0 else 0
+            late_streaks[record.tpin] = streak
+            features["late_days"] = max(0, late_days)
+            features["late_streak"] = streak
+            if streak >= config.late_streak:
+                record.flags.append("late_filing_pattern")
+
+        if record.record_type == "filing":
+            previous = last_income.get(record.tpin)
+            last_income[record.tpin] = record.amount
+            if previous is not None and previous >= config.min_prior_income:
+                drop = 1.0 - record.amount / previous
+                features["income_drop"] = drop
+                if drop >= config.income_drop_ratio:
+                    record.flags.append("income_drop")
+
+            if record.amount > 0:
+                ratio = record.vat_amount / record.amount
+                features["vat_ratio"] = ratio
+                peer = peers.score(record.tax_center, record.business_category, ratio)
+                if peer is not None:
+                    features["vat_ratio_z"] = peer.robust_z
+                    features["vat_ratio_percentile"] = peer.percentile
+                    if abs(peer.robust_z) >= config.vat_ratio_z:
+                        record.flags.append("vat_ratio_outlier")
+                peers.add(record.tax_center, record.business_category, ratio)
+
+        yield record
+
+
+def score_records(
+    records: Iterable[TaxRecord],
+    config: DetectionConfig,
+    stats: PipelineStats
+) -> Iterator[TaxRecord]:
+    """Combine flags into a 0-1 risk score."""
+    for record in records:
+        record.score = min(1.0, sum(FLAG_WEIGHTS[flag] for flag in record.flags))
+        if record.score >= config.alert_threshold:
+            stats.flagged += 1
+        yield record
+
+
+_DONE = object()
+
+
+class _Failed:
+    """Carries an exception raised by a stage to the consumer."""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class DetectionPipeline:
+    """
+    Runs the detection stages concurrently over a stream of records.
+
+    Each stage runs in a thread and hands batches of records to the next
+    through a bounded queue, so a slow stage applies back-pressure instead
+    of letting memory grow. The threads share one core (see the module
+    docstring); with workers > 1, parsing and validation run in that many
+    processes.
+    """
+
+    def __init__(
+        self,
+        registry: Optional[Mapping[str, Any]] = None,
+        config: Optional[DetectionConfig] = None,
+        peer_stats: Optional[PeerStatsIndex] = None,
+        batch_size: int = 1000,
+        queue_size: int = 8,
+        workers: int = 1
+    ):
+        self.registry = registry
+        self.config = config or DetectionConfig()
+        self.peer_stats = peer_stats or PeerStatsIndex(min_peers=self.config.min_peers)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.workers = workers
+        self.stats = PipelineStats()
+
+    def run(self, lines: Iterable[str], fmt: str = "jsonl") -> Iterator[TaxRecord]:
+        """
+        Score every record of the input.
+
+        Args:
+            lines: Lines of JSON or CSV input (CSV includes the header line)
+            fmt: "jsonl" or "csv"
+
+        Yields:
+            TaxRecord: Scored records in input order
+        """
+        self.stats = PipelineStats()
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        if pool is None:
+            parse_stages: List[Callable[[Iterable[Any]], Iterator[Any]]] = [
+                lambda items: parse_records(items, fmt, self.stats),
+                lambda items: validate_records(items, self.stats),
+            ]
+        else:
+            parse_stages = [lambda items: self._parse_in_workers(items, fmt, pool)]
+        stages = parse_stages + [
+            lambda items: enrich_records(items, self.registry),
+            lambda items: extract_features(items, self.config, self.peer_stats),
+            lambda items: score_records(items, self.config, self.stats),
+        ]
+
+        stop = threading.Event()
+        source: queue.Queue = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._feed, args=(iter(lines), source, stop), daemon=True)]
+        upstream = source
+        for stage in stages:
+            downstream: queue.Queue = queue.Queue(self.queue_size)
+            threads.append(threading.Thread(
+                target=self._feed,
+                args=(stage(self._drain(upstream, stop)), downstream, stop),
+                daemon=True
+            ))
+            upstream = downstream
+
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self._drain(upstream, stop)
+        finally:
+            stop.set()
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _parse_in_workers(self, lines: Iterable[str], fmt: str, pool: ProcessPoolExecutor) -> Iterator[TaxRecord]:
+        """Parse and validate batches of lines in worker processes, keeping input order."""
+        lines = iter(lines)
+        header = []
+        if fmt == "csv":
+            first = next(lines, None)
+            header = [first] if first is not None else []
+        pending: Deque[Any] = deque()
+        while True:
+            block = list(itertools.islice(lines, self.batch_size))
+            if block:
+                pending.append(pool.submit(parse_batch, (fmt, header + block)))
+            # Bound how far reading can run ahead of the workers
+            while pending and (not block or len(pending) >= 2 * self.workers):
+                columns, stats = pending.popleft().result()
+                self.stats.parsed += stats.parsed
+                self.stats.malformed += stats.malformed
+                self.stats.invalid_tpin += stats.invalid_tpin
+                yield from records_from_columns(columns)
+            if not block:
+                return
+
+    def detect(self, lines: Iterable[str], fmt: str = "jsonl") -> Iterator[TaxRecord]:
+        """Yield only the records whose score reaches the alert threshold."""
+        for record in self.run(lines, fmt):
+            if record.score >= self.config.alert_threshold:
+                yield record
+
+    def detect_file(self, path: str) -> Iterator[TaxRecord]:
+        """Run detect over a .csv or JSON lines file."""
+        fmt = "csv" if path.endswith(".csv") else "jsonl"
+        with open(path, "r", encoding="utf-8", newline="") as fh:
+            yield from self.detect(fh, fmt)
+
+    def _feed(self, items: Iterator[Any], out: queue.Queue, stop: threading.Event) -> None:
+        """Batch items from a stage onto its output queue."""
+        batch: List[Any] = []
+        try:
+            for item in items:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not self._put(out, batch, stop):
+                        return
+                    batch = []
+            if batch and not self._put(out, batch, stop):
+                return
+            self._put(out, _DONE, stop)
+        except Exception as e:
+            self._put(out, _Failed(e), stop)
+
+    @staticmethod
+    def _put(out: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _drain(source: queue.Queue, stop: threading.Event) -> Iterator[Any]:
+        """Flatten batches from a queue until the upstream stage finishes."""
+        while not stop.is_set():
+            try:
+                batch = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if batch is _DONE:
+                return
+            if isinstance(batch, _Failed):
+                raise batch.error
+            yield from batch
@@ -1,6 +1,12 @@
-from dataclasses import dataclass
-from typing import Optional
-from datetime import datetime
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Optional
+from datetime import datetime, date
+
+try:
+    from ..core.tax_verification.constants import ComplianceStatus, TaxType
+except ImportError:
+    from core.tax_verification.constants import ComplianceStatus, TaxType
 
 @dataclass
 class Taxpayer:
@@ -14,6 +20,7 @@ class Taxpayer:
     registration_date: str
     last_filing_date: Optional[str] = None
     tax_center: Optional[str] = None
+    business_category: Optional[str] = None
     
     @classmethod
     def from_json(cls, data: dict) -> 'Taxpayer':
@@ -27,7 +34,8 @@ class Taxpayer:
             status=data.get('status', 'Unknown'),
             registration_date=data.get('registration_date', ''),
             last_filing_date=data.get('last_filing_date'),
-            tax_center=data.get('tax_center')
+            tax_center=data.get('tax_center'),
+            business_category=data.get('business_category')
         )
 
 @dataclass
@@ -38,3 +46,59 @@ class TaxCalculation:
     tax_amount: float
     tax_breakdown: dict
     effective_tax_rate: float
+
+class BusinessCategory(Enum):
+    """Business category of a registered taxpayer"""
+    SOLE_PROPRIETOR = "Sole Proprietor"
+    PARTNERSHIP = "Partnership"
+    COMPANY = "Company"
+    TRUST = "Trust"
+    COOPERATIVE = "Cooperative"
+    NGO = "NGO"
+    GOVERNMENT = "Government"
+    OTHER = "Other"
+
+@dataclass
+class Address:
+    """Physical or postal address"""
+    street: str
+    city: str
+    province: str
+    postal_code: Optional[str] = None
+    country: str = "Zambia"
+
+@dataclass
+class Contact:
+    """Taxpayer contact details"""
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    mobile: Optional[str] = None
+    fax: Optional[str] = None
+
+@dataclass
+class TaxRegistration:
+    """Registration of a taxpayer for a single tax type"""
+    tax_type: TaxType
+    registration_date: datetime
+    registration_number: Optional[str] = None
+    status: bool = True
+    expiry_date: Optional[date] = None
+
+@dataclass
+class ComplianceRecord:
+    """Tax compliance status of a taxpayer at a point in time"""
+    status: ComplianceStatus
+    last_verified: datetime
+    valid_until: datetime
+    issues: List[str] = field(default_factory=list)
+    score: Optional[float] = None
+
+    @property
+    def is_valid(self) -> bool:
+        """Whether the record has not yet expired"""
+        return datetime.utcnow() <= self.valid_until
+
+    @property
+    def is_compliant(self) -> bool:
+        """Whether the record reports a compliant taxpayer"""
+        return self.status == ComplianceStatus.COMPLIANT
@@ -27,4 +27,9 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    entry_points={
+        "console_scripts": [
+            "zra=cli.main:main",
+        ],
+    },
 )
@@ -0,0 +1,198 @@
+"""
+Tests for risk-ranked audit scheduling
+"""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from core.taxpayer.audits import (
+    AUDIT_INTERVALS, DEFAULT_AUDIT_INTERVAL, DEFAULT_RISK_WEIGHT, DEFAULT_SCORE, OVERDUE_DAYS_PER_POINT,
+    RISK_WEIGHTS, UNASSIGNED, AuditScheduler, parse_capacities,
+)
+
+TODAY = date(2024, 3, 6)
+CENTERS = ["Lusaka", "Ndola", "Kitwe"]
+RISKS = ["High", "Medium", "Low", None]
+
+
+class BruteForceScheduler:
+    """Recomputes every plan from a plain dict of taxpayers."""
+
+    def __init__(self, capacities, default_capacity):
+        self.capacities = capacities
+        self.default_capacity = default_capacity
+        self.taxpayers = {}
+
+    def load(self, records, today):
+        self.taxpayers = {}
+        for tpin, taxpayer, compliance in records:
+            risk = compliance.get("risk_level")
+            last_audit = compliance.get("last_audit_date")
+            due = compliance.get("next_audit_due")
+            if due is not None:
+                due = date.fromisoformat(due).toordinal()
+            elif last_audit is not None:
+                due = date.fromisoformat(last_audit).toordinal() + AUDIT_INTERVALS.get(risk, DEFAULT_AUDIT_INTERVAL)
+            else:
+                due = today.toordinal()
+            self.taxpayers[tpin] = {
+                "tax_center": taxpayer.get("tax_center") or UNASSIGNED, "risk_level": risk,
+                "compliance_score": compliance.get("compliance_score"), "due": due, "scheduled": False,
+            }
+
+    def update(self, tpin, **changes):
+        taxpayer = self.taxpayers[tpin]
+        for field in ("tax_center", "risk_level", "compliance_score"):
+            if changes.get(field) is not None:
+                taxpayer[field] = changes[field]
+        if changes.get("next_audit_due") is not None:
+            taxpayer["due"] = date.fromisoformat(changes["next_audit_due"]).toordinal()
+
+    def record_audit(self, tpin, audit_date):
+        taxpayer = self.taxpayers[tpin]
+        taxpayer["scheduled"] = False
+        taxpayer["due"] = audit_date.toordinal() + AUDIT_INTERVALS.get(taxpayer["risk_level"], DEFAULT_AUDIT_INTERVAL)
+
+    @staticmethod
+    def key(taxpayer):
+        score = DEFAULT_SCORE if taxpayer["compliance_score"] is None else taxpayer["compliance_score"]
+        return (
+            RISK_WEIGHTS.get(taxpayer["risk_level"], DEFAULT_RISK_WEIGHT)
+            + (100 - score) / 100
+            - taxpayer["due"] / OVERDUE_DAYS_PER_POINT
+        )
+
+    def plan(self, week, weeks, commit):
+        start = week - timedelta(days=week.weekday())
+        planned, plans = set(), []
+        centers = sorted({taxpayer["tax_center"] for taxpayer in self.taxpayers.values()})
+        for offset in range(weeks):
+            end = (start + timedelta(weeks=offset)).toordinal() + 6
+            audits = []
+            for center in centers:
+                due = sorted(
+                    (-self.key(taxpayer), tpin) for tpin, taxpayer in self.taxpayers.items()
+                    if taxpayer["tax_center"] == center and not taxpayer["scheduled"]
+                    and tpin not in planned and taxpayer["due"] <= end
+                )
+                for _, tpin in due[:self.capacities.get(center, self.default_capacity)]:
+                    planned.add(tpin)
+                    audits.append((tpin, round(self.key(self.taxpayers[tpin]) + end / OVERDUE_DAYS_PER_POINT, 3)))
+            audits.sort(key=lambda audit: -audit[1])
+            plans.append(audits)
+        if commit:
+            for tpin in planned:
+                self.taxpayers[tpin]["scheduled"] = True
+        return plans
+
+
+def random_records(count, rng):
+    records = []
+    for number in range(count):
+        compliance = {"risk_level": rng.choice(RISKS), "compliance_score": rng.choice([None, rng.randint(0, 100)])}
+        if rng.random() < 0.5:
+            compliance["next_audit_due"] = (TODAY + timedelta(days=rng.randint(-400, 120))).isoformat()
+        elif rng.random() < 0.8:
+            compliance["last_audit_date"] = (TODAY - timedelta(days=rng.randint(0, 800))).isoformat()
+        taxpayer = {"tax_center": rng.choice(CENTERS + [None])}
+        records.append((f"{100000000 + number:09d}", taxpayer, compliance))
+    return records
+
+
+def as_lists(plans):
+    return [[(audit["tpin"], audit["priority"]) for audit in plan["audits"]] for plan in plans]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_plans_match_brute_force(seed):
+    rng = random.Random(seed)
+    capacities = {"Lusaka": 15, "Ndola": 5}
+    records = random_records(600, rng)
+    scheduler = AuditScheduler(capacities, default_capacity=8)
+    expected = BruteForceScheduler(capacities, 8)
+    scheduler.load(records, TODAY)
+    expected.load(records, TODAY)
+    tpins = [tpin for tpin, _, _ in records]
+    scheduled = []
+
+    for step in range(60):
+        action = rng.random()
+        if action < 0.5:
+            tpin = rng.choice(tpins)
+            changes = {
+                "tax_center": rng.choice(CENTERS + [None]),
+                "risk_level": rng.choice(RISKS),
+                "compliance_score": rng.choice([None, rng.randint(0, 100)]),
+                "next_audit_due": rng.choice([None, (TODAY + timedelta(days=rng.randint(-200, 60))).isoformat()]),
+            }
+            scheduler.update(tpin, **changes)
+            expected.update(tpin, **changes)
+        elif action < 0.6 and scheduled:
+            tpin = scheduled.pop(rng.randrange(len(scheduled)))
+            audit_date = TODAY + timedelta(days=rng.randint(0, 30))
+            assert scheduler.record_audit(tpin, audit_date).toordinal() == (
+                audit_date.toordinal() + AUDIT_INTERVALS.get(expected.taxpayers[tpin]["risk_level"],
+                                                             DEFAULT_AUDIT_INTERVAL))
+            expected.record_audit(tpin, audit_date)
+        else:
+            week = TODAY + timedelta(weeks=step // 10)
+            weeks, commit = rng.randint(1, 4), rng.random() < 0.3
+            plans = scheduler.plan(week, weeks, commit=commit)
+            assert as_lists(plans) == expected.plan(week, weeks, commit), step
+            if commit:
+                scheduled.extend(tpin for plan in as_lists(plans) for tpin, _ in plan)
+
+
+def test_stale_entries_are_compacted():
+    rng = random.Random(7)
+    records = random_records(200, rng)
+    scheduler = AuditScheduler(default_capacity=10)
+    expected = BruteForceScheduler({}, 10)
+    scheduler.load(records, TODAY)
+    expected.load(records, TODAY)
+    for _ in range(5_000):
+        tpin = records[rng.randrange(len(records))][0]
+        score = rng.randint(0, 100)
+        scheduler.update(tpin, compliance_score=score)
+        expected.update(tpin, compliance_score=score)
+    stats = scheduler.stats()
+    assert all(center["stale"] <= max(1024, center["ready"] + center["pending"]) for center in stats["tax_centers"].values())
+    assert as_lists(scheduler.plan(TODAY, 3)) == expected.plan(TODAY, 3, commit=False)
+
+
+def test_updates_during_load_are_applied_after():
+    class Source:
+        def iter_taxpayers(self):
+            yield "100000001", {"tax_center": "Lusaka"}
+            # Arrives while the records are still being read
+            scheduler.update("100000002", risk_level="High")
+            yield "100000002", {"tax_center": "Lusaka"}
+
+        def get_compliance_many(self, tpins):
+            return {tpin: {"risk_level": "Low", "next_audit_due": "2024-01-01"} for tpin in tpins}
+
+    scheduler = AuditScheduler(default_capacity=1)
+    scheduler.load_in_background(Source(), TODAY).join()
+    assert scheduler.state == "ready"
+    assert scheduler.plan(TODAY)[0]["audits"][0]["tpin"] == "100000002"
+
+
+def test_parse_capacities():
+    assert parse_capacities("Lusaka=50, Ndola=20,") == {"Lusaka": 50, "Ndola": 20}
+    assert parse_capacities("") == {}
+
+
+def test_failed_load_leaves_loading_state():
+    class BrokenSource:
+        def iter_taxpayers(self):
+            yield "100000001", {"tax_center": "Lusaka"}
+            raise OSError("disk I/O error")
+
+    scheduler = AuditScheduler()
+    thread = scheduler.load_in_background(BrokenSource(), TODAY)
+    scheduler.update("100000001", risk_level="High")
+    thread.join()
+    assert scheduler.state == "unavailable"
+    assert scheduler.error == "disk I/O error"
+    assert scheduler._backlog is None
@@ -0,0 +1,108 @@
+"""
+Tests for carousel detection on the invoice graph
+"""
+import numpy as np
+import pytest
+
+from fraud.carousel import InvoiceGraph, reduce_edges
+
+
+def graph_of(edges, period=202401):
+    """An InvoiceGraph from (supplier, buyer, ngwee) triples."""
+    supplier, buyer, value = (np.array(column, dtype=np.int64) for column in zip(*edges))
+    keys, total, count = reduce_edges(supplier, buyer, np.full(len(edges), period), value)[period]
+    supplier, buyer = np.divmod(keys, 1_000_000_000)
+    return InvoiceGraph.from_edges(supplier, buyer, total, count, period)
+
+
+def brute_force_sccs(graph, min_value=0, min_size=2):
+    """Components as sets of TPINs, by mutual reachability."""
+    adjacency = {node: set() for node in range(graph.num_nodes)}
+    for node in range(graph.num_nodes):
+        for edge in range(graph.indptr[node], graph.indptr[node + 1]):
+            if graph.value[edge] >= min_value:
+                adjacency[node].add(int(graph.indices[edge]))
+
+    reach = {}
+    for node in adjacency:
+        seen, frontier = {node}, [node]
+        while frontier:
+            for next_node in adjacency[frontier.pop()]:
+                if next_node not in seen:
+                    seen.add(next_node)
+                    frontier.append(next_node)
+        reach[node] = seen
+
+    components = set()
+    for node in adjacency:
+        component = frozenset(other for other in reach[node] if node in reach[other])
+        if len(component) >= min_size:
+            components.add(frozenset(int(graph.tpins[n]) for n in component))
+    return components
+
+
+def found_sccs(graph, min_value=0, min_size=2):
+    return {
+        frozenset(int(t) for t in graph.tpins[component])
+        for component in graph.strongly_connected_components(min_value, min_size)
+    }
+
+
+def ring_with_chain(tail):
+    """
+    A 300-taxpayer ring, and a chain head -> 200000005 -> 200000006 -> tail
+    -> 100000000. The first trimming round removes only the chain's two end
+    edges, too few to go on, and leaves tail without outgoing flow.
+    """
+    ring = [(300000000 + i, 300000000 + (i + 1) % 300, 5_000_000) for i in range(300)]
+    chain = [
+        (100000001, 200000005, 5_000_000),
+        (200000005, 200000006, 5_000_000),
+        (200000006, tail, 5_000_000),
+        (tail, 100000000, 5_000_000),
+    ]
+    return graph_of(ring + chain)
+
+
+# 200000004 sorts right before 200000005, 900000000 after every other node
+@pytest.mark.parametrize("tail", [200000004, 900000000])
+def test_trimming_leaves_no_dangling_edges(tail):
+    graph = ring_with_chain(tail)
+    assert found_sccs(graph) == brute_force_sccs(graph) == {frozenset(range(300000000, 300000300))}
+    rings = graph.find_rings()
+    assert all(int(tpin) >= 300000000 for ring in rings for tpin in ring.tpins)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_components_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    nodes = int(rng.integers(5, 80))
+    tpins = np.unique(rng.integers(100000000, 999999999, size=nodes))
+    count = int(rng.integers(1, nodes))
+    supplier, buyer = rng.choice(tpins, size=count), rng.choice(tpins, size=count)
+    value = rng.integers(1, 10_000, size=count)
+    # A large ring keeps trimming rounds under 1% of the edges, so
+    # trimming stops before the acyclic chains are gone
+    ring = np.arange(990000000, 990000400)
+    chain = rng.choice(tpins, size=min(len(tpins), 30), replace=False)
+    supplier = np.concatenate([supplier, chain[:-1], ring])
+    buyer = np.concatenate([buyer, chain[1:], np.roll(ring, -1)])
+    value = np.concatenate([value, np.full(len(chain) - 1 + len(ring), 10_000)])
+    edges = [(s, b, v) for s, b, v in zip(supplier, buyer, value) if s != b]
+    graph = graph_of(edges)
+    for min_value in (0, 5_000):
+        assert found_sccs(graph, min_value) == brute_force_sccs(graph, min_value)
+
+
+def test_find_rings_reports_cycle():
+    graph = graph_of([
+        (100000001, 100000002, 2_000_000),
+        (100000002, 100000003, 3_000_000),
+        (100000003, 100000001, 4_000_000),
+        (100000003, 100000004, 9_000_000),
+    ])
+    rings = graph.find_rings()
+    assert len(rings) == 1
+    assert sorted(rings[0].tpins) == ["100000001", "100000002", "100000003"]
+    assert rings[0].throughput == 20_000.0
+    assert rings[0].total_value == 90_000.0
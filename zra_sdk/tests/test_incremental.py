@@ -0,0 +1,72 @@
+"""
+Tests for event-driven compliance tracking
+"""
+from api.data_sources import InMemoryDataSource
+from core.taxpayer.incremental import ComplianceEngine, ComplianceEvent, ComplianceEventType
+
+
+def payment(tpin, delta):
+    return ComplianceEvent(tpin, ComplianceEventType.PAYMENT, delta)
+
+
+def test_events_apply_to_seeded_obligations():
+    source = InMemoryDataSource()
+    engine = ComplianceEngine(source)
+    engine.apply(payment("444555666", -100))
+    summary = engine.get_summary("444555666")
+    seed = source.get_compliance("444555666")
+
+    assert set(seed) <= set(summary)
+    assert summary["compliance_status"] == "Non-Compliant"
+    assert summary["outstanding_payments"] == 12_400.0
+    assert summary["outstanding_returns"] == 3
+    assert summary["penalties"] == 1_800.0
+    assert summary["last_audit_date"] == "2022-12-10"
+    assert summary["next_audit_due"] == "2024-06-10"
+
+
+def test_replayed_events_clear_seeded_obligations():
+    engine = ComplianceEngine(InMemoryDataSource())
+    events = [payment("111222333", -1_000), payment("111222333", -500)]
+    events.append(ComplianceEvent("111222333", ComplianceEventType.FILING, -1))
+    events.append(ComplianceEvent("111222333", ComplianceEventType.PENALTY, -250))
+    assert engine.apply_many(events) == 4
+    summary = engine.get_summary("111222333")
+    assert summary["compliance_status"] == "Fully Compliant"
+    assert summary["compliance_score"] == 100.0
+    assert summary["compliance_issues"] == []
+
+    # Already seeded: later events apply to the tracked state, not the source
+    engine.apply(ComplianceEvent("111222333", ComplianceEventType.FILING, 1))
+    summary = engine.get_summary("111222333")
+    assert summary["compliance_status"] == "Mostly Compliant"
+    assert summary["outstanding_returns"] == 1 and summary["outstanding_payments"] == 0.0
+
+
+def test_event_log_replay(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text(
+        '{"tpin": "123456789", "type": "payment", "delta": 2000}\n'
+        'not json\n'
+        '{"tpin": "123456789", "type": "payment", "delta": -2000}\n'
+        '{"tpin": "123456789", "type": "filing", "de'
+    )
+    engine = ComplianceEngine(InMemoryDataSource())
+    updates = []
+    engine.subscribe(lambda tpin, summary: updates.append((tpin, summary["compliance_status"])))
+    assert engine.consume_file(str(path)) == 2
+    assert engine.invalid_events == 1
+    assert updates == [("123456789", "Fully Compliant")]
+
+    with open(path, "a") as f:
+        f.write('lta": 1}\n')
+    assert engine.consume_file(str(path)) == 1
+    assert engine.get_summary("123456789")["outstanding_returns"] == 1
+
+
+def test_unknown_tpins_start_without_obligations():
+    engine = ComplianceEngine(InMemoryDataSource())
+    engine.apply(payment("900000001", 50))
+    summary = engine.get_summary("900000001")
+    assert summary["outstanding_payments"] == 50.0
+    assert summary["last_audit_date"] is None
@@ -0,0 +1,65 @@
+"""
+Tests for the background job queue
+"""
+import sqlite3
+import time
+
+from api.jobs import JobQueue
+
+
+def double(items):
+    return [{"item": item, "value": item * 2} for item in items]
+
+
+def flaky(method, failures):
+    """method, raising sqlite3.OperationalError on its first calls."""
+    calls = {"count": 0}
+
+    def wrapper(*args, **kwargs):
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            raise sqlite3.OperationalError("database is locked")
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def wait_until_finished(queue, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job did not finish: {queue.status(job_id)}")
+
+
+def test_database_errors_do_not_stop_the_workers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), {"double": double}, workers=1, chunk_size=3, poll_interval=0.01)
+    queue._claim = flaky(queue._claim, 2)
+    queue._checkpoint = flaky(queue._checkpoint, 2)
+    queue.start()
+    queue._heartbeat = flaky(queue._heartbeat, 3)
+    try:
+        job_id = queue.submit("double", list(range(10)))
+        status = wait_until_finished(queue, job_id)
+        assert status["status"] == "done" and status["done_chunks"] == 4
+        assert [row["value"] for row in queue.results(job_id)["results"]] == [item * 2 for item in range(10)]
+        assert all(thread.is_alive() for thread in queue._threads)
+    finally:
+        queue.stop()
+
+
+def test_chunks_of_a_stopped_owner_are_resumed(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first = JobQueue(path, {"double": double}, chunk_size=2, poll_interval=0.01, heartbeat_timeout=0.3)
+    job_id = first.submit("double", list(range(6)))
+    claimed = first._claim()
+    assert claimed is not None  # left running by an owner that never heartbeats
+
+    second = JobQueue(path, {"double": double}, workers=1, poll_interval=0.01, heartbeat_timeout=0.3)
+    second.start()
+    try:
+        status = wait_until_finished(second, job_id)
+        assert status["status"] == "done" and status["processed_items"] == 6
+    finally:
+        second.stop()
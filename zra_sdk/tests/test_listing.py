@@ -0,0 +1,132 @@
+"""
+Tests for filtered, keyset-paginated taxpayer listings
+"""
+import random
+
+import numpy as np
+import pytest
+
+from api.listing import ARRAY_LIMIT, CHUNK_SIZE, Bitmap, TaxpayerListing
+
+STATUSES = ["Active", "Suspended", "Pending"]
+CENTERS = ["Lusaka", "Ndola", "Kitwe", "Livingstone"]
+RISKS = ["High", "Medium", "Low"]
+
+
+def random_records(count, seed):
+    rng = random.Random(seed)
+    tpins = rng.sample(range(100000000, 999999999), count)
+    records = []
+    for tpin in tpins:
+        taxpayer = {"status": rng.choice(STATUSES + [None]), "tax_center": rng.choice(CENTERS)}
+        compliance = {} if rng.random() < 0.05 else {
+            "risk_level": rng.choice(RISKS),
+            "compliance_score": rng.choice([None, round(rng.uniform(0, 100), 1)]),
+        }
+        records.append((f"{tpin:09d}", taxpayer, compliance))
+    return records
+
+
+def brute_force(records, filters, min_score, max_score):
+    """TPINs matching, in TPIN order."""
+    fields = {"status": 1, "tax_center": 1, "risk_level": 2}
+    matches = []
+    for record in sorted(records, key=lambda r: r[0]):
+        ok = True
+        for field, values in filters.items():
+            value = record[fields[field]].get(field)
+            ok &= value is not None and value.lower() in {v.lower() for v in values}
+        score = record[2].get("compliance_score")
+        if min_score is not None or max_score is not None:
+            ok &= score is not None
+            ok &= ok and (min_score is None or score >= min_score) and (max_score is None or score <= max_score)
+        if ok:
+            matches.append(record[0])
+    return matches
+
+
+def all_pages(listing, limit, **query):
+    tpins, after, totals = [], None, set()
+    while True:
+        page = listing.query(after=after, limit=limit, **query)
+        totals.add(page["total"])
+        tpins.extend(row["tpin"] for row in page["taxpayers"])
+        after = page["next_after"]
+        if after is None:
+            return tpins, totals
+
+
+def test_bitmap_set_operations_match_python_sets():
+    rng = np.random.default_rng(0)
+    # Sparse chunks stay arrays, dense ones become bitsets
+    a = np.concatenate([rng.choice(CHUNK_SIZE, 100, replace=False),
+                        CHUNK_SIZE + rng.choice(CHUNK_SIZE, ARRAY_LIMIT * 4, replace=False),
+                        3 * CHUNK_SIZE + rng.choice(CHUNK_SIZE, 50, replace=False)])
+    b = np.concatenate([rng.choice(CHUNK_SIZE, ARRAY_LIMIT * 2, replace=False),
+                        CHUNK_SIZE + rng.choice(CHUNK_SIZE, 300, replace=False),
+                        2 * CHUNK_SIZE + rng.choice(CHUNK_SIZE, 10, replace=False)])
+    bitmap_a, bitmap_b = Bitmap.from_ids(a), Bitmap.from_ids(b)
+    set_a, set_b = set(a.tolist()), set(b.tolist())
+
+    def members(bitmap, start=0):
+        chunks = list(bitmap.chunks(start))
+        return np.concatenate(chunks).tolist() if chunks else []
+
+    assert len(bitmap_a) == len(set_a)
+    assert members(bitmap_a & bitmap_b) == sorted(set_a & set_b)
+    assert members(bitmap_a | bitmap_b) == sorted(set_a | set_b)
+    assert len(bitmap_a | bitmap_b) == len(set_a | set_b)
+    start = CHUNK_SIZE + 1234
+    assert members(bitmap_a, start) == sorted(x for x in set_a if x >= start)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_pages_match_brute_force(seed):
+    records = random_records(3_000, seed)
+    listing = TaxpayerListing(records)
+    queries = [
+        ({}, None, None),
+        ({"status": ["active"]}, None, None),
+        ({"status": ["Active", "pending"], "tax_center": ["Ndola"]}, None, None),
+        ({"risk_level": ["High"]}, 20, 60),
+        ({}, 99.0, None),          # selective range, read from the sorted scores
+        ({}, None, 1.5),
+        ({}, 10, 90),              # wide range, checked chunk by chunk
+        ({"tax_center": ["Kitwe", "Lusaka"]}, 50, None),
+        ({"tax_center": ["Mongu"]}, None, None),
+        ({"status": ["active"], "risk_level": ["low"]}, 40.5, 40.5),
+    ]
+    for filters, min_score, max_score in queries:
+        expected = brute_force(records, filters, min_score, max_score)
+        for limit in (1, 7, 200):
+            tpins, totals = all_pages(listing, limit, filters=filters, min_score=min_score, max_score=max_score)
+            assert tpins == expected, (filters, min_score, max_score, limit)
+            assert totals == {len(expected)}
+
+
+def test_pages_span_chunks():
+    # More taxpayers than one bitmap chunk holds
+    records = [(f"{100000000 + i:09d}", {"status": "Active" if i % 3 else "Suspended"},
+                {"compliance_score": i % 101}) for i in range(CHUNK_SIZE + 5_000)]
+    listing = TaxpayerListing(records)
+    page = listing.query({"status": ["suspended"]}, min_score=100, after=f"{100000000 + CHUNK_SIZE - 500:09d}", limit=3)
+    expected = [tpin for tpin, taxpayer, compliance in records
+                if taxpayer["status"] == "Suspended" and compliance["compliance_score"] >= 100
+                and tpin > f"{100000000 + CHUNK_SIZE - 500:09d}"][:3]
+    assert [row["tpin"] for row in page["taxpayers"]] == expected
+    assert page["next_after"] == expected[-1]
+
+
+def test_rows_carry_indexed_fields():
+    listing = TaxpayerListing([
+        ("100000002", {"status": "Active", "tax_center": "Ndola"}, {"risk_level": "Low", "compliance_score": 88}),
+        ("100000001", {"status": "Suspended", "tax_center": "Lusaka"}, {}),
+    ])
+    assert listing.query()["taxpayers"] == [
+        {"tpin": "100000001", "status": "Suspended", "tax_center": "Lusaka", "risk_level": None,
+         "compliance_score": None},
+        {"tpin": "100000002", "status": "Active", "tax_center": "Ndola", "risk_level": "Low",
+         "compliance_score": 88.0},
+    ]
+    with pytest.raises(ValueError):
+        listing.query({"name": ["x"]})
@@ -0,0 +1,42 @@
+"""
+Tests for penalty and interest pricing
+"""
+import random
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pytest
+
+from api.penalties import assess_batch, penalty_engine
+from core.money import MAX_NGWEE, apply_rate
+from core.tax_verification.penalties import PenaltyEngine, PenaltyRule
+
+
+@pytest.mark.parametrize("rate", ["0.05", "0.123456789", "1.000000000000007", "0.3333333333333333"])
+def test_apply_rate_matches_decimal(rate):
+    rng = random.Random(rate)
+    amounts = [rng.randint(-MAX_NGWEE, MAX_NGWEE) for _ in range(1_000)] + [MAX_NGWEE, -MAX_NGWEE, 0]
+    expected = [int((Decimal(amount) * Decimal(rate)).quantize(Decimal(1), ROUND_HALF_UP)) for amount in amounts]
+    assert apply_rate(np.array(amounts, dtype=np.int64), rate).tolist() == expected
+
+
+def test_long_fixed_rate_does_not_overflow():
+    engine = PenaltyEngine({"VAT": PenaltyRule(fixed_rate="0.123456789")})
+    charges = engine.assess("VAT", [100_000_000_000], ["2024-01-01"], ["2024-02-01"])
+    assert charges["fixed_penalty"].tolist() == [12_345_678_900]
+
+
+@pytest.mark.parametrize("data", [{"fixed_rate": "abc"}, {"daily_rate": "-0.01"},
+                                  {"interest_rate": [["2024-01-01", "x"]]}])
+def test_invalid_rates_are_rejected(data):
+    with pytest.raises(ValueError):
+        PenaltyEngine({"VAT": PenaltyRule.from_dict(data)})
+
+
+def test_as_of_is_checked_before_the_batch():
+    rows = [{"tax_type": "VAT", "amount": "1000", "due_date": "2024-01-01", "paid_on": ""}]
+    with pytest.raises(ValueError, match="as_of"):
+        assess_batch(rows, penalty_engine.end + timedelta(days=1))
+    priced, total = assess_batch(rows, date(2024, 3, 1))
+    assert priced[0]["error"] == "" and total > 0
@@ -0,0 +1,46 @@
+"""
+Tests for the streaming detection pipeline
+"""
+import json
+
+import pytest
+
+from fraud.pipeline import DetectionPipeline
+
+
+def filing_lines():
+    lines = []
+    for month in range(1, 7):
+        for number in range(40):
+            tpin = f"{100000000 + number:09d}" if number != 7 else "12345"
+            income = 50_000 if month < 4 or number % 5 else 10_000
+            lines.append(json.dumps({
+                "tpin": tpin, "period": f"2024-{month:02d}", "amount": income, "vat_amount": income * 0.16,
+                "due_date": f"2024-{month:02d}-14", "submitted_on": f"2024-{month:02d}-{14 + number % 3:02d}",
+            }) + "\n")
+    lines.insert(30, "not json\n")
+    return lines
+
+
+def as_csv(lines):
+    columns = ["tpin", "period", "amount", "vat_amount", "due_date", "submitted_on"]
+    rows = [json.loads(line) for line in lines if line.startswith("{")]
+    return [",".join(columns) + "\n"] + [",".join(str(row[c]) for c in columns) + "\n" for row in rows]
+
+
+def run(lines, fmt, **kwargs):
+    pipeline = DetectionPipeline(batch_size=17, **kwargs)
+    records = [(r.tpin, r.period, r.due_date, r.submitted_on, r.flags, r.features, r.score)
+               for r in pipeline.run(lines, fmt)]
+    return records, pipeline.stats
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_worker_processes_match_threads(fmt):
+    lines = filing_lines() if fmt == "jsonl" else as_csv(filing_lines())
+    records, stats = run(lines, fmt)
+    assert len(records) == 234 and stats.invalid_tpin == 6
+    assert stats.malformed == (1 if fmt == "jsonl" else 0)
+    assert any("late_filing_pattern" in flags for _, _, _, _, flags, _, _ in records)
+    assert any("income_drop" in flags for _, _, _, _, flags, _, _ in records)
+    assert run(lines, fmt, workers=2) == (records, stats)
@@ -0,0 +1,49 @@
+"""
+Tests for request profiling
+"""
+from flask import Flask
+
+from api.profiling import PROFILE_HEADER, RequestProfiler
+
+
+def make_app(tmp_path, token):
+    app = Flask(__name__)
+
+    @app.route("/api/taxpayers/<tpin>")
+    def taxpayer(tpin):
+        return {"tpin": tpin}
+
+    profiler = RequestProfiler(str(tmp_path), token=token, sample_rate=0)
+    profiler.init_app(app)
+    return app.test_client(), profiler
+
+
+def test_header_needs_the_token(tmp_path):
+    client, profiler = make_app(tmp_path, "s3cret")
+    client.get("/api/taxpayers/123456789", headers={PROFILE_HEADER: "1"})
+    client.get("/api/taxpayers/123456789")
+    assert profiler.slowest() == [] and list(tmp_path.iterdir()) == []
+
+    client.get("/api/taxpayers/123456789", headers={PROFILE_HEADER: "s3cret"})
+    assert [profile["path"] for profile in profiler.slowest()] == ["/api/taxpayers/123456789"]
+
+
+def test_listing_needs_the_token(tmp_path):
+    client, profiler = make_app(tmp_path, "s3cret")
+    client.get("/api/taxpayers/123456789", headers={PROFILE_HEADER: "s3cret"})
+    name = profiler.slowest()[0]["name"]
+
+    assert client.get("/api/debug/profiles").status_code == 403
+    assert client.get(f"/api/debug/profiles/{name}", headers={PROFILE_HEADER: "guess"}).status_code == 403
+    response = client.get("/api/debug/profiles", headers={PROFILE_HEADER: "s3cret"})
+    assert [profile["name"] for profile in response.get_json()["profiles"]] == [name]
+    assert client.get(f"/api/debug/profiles/{name}", headers={PROFILE_HEADER: "s3cret"}).status_code == 200
+    # Reading profiles is not itself profiled
+    assert len(profiler.slowest()) == 1
+
+
+def test_no_token_disables_header_and_listing(tmp_path):
+    client, profiler = make_app(tmp_path, "")
+    client.get("/api/taxpayers/123456789", headers={PROFILE_HEADER: "1"})
+    assert profiler.slowest() == []
+    assert client.get("/api/debug/profiles", headers={PROFILE_HEADER: "1"}).status_code == 404
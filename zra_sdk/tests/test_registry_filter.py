@@ -0,0 +1,54 @@
+"""
+Tests for the registry Bloom filter
+"""
+import pytest
+
+from api.data_sources import InMemoryDataSource, SQLiteDataSource
+from api.registry_filter import RegistryFilter
+from core.tax_verification.exceptions import TPINNotFoundError
+
+
+def test_blacklisted_tpins_never_pass():
+    registry = [f"{100000000 + i:09d}" for i in range(20_000)]
+    blocklist = [f"{500000000 + i:09d}" for i in range(20_000)]
+    registry_filter = RegistryFilter.build(registry, blocklist, false_positive_rate=0.01)
+    # Some of them are false positives of the registered filter
+    assert registry_filter.registered.contains_many(blocklist).any()
+    assert not registry_filter.allowed_many(blocklist).any()
+    assert all(registry_filter.reason(tpin) == f"TPIN {tpin} is blacklisted" for tpin in blocklist)
+    with pytest.raises(TPINNotFoundError):
+        registry_filter.check(blocklist[0])
+    assert registry_filter.allowed_many(registry).all()
+
+
+def test_deregistered_taxpayers_are_rejected():
+    taxpayers = {
+        "100000001": {"status": "Active"},
+        "100000002": {"status": "Suspended"},
+        "100000003": {"status": "pending"},
+        "100000004": {"status": "Deregistered"},
+        "100000005": {"status": "Inactive"},
+        "100000006": {},
+    }
+    registry_filter = RegistryFilter.from_data_source(InMemoryDataSource(taxpayers, {}))
+    allowed = registry_filter.allowed_many(list(taxpayers))
+    assert dict(zip(taxpayers, allowed.tolist())) == {
+        "100000001": True, "100000002": True, "100000003": True,
+        "100000004": False, "100000005": False, "100000006": True,
+    }
+
+
+def test_loaded_taxpayers_are_added(tmp_path):
+    source = SQLiteDataSource(str(tmp_path / "registry.db"))
+    source.load({"100000001": {"status": "Active"}})
+    registry_filter = RegistryFilter.from_data_source(source, blocklist=["100000003"])
+    source.subscribe(registry_filter.add)
+    source.load({
+        "100000002": {"status": "Active"},
+        "100000003": {"status": "Active"},
+        "100000004": {"status": "Deregistered"},
+    })
+    assert registry_filter.reason("100000002") is None
+    assert registry_filter.reason("100000003") == "TPIN 100000003 is blacklisted"
+    assert registry_filter.reason("100000004") == "TPIN 100000004 not found"
+    source.close()
@@ -0,0 +1,117 @@
+"""
+Tests for taxpayer search and autocomplete
+"""
+import random
+
+import pytest
+
+from api.search import SCORES, TaxpayerSearchIndex, normalize
+
+WORDS = ["banda", "bwalya", "mwansa", "phiri", "tembo", "zulu", "lungu", "mulenga", "chanda", "daka",
+         "trading", "holdings", "enterprises", "farms", "mining", "ltd", "limited", "and", "sons"]
+
+
+def random_registry(count, seed):
+    rng = random.Random(seed)
+    tpins = rng.sample(range(100000000, 999999999), count)
+    records = []
+    for tpin in tpins:
+        name = " ".join(rng.choice(WORDS[:10]).title() for _ in range(rng.randint(1, 3)))
+        business = " ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4)))
+        records.append((f"{tpin:09d}", name, business))
+    return records
+
+
+def brute_force_words(records, query):
+    """Ranked TPINs of the taxpayers having every query word, the last one as a prefix."""
+    words = normalize(query).split()
+    prefix = not query[-1:].isspace()
+    phrase = " ".join(words)
+    ranked = []
+    for doc, (tpin, name, business) in enumerate(records):
+        name, business = normalize(name), normalize(business)
+        terms = set(name.split()) | set(business.split())
+
+        def has(word, is_prefix):
+            return any(term.startswith(word) for term in terms) if is_prefix else word in terms
+
+        if not all(has(word, prefix and i == len(words) - 1) for i, word in enumerate(words)):
+            continue
+        if phrase in (name, business):
+            match = "exact"
+        elif name.startswith(phrase) or business.startswith(phrase):
+            match = "prefix"
+        else:
+            match = "words"
+        ranked.append((-SCORES[match], len(name), name, doc, tpin, match))
+    ranked.sort()
+    return [(tpin, match) for *_, tpin, match in ranked]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_word_matches_match_brute_force(seed):
+    records = random_registry(600, seed)
+    index = TaxpayerSearchIndex(records)
+    rng = random.Random(seed)
+    queries = ["banda", "ban", "mwansa trad", "zulu ", "phiri holdings ltd", "tembo and s", "chanda mining"]
+    queries += [records[rng.randrange(len(records))][1] for _ in range(5)]
+    queries += [records[rng.randrange(len(records))][2][:7] for _ in range(5)]
+    for query in queries:
+        expected = brute_force_words(records, query)
+        found = [(hit["tpin"], hit["match"]) for hit in index.search(query, limit=len(records))
+                 if hit["match"] != "fuzzy"]
+        assert found == expected, query
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_tpin_prefixes_match_brute_force(seed):
+    records = random_registry(2_000, seed)
+    index = TaxpayerSearchIndex(records)
+    tpins = sorted(tpin for tpin, _, _ in records)
+    for prefix in ["1", "23", "456", records[0][0][:5], records[1][0]]:
+        expected = [tpin for tpin in tpins if tpin.startswith(prefix)][:25]
+        assert [hit["tpin"] for hit in index.search(prefix, limit=25)] == expected
+
+
+def test_misspelled_words_match_fuzzily():
+    index = TaxpayerSearchIndex([
+        ("100000001", "Chileshe Mwansa", "Mwansa Trading"),
+        ("100000002", "Bupe Tembo", "Tembo Farms"),
+    ])
+    hits = index.search("mwnasa trading ", limit=5)
+    assert hits[0]["tpin"] == "100000001"
+    assert hits[0]["match"] == "fuzzy"
+
+
+def test_exact_names_rank_first():
+    index = TaxpayerSearchIndex([
+        ("100000001", "Banda Holdings Zulu", ""),
+        ("100000002", "Zulu Banda", ""),
+        ("100000003", "Banda", "Zulu Holdings"),
+    ])
+    hits = index.search("banda", limit=3)
+    assert [hit["match"] for hit in hits] == ["exact", "prefix", "words"]
+    assert [hit["tpin"] for hit in hits] == ["100000003", "100000001", "100000002"]
+
+
+def test_common_words_find_every_match():
+    # Both words have far more postings than any cap on candidates
+    records = [(f"{100000000 + i:09d}", "Mwansa Phiri", "") for i in range(3_000)]
+    records += [(f"{200000000 + i:09d}", "Banda Zulu", "") for i in range(3_000)]
+    records += [(f"{300000000 + i:09d}", "Mwansa Banda", "") for i in range(4_000)]
+    index = TaxpayerSearchIndex(records)
+    hits = index.search("mwansa banda", limit=20)
+    assert [hit["match"] for hit in hits] == ["exact"] * 20
+    assert [hit["tpin"] for hit in hits] == [f"{300000000 + i:09d}" for i in range(20)]
+    assert len(brute_force_words(records, "mwansa banda")) == 4_000
+
+
+def test_prefix_hits_rank_before_later_word_matches():
+    # Thousands of taxpayers have a "b..." word, a few names start with it
+    records = [(f"{100000000 + i:09d}", "Zulu Bwalya Trading", "") for i in range(5_000)]
+    records += [(f"{200000000 + i:09d}", "Byumba", "") for i in range(3)]
+    index = TaxpayerSearchIndex(records)
+    expected = brute_force_words(records, "b")
+    hits = index.search("b", limit=5)
+    assert [(hit["tpin"], hit["match"]) for hit in hits] == expected[:5]
+    assert [hit["match"] for hit in hits] == ["prefix"] * 3 + ["words"] * 2
@@ -0,0 +1,93 @@
+"""
+Tests for the tax return submission log
+"""
+import json
+import threading
+
+import pytest
+
+from api.submissions import SubmissionLog
+
+
+def payload(number):
+    return {"tpin": f"{100000000 + number:09d}", "tax_type": "income_tax", "amount": number * 10}
+
+
+def read_records(path):
+    with open(path, "rb") as f:
+        return [json.loads(line) for line in f.read().splitlines()]
+
+
+def test_replay_restores_receipts_and_keys(tmp_path):
+    path = str(tmp_path / "submissions.log")
+    log = SubmissionLog(path)
+    first = {number: log.submit(payload(number), key=f"key-{number}" if number % 2 else None)[0]
+             for number in range(1, 21)}
+    log.close()
+
+    replayed = SubmissionLog(path)
+    try:
+        assert len(replayed) == 20
+        for number in range(1, 21, 2):
+            assert replayed.get(f"key-{number}") == first[number]
+            record, duplicate = replayed.submit(payload(number), key=f"key-{number}")
+            assert duplicate and record["receipt_number"] == first[number]["receipt_number"]
+        with pytest.raises(ValueError):
+            replayed.submit(payload(99), key="key-1")
+        record, duplicate = replayed.submit(payload(21), key="key-21")
+        assert not duplicate and record["sequence"] == 21 and record["receipt_number"] == "ZRA0000021"
+    finally:
+        replayed.close()
+    assert [record["sequence"] for record in read_records(path)] == list(range(1, 22))
+
+
+def test_replay_drops_torn_write(tmp_path):
+    path = str(tmp_path / "submissions.log")
+    log = SubmissionLog(path)
+    for number in range(1, 4):
+        log.submit(payload(number), key=f"key-{number}")
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b'{"sequence": 4, "submission_id": "TRX0000')
+
+    replayed = SubmissionLog(path)
+    try:
+        assert len(replayed) == 3
+        record, duplicate = replayed.submit(payload(4), key="key-4")
+        assert not duplicate and record["sequence"] == 4
+    finally:
+        replayed.close()
+    assert [record["sequence"] for record in read_records(path)] == [1, 2, 3, 4]
+
+
+def test_concurrent_submissions_get_unique_receipts(tmp_path):
+    path = str(tmp_path / "submissions.log")
+    log = SubmissionLog(path)
+    other = SubmissionLog(path)  # Another worker appending to the same file
+    receipts, lock = [], threading.Lock()
+
+    def submit(target, number):
+        # Every key is submitted twice; only the first creates a record
+        record, _ = target.submit(payload(number % 50), key=f"key-{number % 50}")
+        with lock:
+            receipts.append((number % 50, record["receipt_number"]))
+
+    threads = [threading.Thread(target=submit, args=(log if number % 2 else other, number)) for number in range(100)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+    other.close()
+
+    records = read_records(path)
+    assert [record["sequence"] for record in records] == list(range(1, 51))
+    by_key = {record["idempotency_key"]: record["receipt_number"] for record in records}
+    assert all(by_key[f"key-{number}"] == receipt for number, receipt in receipts)
+
+    replayed = SubmissionLog(path)
+    try:
+        assert len(replayed) == 50
+        assert all(replayed.get(key)["receipt_number"] == receipt for key, receipt in by_key.items())
+    finally:
+        replayed.close()
@@ -0,0 +1,37 @@
+"""
+Tests for rolling VAT turnover
+"""
+from datetime import date
+
+from core.tax_verification.turnover import TurnoverTracker
+from core.tax_verification.vat_verifier import VATVerifier
+
+
+def test_breaches_wait_for_registrations():
+    tracker = TurnoverTracker(threshold=1_000)
+    assert not tracker.add_sale("100000001", date(2024, 1, 5), 5_000)
+    assert tracker.breaches() == []
+    assert not tracker.registration_status("100000001")["breach"]
+    # Without registrations every TPIN still verifies as registered
+    assert VATVerifier(turnover=tracker)._check_vat_registration("100000001")
+
+    tracker.set_registered(["100000002"])
+    assert [breach["tpin"] for breach in tracker.breaches()] == ["100000001"]
+    assert not VATVerifier(turnover=tracker)._check_vat_registration("100000001")
+    assert VATVerifier(turnover=tracker)._check_vat_registration("100000002")
+    assert not tracker.add_sale("100000002", date(2024, 1, 5), 5_000)
+
+
+def test_crossing_again_is_reported_again():
+    tracker = TurnoverTracker(threshold=1_000)
+    tracker.set_registered([])
+    assert not tracker.add_sale("100000001", date(2024, 1, 5), 800)
+    assert tracker.add_sale("100000001", date(2024, 2, 5), 500)
+    # Credit note takes it back under, then a sale crosses again
+    assert not tracker.add_sale("100000001", date(2024, 2, 6), -700)
+    assert tracker.add_sale("100000001", date(2024, 3, 5), 600)
+
+    # January leaves the window: 100000001 drops to 400, then crosses in 2025
+    assert tracker.add_sales(["100000002"], [202501], [200_000]) == ["100000002"]
+    assert tracker.breaches()[0]["tpin"] == "100000002"
+    assert tracker.add_sales(["100000001"], [202502], [90_000]) == ["100000001"]
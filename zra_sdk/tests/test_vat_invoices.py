@@ -0,0 +1,158 @@
+"""
+Tests for VAT invoice ingestion and the VAT ledger
+"""
+import json
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+from api.vat_invoices import VATLedger, iter_invoice_blocks, iter_invoice_chunks, process_block
+
+
+def random_invoices(count, seed=0):
+    rng = random.Random(seed)
+    tpins = [f"{rng.randrange(100000000, 999999999):09d}" for _ in range(20)]
+    invoices = []
+    for number in range(count):
+        invoices.append({
+            "invoice_number": f"INV-{number}",
+            "supplier_tpin": rng.choice(tpins),
+            "buyer_tpin": rng.choice(tpins + [""]),
+            "invoice_date": f"2024-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d}",
+            "amount": f"{rng.randint(-50_000, 5_000_000) / 100:.2f}",
+            "pricing": rng.choice(["exclusive", "inclusive"]),
+            "vat_rate": rng.choice(["0.16", "0", "0.1"]),
+        })
+    return invoices
+
+
+def brute_force_ledger(invoices):
+    """(TPIN, period) -> [output VAT, input VAT, sales, purchases] in ngwee, one invoice at a time."""
+    ledger = {}
+    for invoice in invoices:
+        amount = Decimal(invoice["amount"]) * 100
+        rate = Decimal(invoice["vat_rate"])
+        if invoice["pricing"] == "inclusive":
+            vat = (amount * rate / (1 + rate)).quantize(Decimal(1), ROUND_HALF_UP)
+            net = amount - vat
+        else:
+            vat = (amount * rate).quantize(Decimal(1), ROUND_HALF_UP)
+            net = amount
+        period = invoice["invoice_date"][:7]
+        supplier = ledger.setdefault((invoice["supplier_tpin"], period), [0, 0, 0, 0])
+        supplier[0] += int(vat)
+        supplier[2] += int(net)
+        if invoice["buyer_tpin"]:
+            buyer = ledger.setdefault((invoice["buyer_tpin"], period), [0, 0, 0, 0])
+            buyer[1] += int(vat)
+            buyer[3] += int(net)
+    return ledger
+
+
+def ledger_totals(ledger):
+    return {
+        (row["tpin"], row["period"]): [
+            round(row[column] * 100) for column in ("output_vat", "input_vat", "sales", "purchases")
+        ]
+        for row in ledger.rows()
+    }
+
+
+def as_csv(invoices):
+    columns = list(invoices[0])
+    return [",".join(columns) + "\n"] + [",".join(invoice[c] for c in columns) + "\n" for invoice in invoices]
+
+
+def as_json_lines(invoices):
+    return [json.dumps(invoice) + "\n" for invoice in invoices]
+
+
+@pytest.mark.parametrize("encode", [as_csv, as_json_lines])
+def test_ledger_matches_brute_force(encode):
+    invoices = random_invoices(2_000)
+    ledger = VATLedger()
+    summary = ledger.ingest(iter_invoice_chunks(encode(invoices), chunk_size=300))
+    assert summary["accepted"] == len(invoices) and summary["rejected"] == 0
+    assert ledger_totals(ledger) == brute_force_ledger(invoices)
+
+
+def test_chunks_merge_like_one_upload():
+    invoices = random_invoices(1_000, seed=1)
+    split = VATLedger()
+    split.ingest(iter_invoice_chunks(as_json_lines(invoices[:400])))
+    split.ingest(iter_invoice_chunks(as_json_lines(invoices[400:])))
+    whole = VATLedger()
+    whole.ingest(iter_invoice_chunks(as_json_lines(invoices)))
+    assert list(split.rows()) == list(whole.rows())
+
+
+def test_bad_lines_are_reported_per_row():
+    invoices = random_invoices(10, seed=2)
+    lines = as_json_lines(invoices)
+    lines[3] = '{"invoice_number": "INV-3", "amount": \n'
+    lines[6] = '["not", "an", "object"]\n'
+    ledger = VATLedger()
+    summary = ledger.ingest(iter_invoice_chunks(lines, chunk_size=4))
+    assert summary["rows"] == 10 and summary["accepted"] == 8
+    assert [error["row"] for error in summary["errors"]] == [4, 7]
+    assert all(error["error"].startswith("Invalid JSON line") for error in summary["errors"])
+    kept = [invoice for i, invoice in enumerate(invoices) if i not in (3, 6)]
+    assert ledger_totals(ledger) == brute_force_ledger(kept)
+
+
+def test_failed_upload_leaves_ledger_unchanged():
+    invoices = random_invoices(500, seed=3)
+    ledger = VATLedger()
+    ledger.ingest(iter_invoice_chunks(as_json_lines(invoices[:100])))
+    before = list(ledger.rows())
+
+    def broken_upload():
+        yield from iter_invoice_chunks(as_json_lines(invoices[100:300]), chunk_size=50)
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    with pytest.raises(UnicodeDecodeError):
+        ledger.ingest(broken_upload())
+    assert list(ledger.rows()) == before
+
+    ledger.ingest(iter_invoice_chunks(as_json_lines(invoices[100:300])))
+    assert ledger_totals(ledger) == brute_force_ledger(invoices[:300])
+
+
+def test_invalid_rows_are_skipped():
+    invoices = random_invoices(4, seed=4)
+    invoices[1]["supplier_tpin"] = "12345"
+    invoices[2]["vat_rate"] = "abc"
+    summary = VATLedger().ingest([invoices])
+    assert summary["accepted"] == 2
+    assert [error["row"] for error in summary["errors"]] == [2, 3]
+
+
+def test_sent_again_invoices_are_skipped():
+    invoices = random_invoices(600, seed=5)
+    ledger = VATLedger()
+    ledger.ingest(iter_invoice_chunks(as_json_lines(invoices[:400]), chunk_size=70))
+    summary = ledger.ingest(iter_invoice_chunks(as_json_lines(invoices[300:] + invoices[450:460]), chunk_size=70))
+    assert summary["accepted"] == 200 and summary["rejected"] == 110
+    assert summary["errors"][0]["row"] == 1 and summary["errors"][0]["invoice_number"] == "INV-300"
+    assert summary["errors"][-1]["row"] == 100 and summary["errors"][-1]["invoice_number"] == "INV-399"
+    assert ledger.invoices == 600
+    assert ledger_totals(ledger) == brute_force_ledger(invoices)
+
+    # Invoice numbers are per supplier
+    other = dict(invoices[0], supplier_tpin="100000001", buyer_tpin="")
+    assert ledger.ingest([[other]])["accepted"] == 1
+
+
+def test_chunk_results_merge_like_one_upload():
+    invoices = random_invoices(3_000, seed=6)
+    lines = as_csv(invoices)
+    split = VATLedger()
+    summary = {"rows": 0, "accepted": 0, "rejected": 0, "errors": []}
+    for block in iter_invoice_blocks(lines + lines[1:500], chunk_size=25):
+        split.add_result(summary, *process_block(block))
+    assert summary["accepted"] == 3_000 and summary["rejected"] == 499
+    assert ledger_totals(split) == brute_force_ledger(invoices)
+    whole = VATLedger()
+    whole.ingest(iter_invoice_chunks(lines))
+    assert list(split.rows()) == list(whole.rows())
@@ -4,9 +4,18 @@ ZRA SDK Web Application with Compliance Features
 """
 
 try:
-    from flask import Flask, request, jsonify, render_template
+    from flask import Flask, Response, g, request, jsonify, render_template, send_file
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    import codecs
+    import hashlib
+    import io
+    import json
+    import math
     import sys
     import os
+    import tempfile
+    import threading
+    from datetime import datetime
 
     # FIX FOR DEPLOYMENT: Add the correct paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -26,17 +35,15 @@ try:
             print("✅ Imported from zra_sdk.api.taxpayer_api")
         except ImportError as e:
             print(f"❌ Import failed: {e}")
-            # Mock functions for deployment
+            # Serve the SDK's sample records for deployment
+            try:
+                from api.data_sources import InMemoryDataSource
+            except ImportError:
+                from zra_sdk.api.data_sources import InMemoryDataSource
+            sample_data = InMemoryDataSource()
+
             def verify_taxpayer(tpin):
-                return type('Taxpayer', (), {
-                    'name': 'Demo User',
-                    'business_name': f'Demo Business {tpin}',
-                    'status': 'Active',
-                    'email': 'demo@zra.gov.zm',
-                    'phone': '+260 123 456 789',
-                    'registration_date': '2023-01-01',
-                    'tax_center': 'Lusaka'
-                })()
+                return type('Taxpayer', (), sample_data.get(tpin) or sample_data.get('123456789'))()
             
             def calculate_tax(income, tax_type='income'):
                 tax_amount = income * 0.3
@@ -48,13 +55,251 @@ try:
                 })()
             
             def check_compliance(tpin):
-                return {'status': 'Compliant', 'score': 95}
+                return sample_data.get_compliance(tpin) or sample_data.get_compliance('123456789')
             
             def get_compliance_report(tpin):
-                return {'overall_score': 95, 'details': 'All taxes filed'}
+                taxpayer = verify_taxpayer(tpin)
+                return {
+                    'taxpayer_info': {'name': taxpayer.name, 'business_name': taxpayer.business_name,
+                                      'tpin': taxpayer.tpin, 'tax_center': taxpayer.tax_center},
+                    'compliance_summary': check_compliance(tpin),
+                    'recommendations': []
+                }
+
+    try:
+        from core.config import ZRAConfig
+        from core.money import to_kwacha
+        from core.taxpayer import ComplianceEngine, AuditScheduler
+        from core.taxpayer.audits import parse_capacities
+        from api.tax_engine import iter_csv_chunks, iter_parquet_chunks, stream_csv_results, write_parquet_results
+        from api.reports import ReportService
+        from api.jobs import JobQueue
+        from api.admission import AdmissionController, Overloaded
+        from api.profiling import RequestProfiler
+        from api.velocity import VelocityMonitor
+        from api.vat_invoices import VATLedger, iter_invoice_chunks
+        from api.taxpayer_api import verify_taxpayers, check_compliance_many, submit_tax_return, TAX_SCHEDULE_VERSION
+        from api.taxpayer_api import check_registered, get_registry_filter, get_data_source, get_turnover_tracker
+        from api.search import TaxpayerSearchIndex
+        from api.listing import TaxpayerListing
+        from fraud.peer_stats import PeerStatsIndex
+        from api.penalties import assess_batch
+        from core.tax_verification.exceptions import TPINNotFoundError
+        from api.tax_engine import calculate_rows
+    except ImportError:
+        from zra_sdk.core.config import ZRAConfig
+        from zra_sdk.core.money import to_kwacha
+        from zra_sdk.core.taxpayer import ComplianceEngine, AuditScheduler
+        from zra_sdk.core.taxpayer.audits import parse_capacities
+        from zra_sdk.api.tax_engine import iter_csv_chunks, iter_parquet_chunks, stream_csv_results, write_parquet_results
+        from zra_sdk.api.reports import ReportService
+        from zra_sdk.api.jobs import JobQueue
+        from zra_sdk.api.admission import AdmissionController, Overloaded
+        from zra_sdk.api.profiling import RequestProfiler
+        from zra_sdk.api.velocity import VelocityMonitor
+        from zra_sdk.api.vat_invoices import VATLedger, iter_invoice_chunks
+        from zra_sdk.api.taxpayer_api import verify_taxpayers, check_compliance_many, submit_tax_return, TAX_SCHEDULE_VERSION
+        from zra_sdk.api.taxpayer_api import check_registered, get_registry_filter, get_data_source, get_turnover_tracker
+        from zra_sdk.api.search import TaxpayerSearchIndex
+        from zra_sdk.api.listing import TaxpayerListing
+        from zra_sdk.fraud.peer_stats import PeerStatsIndex
+        from zra_sdk.api.penalties import assess_batch
+        from zra_sdk.core.tax_verification.exceptions import TPINNotFoundError
+        from zra_sdk.api.tax_engine import calculate_rows
+
+    # Registry filter, built now rather than on the first lookup
+    get_registry_filter()
+
+    def build_in_background(holder, name, build):
+        """
+        Build an index from the data source off the request threads, into
+        holder['index']. It is None when the source cannot list its records,
+        and when the build fails, which also sets holder['failed'].
+        """
+        def run():
+            try:
+                holder['index'] = build(get_data_source())
+            except NotImplementedError:
+                holder['index'] = None
+            except Exception:
+                app.logger.exception('Could not build the %s', name.replace('-', ' '))
+                holder['failed'] = True
+                holder['index'] = None
+
+        threading.Thread(target=run, name=f'zra-{name}', daemon=True).start()
+
+    # Name search over the registry
+    search_index = {}
+    build_in_background(search_index, 'search-index', TaxpayerSearchIndex.from_data_source)
+
+    # Bitmap indexes for filtered listings
+    taxpayer_listing = {}
+    build_in_background(taxpayer_listing, 'taxpayer-listing', TaxpayerListing.from_data_source)
+
+    # Outstanding payments per peer group (tax center, business category), to
+    # show in compliance checks how unusual a taxpayer's arrears are
+    peer_stats = {}
+    build_in_background(peer_stats, 'peer-stats', PeerStatsIndex.from_data_source)
+
+    def peer_comparison(tpin, compliance):
+        """Outstanding payments against the taxpayer's peers, None until known."""
+        index = peer_stats.get('index')
+        if index is None or compliance.get('outstanding_payments') is None:
+            return None
+        taxpayer = get_data_source().get(tpin) or {}
+        score = index.score(
+            taxpayer.get('tax_center'), taxpayer.get('business_category'), float(compliance['outstanding_payments'])
+        )
+        if score is None:
+            return None
+        return {
+            'field': 'outstanding_payments',
+            'percentile': round(score.percentile, 1),
+            'robust_z': round(score.robust_z, 2) if math.isfinite(score.robust_z) else None,
+            'peer_count': score.peer_count,
+            'tax_center': score.group[0],
+            'business_category': score.group[1],
+        }
+
+    # Materialized compliance view, kept current from the local event log and
+    # seeded from the data source on each TPIN's first event
+    compliance_engine = ComplianceEngine(get_data_source())
+
+    # Audit queue, loaded off the request threads and requeued on compliance changes
+    audit_scheduler = AuditScheduler(parse_capacities(ZRAConfig.AUDIT_CAPACITIES), ZRAConfig.AUDIT_CAPACITY)
+    audit_scheduler.load_in_background(get_data_source())
+    compliance_engine.subscribe(lambda tpin, summary: audit_scheduler.update(
+        tpin, risk_level=summary['risk_level'], compliance_score=summary['compliance_score']
+    ))
+
+    if ZRAConfig.COMPLIANCE_EVENTS_FILE:
+        compliance_engine.follow(ZRAConfig.COMPLIANCE_EVENTS_FILE)
+
+    # Printable reports are rendered off the request threads
+    report_service = ReportService(
+        get_compliance_report,
+        workers=ZRAConfig.REPORT_WORKERS,
+        cache_size=ZRAConfig.REPORT_CACHE_SIZE
+    )
+
+    # Long-running batches run on a checkpointed background queue
+    job_queue = JobQueue(
+        ZRAConfig.JOB_DB,
+        handlers={
+            'verify': verify_taxpayers,
+            'compliance': check_compliance_many,
+            'tax': calculate_rows
+        },
+        workers=ZRAConfig.JOB_WORKERS,
+        chunk_size=ZRAConfig.JOB_CHUNK_SIZE
+    )
+    job_queue.start()
+
+    # Running VAT positions per TPIN and period from uploaded invoices; suppliers'
+    # sales also feed the rolling turnover checked against the VAT threshold
+    turnover_tracker = get_turnover_tracker()
+    vat_ledger = VATLedger(turnover=turnover_tracker)
 
     app = Flask(__name__)
 
+    # Client address from the trusted proxies' X-Forwarded-For only
+    if ZRAConfig.PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=ZRAConfig.PROXY_HOPS, x_proto=ZRAConfig.PROXY_HOPS)
+
+    # Opt-in profiling of sampled requests; no hooks are registered when off
+    if ZRAConfig.PROFILE_DIR:
+        RequestProfiler(
+            ZRAConfig.PROFILE_DIR,
+            token=ZRAConfig.PROFILE_TOKEN,
+            sample_rate=ZRAConfig.PROFILE_SAMPLE_RATE
+        ).init_app(app)
+
+    # Request velocity per TPIN and caller, to spot scraping and repeated submissions
+    if ZRAConfig.VELOCITY_WINDOW:
+        VelocityMonitor(
+            routes={
+                'verify_taxpayer_api': 'lookup',
+                'check_compliance_api': 'lookup',
+                'submit_report_api': 'lookup',
+                'vat_liability_api': 'lookup',
+                'vat_registration_api': 'lookup',
+                'submit_tax_return_api': 'submission'
+            },
+            window=ZRAConfig.VELOCITY_WINDOW,
+            thresholds={
+                'tpin_lookups': ZRAConfig.VELOCITY_TPIN_LIMIT,
+                'caller_requests': ZRAConfig.VELOCITY_CALLER_LIMIT
+            }
+        ).init_app(app)
+
+    # Admission control: submissions outrank lookups, overflow is shed with 503
+    admission = AdmissionController(
+        routes={
+            'submit_tax_return_api': 'submission',
+            'submit_job_api': 'submission',
+            'verify_taxpayer_api': 'lookup',
+            'calculate_tax_api': 'lookup',
+            'check_compliance_api': 'lookup',
+            'submit_report_api': 'lookup',
+            'job_results_api': 'lookup',
+            'vat_liability_api': 'lookup',
+            'vat_registration_api': 'lookup',
+            'vat_threshold_breaches_api': 'lookup',
+            'search_taxpayers_api': 'lookup',
+            'list_taxpayers_api': 'lookup',
+            'audit_plan_api': 'lookup',
+            'audit_plan_api:POST': 'bulk',
+            'record_audit_api': 'submission',
+            'calculate_tax_bulk_api': 'bulk',
+            'ingest_vat_invoices_api': 'bulk',
+            'assess_penalties_api': 'bulk'
+        },
+        capacity=ZRAConfig.ADMISSION_CAPACITY,
+        queue_timeout=ZRAConfig.ADMISSION_QUEUE_TIMEOUT
+    )
+
+    @app.before_request
+    def admit_request():
+        route = admission.route_for(request.endpoint, request.method)
+        if not ZRAConfig.ADMISSION_CAPACITY or route is None:
+            return None
+        try:
+            g.admission_ticket = admission.acquire(route)
+        except Overloaded as e:
+            response = jsonify({'success': False, 'error': 'Service is busy, please retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        return None
+
+    @app.teardown_request
+    def release_request(exc):
+        ticket = g.pop('admission_ticket', None)
+        if ticket is not None:
+            admission.release(ticket)
+
+    # Cache lifetimes (seconds) of GET lookups
+    TAX_CALCULATION_MAX_AGE = 24 * 3600
+    TAXPAYER_MAX_AGE = 300
+
+    def cached_json(payload, version, max_age, last_modified=None, public=False):
+        """
+        JSON response for a GET lookup with an ETag derived from version,
+        answering 304 when the client's If-None-Match is still current.
+        Responses are private to the client unless public is set, so shared
+        caches do not keep taxpayer data.
+        """
+        response = jsonify(payload)
+        if request.method != 'GET':
+            return response
+        encoded = json.dumps(version, sort_keys=True, default=str).encode('utf-8')
+        response.set_etag(hashlib.sha256(encoded).hexdigest()[:32])
+        scope = 'public' if public else 'private'
+        response.headers['Cache-Control'] = f'{scope}, max-age={max(0, int(max_age))}'
+        if last_modified is not None:
+            response.last_modified = last_modified
+        return response.make_conditional(request)
+
     @app.route('/')
     def index():
         """Home page with web interface"""
@@ -87,21 +332,74 @@ try:
                 tpin = data.get('tpin', '123456789')
             
             taxpayer = verify_taxpayer(tpin)
-            return jsonify({
-                'success': True,
-                'data': {
-                    'name': taxpayer.name,
-                    'business_name': taxpayer.business_name,
-                    'status': taxpayer.status,
-                    'email': taxpayer.email,
-                    'phone': taxpayer.phone,
-                    'registration_date': taxpayer.registration_date,
-                    'tax_center': taxpayer.tax_center
-                }
-            })
+            data = {
+                'name': taxpayer.name,
+                'business_name': taxpayer.business_name,
+                'status': taxpayer.status,
+                'email': taxpayer.email,
+                'phone': taxpayer.phone,
+                'registration_date': taxpayer.registration_date,
+                'tax_center': taxpayer.tax_center
+            }
+            # The record's content is its version
+            return cached_json({'success': True, 'data': data}, ['taxpayer', tpin, data], TAXPAYER_MAX_AGE)
+        except TPINNotFoundError as e:
+            return jsonify({'success': False, 'error': str(e)}), 404
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
 
+    @app.route('/api/search')
+    def search_taxpayers_api():
+        """API endpoint to find taxpayers by TPIN prefix, name or business name (autocomplete)"""
+        query = request.args.get('q', '')
+        if not query.strip():
+            return jsonify({'success': False, 'error': 'Search query is required'}), 400
+        if 'index' not in search_index:
+            response = jsonify({'success': False, 'error': 'Search index is still loading, please retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        if search_index.get('failed'):
+            return jsonify({'success': False, 'error': 'Search index could not be built'}), 500
+        if search_index['index'] is None:
+            return jsonify({'success': False, 'error': 'Search is not available with this data source'}), 501
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        results = search_index['index'].search(query, limit)
+        return jsonify({'success': True, 'query': query, 'count': len(results), 'results': results})
+
+    @app.route('/api/taxpayers')
+    def list_taxpayers_api():
+        """API endpoint listing taxpayers by status, tax center, risk level and compliance score, a page at a time"""
+        if 'index' not in taxpayer_listing:
+            response = jsonify({'success': False, 'error': 'Taxpayer listing is still loading, please retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        if taxpayer_listing.get('failed'):
+            return jsonify({'success': False, 'error': 'Taxpayer listing could not be built'}), 500
+        if taxpayer_listing['index'] is None:
+            return jsonify({'success': False, 'error': 'Listing is not available with this data source'}), 501
+
+        # Each filter takes one or more values, repeated or comma-separated
+        filters = {}
+        for field in ('status', 'tax_center', 'risk_level'):
+            values = [value.strip() for arg in request.args.getlist(field) for value in arg.split(',') if value.strip()]
+            if values:
+                filters[field] = values
+        min_score = request.args.get('min_score', type=float)
+        max_score = request.args.get('max_score', type=float)
+        if (min_score is None and request.args.get('min_score')) or (max_score is None and request.args.get('max_score')):
+            return jsonify({'success': False, 'error': 'min_score and max_score must be numbers'}), 400
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+
+        page = taxpayer_listing['index'].query(filters, min_score, max_score, request.args.get('after'), limit)
+        records = get_data_source().get_many([row['tpin'] for row in page['taxpayers']])
+        for row in page['taxpayers']:
+            record = records.get(row['tpin']) or {}
+            row['name'] = record.get('name')
+            row['business_name'] = record.get('business_name')
+        return jsonify({'success': True, 'count': len(page['taxpayers']), **page})
+
     @app.route('/api/calculate-tax', methods=['POST', 'GET'])
     def calculate_tax_api():
         """API endpoint to calculate tax"""
@@ -115,7 +413,8 @@ try:
                 tax_type = data.get('tax_type', 'income')
             
             tax_calc = calculate_tax(income, tax_type)
-            return jsonify({
+            # A pure function of its inputs and the tax schedule
+            return cached_json({
                 'success': True,
                 'data': {
                     'gross_income': tax_calc.gross_income,
@@ -123,10 +422,188 @@ try:
                     'effective_tax_rate': tax_calc.effective_tax_rate,
                     'tax_breakdown': tax_calc.tax_breakdown
                 }
-            })
+            }, ['tax', income, tax_type, TAX_SCHEDULE_VERSION], TAX_CALCULATION_MAX_AGE, public=True)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/api/calculate-tax/bulk', methods=['POST'])
+    def calculate_tax_bulk_api():
+        """API endpoint to calculate tax for an uploaded payroll (CSV or Parquet)"""
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return jsonify({'success': False, 'error': "Upload a CSV or Parquet file as 'file'"}), 400
+
+        # Spool the upload to disk so the response can outlive the request body
+        source = tempfile.TemporaryFile()
+        upload.save(source)
+        source.seek(0)
+        try:
+            if upload.filename.lower().endswith('.parquet'):
+                result = tempfile.TemporaryFile()
+                with source:
+                    write_parquet_results(iter_parquet_chunks(source), result)
+                result.seek(0)
+                return send_file(
+                    result,
+                    mimetype='application/vnd.apache.parquet',
+                    as_attachment=True,
+                    download_name='tax_results.parquet'
+                )
+
+            def generate():
+                with source:
+                    lines = codecs.iterdecode(source, 'utf-8-sig')
+                    yield from stream_csv_results(iter_csv_chunks(lines))
+
+            response = Response(
+                generate(),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=tax_results.csv'}
+            )
+            # The rows are computed as the response streams, after the request
+            # is torn down, so the admission ticket is held until it closes
+            ticket = g.pop('admission_ticket', None)
+            if ticket is not None:
+                response.call_on_close(lambda: admission.release(ticket))
+            return response
+        except Exception as e:
+            source.close()
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/api/vat/invoices', methods=['POST'])
+    def ingest_vat_invoices_api():
+        """API endpoint to add an uploaded invoice file (CSV or JSON lines) to the VAT ledger"""
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return jsonify({'success': False, 'error': "Upload a CSV or JSON lines file as 'file'"}), 400
+        try:
+            lines = codecs.iterdecode(upload.stream, 'utf-8-sig')
+            summary = vat_ledger.ingest(iter_invoice_chunks(lines))
+            return jsonify({'success': True, **summary})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
 
+    @app.route('/api/vat/liability')
+    def vat_liability_api():
+        """API endpoint to get the VAT position of a TPIN, per period"""
+        tpin = request.args.get('tpin', '')
+        period = request.args.get('period')
+        try:
+            periods = vat_ledger.liability(tpin, period)
+            return jsonify({'success': True, 'tpin': tpin, 'periods': periods})
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/api/vat/registration')
+    def vat_registration_api():
+        """API endpoint to check a TPIN's VAT registration against its rolling turnover"""
+        tpin = request.args.get('tpin', '')
+        if not (tpin.isdigit() and len(tpin) == 9):
+            return jsonify({'success': False, 'error': 'Invalid TPIN format. Must be 9 digits.'}), 400
+        as_of = request.args.get('as_of')
+        try:
+            as_of = datetime.strptime(as_of, '%Y-%m').date() if as_of else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid as_of format. Use YYYY-MM'}), 400
+        return jsonify({'success': True, **turnover_tracker.registration_status(tpin, as_of)})
+
+    @app.route('/api/vat/threshold-breaches')
+    def vat_threshold_breaches_api():
+        """API endpoint listing unregistered TPINs whose rolling turnover exceeds the VAT threshold"""
+        if not turnover_tracker.registrations_loaded:
+            return jsonify({
+                'success': False,
+                'error': 'VAT registrations are not loaded; set ZRA_VAT_REGISTER_FILE to report breaches'
+            }), 501
+        limit = request.args.get('limit', 100, type=int)
+        breaches = turnover_tracker.breaches()
+        return jsonify({
+            'success': True,
+            'threshold': turnover_tracker.threshold.to_kwacha(),
+            'count': len(breaches),
+            'breaches': breaches[:max(0, limit)]
+        })
+
+    def audit_queue_not_ready():
+        if audit_scheduler.state == 'loading':
+            response = jsonify({'success': False, 'error': 'Audit queue is still loading, please retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        if audit_scheduler.error is not None:
+            return jsonify({'success': False, 'error': 'Audit queue could not be loaded'}), 500
+        if audit_scheduler.state == 'unavailable':
+            return jsonify({'success': False, 'error': 'Audit scheduling is not available with this data source'}), 501
+        return None
+
+    @app.route('/api/penalties', methods=['POST'])
+    def assess_penalties_api():
+        """
+        API endpoint pricing penalties and interest on a batch of liabilities.
+
+        Each liability has tax_type, amount, due_date and, once paid, paid_on;
+        unpaid liabilities are charged up to as_of (default today).
+        """
+        data = request.get_json(silent=True) or {}
+        liabilities = data.get('liabilities')
+        if not isinstance(liabilities, list) or not all(isinstance(row, dict) for row in liabilities):
+            return jsonify({'success': False, 'error': 'liabilities must be a list of objects'}), 400
+        try:
+            as_of = datetime.strptime(data['as_of'], '%Y-%m-%d').date() if data.get('as_of') else None
+            rows, total = assess_batch(liabilities, as_of)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({
+            'success': True,
+            'count': len(rows),
+            'errors': sum(1 for row in rows if row['error']),
+            'total_exposure': f'{to_kwacha(total):.2f}',
+            'liabilities': rows
+        })
+
+    @app.route('/api/audits/plan', methods=['GET', 'POST'])
+    def audit_plan_api():
+        """
+        API endpoint planning the audits of the coming weeks by risk and overdue-ness.
+
+        GET previews the plan. POST schedules it: the planned taxpayers leave
+        the queue until their audit is recorded.
+        """
+        not_ready = audit_queue_not_ready()
+        if not_ready is not None:
+            return not_ready
+        params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        try:
+            week = datetime.strptime(params['week'], '%Y-%m-%d').date() if params.get('week') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid week format. Use YYYY-MM-DD'}), 400
+        try:
+            weeks = min(max(int(params.get('weeks', 1)), 1), 12)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'weeks must be an integer'}), 400
+        centers = params.get('tax_center')
+        if isinstance(centers, str):
+            centers = [center.strip() for center in centers.split(',') if center.strip()]
+        plans = audit_scheduler.plan(week, weeks, centers or None, commit=request.method == 'POST')
+        return jsonify({'success': True, 'scheduled': request.method == 'POST', 'weeks': plans})
+
+    @app.route('/api/audits/<tpin>', methods=['POST'])
+    def record_audit_api(tpin):
+        """API endpoint recording a completed audit; the taxpayer is requeued for the next one"""
+        not_ready = audit_queue_not_ready()
+        if not_ready is not None:
+            return not_ready
+        data = request.get_json(silent=True) or {}
+        try:
+            audit_date = datetime.strptime(data['audit_date'], '%Y-%m-%d').date() if data.get('audit_date') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid audit_date format. Use YYYY-MM-DD'}), 400
+        try:
+            next_due = audit_scheduler.record_audit(tpin, audit_date)
+        except KeyError:
+            return jsonify({'success': False, 'error': f'TPIN {tpin} is not in the audit queue'}), 404
+        return jsonify({'success': True, 'tpin': tpin, 'next_audit_due': next_due.isoformat()})
+
     @app.route('/api/compliance', methods=['POST', 'GET'])
     def check_compliance_api():
         """API endpoint to check taxpayer compliance"""
@@ -137,21 +614,146 @@ try:
                 data = request.get_json() or {}
                 tpin = data.get('tpin', '123456789')
             
-            compliance = check_compliance(tpin)
-            return jsonify({
-                'success': True,
-                'compliance_data': compliance
-            })
+            # Unknown and blacklisted TPINs are turned away before the cached summaries
+            check_registered(tpin)
+            compliance = compliance_engine.get_summary(tpin)
+            if compliance is None:
+                compliance = check_compliance(tpin)
+
+            # Event-driven summaries are good until valid_until, a UTC time
+            max_age, last_modified = TAXPAYER_MAX_AGE, None
+            if 'valid_until' in compliance:
+                remaining = datetime.fromisoformat(compliance['valid_until']) - datetime.utcnow()
+                max_age = min(max_age, remaining.total_seconds())
+                last_modified = datetime.fromisoformat(compliance['last_verified'])
+            peers = peer_comparison(tpin, compliance)
+            return cached_json(
+                {'success': True, 'compliance_data': compliance, 'peer_comparison': peers},
+                ['compliance', tpin, compliance, peers],
+                max_age,
+                last_modified
+            )
+        except TPINNotFoundError as e:
+            return jsonify({'success': False, 'error': str(e)}), 404
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/api/tax-returns', methods=['POST'])
+    def submit_tax_return_api():
+        """
+        API endpoint to submit a tax return.
+
+        Send an Idempotency-Key header to make retries safe: a repeated key
+        returns the original receipt instead of filing twice.
+        """
+        try:
+            data = request.get_json() or {}
+            receipt = submit_tax_return(data, request.headers.get('Idempotency-Key'))
+            return jsonify({'success': True, 'data': receipt}), 200 if receipt['duplicate'] else 201
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    def report_job_response(job):
+        return {
+            **job.to_dict(),
+            'status_url': f'/api/reports/{job.job_id}',
+            'download_url': f'/api/reports/{job.job_id}/download'
+        }
+
+    @app.route('/api/reports', methods=['POST'])
+    def submit_report_api():
+        """API endpoint to queue a printable compliance report (PDF or HTML)"""
+        try:
+            data = request.get_json() or {}
+            job = report_service.submit(data.get('tpin', '123456789'), data.get('format', 'pdf'))
+            return jsonify({'success': True, 'job': report_job_response(job)}), 202
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
 
+    @app.route('/api/reports/<job_id>')
+    def report_status_api(job_id):
+        """API endpoint to poll a report job"""
+        job = report_service.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+        return jsonify({'success': True, 'job': report_job_response(job)})
+
+    @app.route('/api/reports/<job_id>/download')
+    def download_report_api(job_id):
+        """API endpoint to download a rendered report"""
+        job = report_service.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+        if job.status == 'failed':
+            return jsonify({'success': False, 'error': job.error, 'job': report_job_response(job)}), 500
+        if job.status != 'done':
+            return jsonify({'success': True, 'job': report_job_response(job)}), 202
+        return send_file(
+            io.BytesIO(job.document),
+            mimetype=job.media_type,
+            as_attachment=True,
+            download_name=job.filename
+        )
+
+    def job_response(job):
+        return {
+            **job,
+            'status_url': f"/api/jobs/{job['job_id']}",
+            'results_url': f"/api/jobs/{job['job_id']}/results"
+        }
+
+    @app.route('/api/jobs', methods=['POST'])
+    def submit_job_api():
+        """
+        API endpoint to submit a background batch job.
+
+        JSON body: {"type": "verify" | "compliance" | "tax", "items": [...]}
+        where items are TPINs, or {employee_id, income, tax_type} rows for tax.
+        """
+        try:
+            data = request.get_json() or {}
+            items = data.get('items')
+            if not isinstance(items, list):
+                raise ValueError("'items' must be a list")
+            job_id = job_queue.submit(data.get('type', ''), items, data.get('chunk_size'))
+            return jsonify({'success': True, 'job': job_response(job_queue.status(job_id))}), 202
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/api/jobs/<job_id>')
+    def job_status_api(job_id):
+        """API endpoint to poll a background job's status and progress"""
+        job = job_queue.status(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown job'}), 404
+        return jsonify({'success': True, 'job': job_response(job)})
+
+    @app.route('/api/jobs/<job_id>/results')
+    def job_results_api(job_id):
+        """API endpoint to page through a background job's (partial) results"""
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = min(int(request.args.get('limit', 1000)), 10000)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'offset and limit must be integers'}), 400
+        page = job_queue.results(job_id, offset, limit)
+        if page is None:
+            return jsonify({'success': False, 'error': 'Unknown job'}), 404
+        return jsonify({'success': True, **page})
+
     @app.route('/api/health')
     def health_check():
+        registry_filter = get_registry_filter()
         return jsonify({
             'status': 'healthy',
             'service': 'ZRA SDK Web App',
             'features': ['taxpayer_verification', 'tax_calculation', 'compliance_check'],
-            'deployment': 'Render.com'
+            'deployment': 'Render.com',
+            'surge_mode': admission.surge_active(),
+            'admission': admission.snapshot(),
+            'registry_filter': registry_filter.stats() if registry_filter is not None else None
         })
 
     if __name__ == '__main__':
@@ -17,6 +17,13 @@ class ZRADemo {
             this.verifyTaxpayer();
         });
 
+        // Taxpayer name autocomplete
+        document.getElementById('tpin').addEventListener('input', (e) => {
+            clearTimeout(this.suggestTimer);
+            const query = e.target.value;
+            this.suggestTimer = setTimeout(() => this.suggestTaxpayers(query), 150);
+        });
+
         // Tax Calculation
         document.getElementById('taxForm').addEventListener('submit', (e) => {
             e.preventDefault();
@@ -55,6 +62,28 @@ class ZRADemo {
         setTimeout(() => this.verifyTaxpayer(), 300);
     }
 
+    async suggestTaxpayers(query) {
+        const list = document.getElementById('taxpayerSuggestions');
+        if (query.trim().length < 2 || this.validateTPIN(query)) {
+            list.innerHTML = '';
+            return;
+        }
+
+        try {
+            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&limit=8`);
+            const data = await response.json();
+            list.innerHTML = '';
+            (data.results || []).forEach(result => {
+                const option = document.createElement('option');
+                option.value = result.tpin;
+                option.label = `${result.name} - ${result.business_name}`;
+                list.appendChild(option);
+            });
+        } catch (error) {
+            console.warn('Taxpayer search failed', error);
+        }
+    }
+
     async verifyTaxpayer() {
         const tpin = document.getElementById('tpin').value;
         const resultDiv = document.getElementById('verifyResult');